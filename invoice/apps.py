@@ -51,6 +51,51 @@ DEFAULT_CONFIG = {
     # To be specified as "module_name.submodule.function_name"
     "bill_user_filter_function": None,
     "invoice_user_filter_function": None,
+
+    # Fields of objects serialized in subject, thirdparty and line GraphQL fields, by model, e.g.
+    # {"insuree.insuree": ["id", "uuid", "chf_id", "last_name", "other_names"]}. All concrete fields by default.
+    "gql_generic_object_fields": {},
+    # totalCount of invoice, bill and payment connections taken from planner estimates or a short lived cached
+    # count instead of COUNT(*), can be overridden per query with exactCount argument
+    "gql_estimated_total_count": False,
+    # Planner estimates below this number of rows are replaced by the exact count
+    "gql_estimated_total_count_threshold": 10000,
+    # Seconds the count of a filtered queryset is cached for
+    "gql_total_count_cache_ttl": 30,
+
+    # Create invoices/bills from calculation results with a single insert and bulk insert of line items
+    "invoice_bulk_create": True,
+    "bill_bulk_create": True,
+    "bulk_create_batch_size": 500,
+    # Maximum number of invoiced lines of a type held in memory for duplicate checks during invoice generation,
+    # lines of types with more invoiced lines are checked in the database one by one
+    "invoiced_lines_prefetch_limit": 100000,
+
+    # Timeframe invoice generation is split into this many partitions of subjects, each committed independently.
+    # Every partition is generated for the whole timeframe, None generates all subjects at once.
+    "timeframe_invoice_generation_partitions": None,
+    # Minutes without progress after which a running generation run is considered interrupted and can be resumed
+    "timeframe_invoice_generation_run_timeout": 60,
+    # Number of worker processes of generate_timeframe_invoices command, the GraphQL mutation generates chunks
+    # sequentially in the request
+    "timeframe_invoice_generation_workers": 1,
+
+    # Status transitions of payment details, invoices and bills on payment receipt/refund/cancellation are applied
+    # with one UPDATE per collection and bulk inserted history records instead of saving every row
+    "payment_bulk_status_update": True,
+
+    # Number of statement lines written in one transaction by payment statement import
+    "payment_import_chunk_size": 1000,
+    # Number of payments matched to open invoices and bills in one transaction
+    "payment_matching_batch_size": 1000,
+
+    # Daily totals of invoices, bills and payments are kept in tblInvoiceRollup, updated by services changing
+    # the documents, invoiceAggregate and billAggregate read them when filters allow it. Documents written outside
+    # of the services require rebuild_invoice_rollup command to be run
+    "invoice_rollup_enabled": True,
+
+    # Number of rows read from the database and written to the export file at once
+    "export_chunk_size": 5000,
 }
 
 logger = logging.getLogger(__name__)
@@ -95,6 +140,23 @@ class InvoiceConfig(AppConfig, ConfigUtilMixin):
     gql_bill_event_delete_my_message_perms = None
     gql_bill_event_delete_all_message_perms = None
 
+    gql_generic_object_fields = None
+    gql_estimated_total_count = None
+    gql_estimated_total_count_threshold = None
+    gql_total_count_cache_ttl = None
+    invoice_bulk_create = None
+    bill_bulk_create = None
+    bulk_create_batch_size = None
+    invoiced_lines_prefetch_limit = None
+    timeframe_invoice_generation_partitions = None
+    timeframe_invoice_generation_run_timeout = None
+    timeframe_invoice_generation_workers = None
+    payment_bulk_status_update = None
+    payment_import_chunk_size = None
+    payment_matching_batch_size = None
+    invoice_rollup_enabled = None
+    export_chunk_size = None
+
     bill_user_filter = None
     invoice_user_filter = None
 
@@ -0,0 +1,248 @@
+import datetime
+import decimal
+import json
+import logging
+import math
+import tempfile
+import uuid
+from importlib.util import find_spec
+from itertools import islice
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from pandas import DataFrame
+
+from core.models import ExportableQueryModel
+from invoice.apps import InvoiceConfig
+
+logger = logging.getLogger(__name__)
+
+
+class CsvExportWriter:
+    typed_columns = False
+    # Package the writer depends on and the extra of openimis-be-invoice installing it
+    required_package = None
+    extra = None
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.rows = 0
+
+    def write(self, df: DataFrame):
+        # Index continues over chunks, so that the file is the same as a DataFrame.to_csv of all rows
+        df.index = range(self.rows, self.rows + len(df))
+        self.stream.write(df.to_csv(header=self.rows == 0).encode('utf-8'))
+        self.rows += len(df)
+
+    def close(self):
+        pass
+
+
+class XlsxExportWriter:
+    typed_columns = False
+    required_package = 'openpyxl'
+    extra = 'xlsx'
+
+    def __init__(self, stream):
+        from openpyxl import Workbook
+        self.stream = stream
+        # Write-only workbook keeps rows in a temporary file instead of memory
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.header = False
+
+    def write(self, df: DataFrame):
+        if not self.header:
+            self.sheet.append([str(column) for column in df.columns])
+            self.header = True
+        for row in df.itertuples(index=False, name=None):
+            self.sheet.append([self._cell_value(value) for value in row])
+
+    def close(self):
+        self.workbook.save(self.stream)
+
+    @classmethod
+    def _cell_value(cls, value):
+        if value is None or isinstance(value, (str, int, float, decimal.Decimal, datetime.date)):
+            return value
+        return str(value)
+
+
+class ArrowExportWriter:
+    """
+    Columnar export in Arrow IPC file format, every chunk is written as a record batch. Column types follow the model
+    fields: decimals keep their precision and scale, dates and datetimes are temporal columns and UUIDs are
+    UUID columns (16 byte binary with older pyarrow). Columns replaced by export patches or of other fields are
+    exported as strings. Types are fixed with the first chunk.
+    """
+    typed_columns = True
+    required_package = 'pyarrow'
+    extra = 'columnar'
+
+    def __init__(self, stream, fields):
+        import pyarrow
+        self.pa = pyarrow
+        self.stream = stream
+        self.fields = fields
+        self.schema = None
+        self.writer = None
+
+    def write(self, df: DataFrame):
+        if self.schema is None:
+            arrays = [self._first_array(str(column), df[column].tolist()) for column in df.columns]
+            self.schema = self.pa.schema([
+                self.pa.field(str(column), array.type) for column, array in zip(df.columns, arrays)])
+            self.writer = self._open_writer()
+        else:
+            arrays = [self._array(df[column].tolist(), field.type) for column, field in zip(df.columns, self.schema)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def _open_writer(self):
+        return self.pa.ipc.new_file(self.stream, self.schema)
+
+    def _first_array(self, column, values):
+        arrow_type = self._arrow_type(self.fields.get(column))
+        if arrow_type is not None:
+            try:
+                return self._array(values, arrow_type)
+            except (self.pa.ArrowInvalid, self.pa.ArrowTypeError, TypeError, ValueError):
+                # Column changed by an export patch
+                pass
+        return self._array(values, self.pa.string())
+
+    def _array(self, values, arrow_type):
+        values = [None if _is_null(value) else value for value in values]
+        if arrow_type == self.pa.string():
+            values = [value if value is None or isinstance(value, str) else self._string(value) for value in values]
+        elif self.pa.types.is_integer(arrow_type):
+            values = [value if value is None else int(value) for value in values]
+        elif self._is_uuid_type(arrow_type):
+            values = [value if value is None else uuid.UUID(str(value)).bytes for value in values]
+            if arrow_type != self.pa.binary(16):
+                return self.pa.ExtensionArray.from_storage(
+                    arrow_type, self.pa.array(values, type=arrow_type.storage_type))
+        return self.pa.array(values, type=arrow_type)
+
+    def _arrow_type(self, field):
+        pa = self.pa
+        if field is None:
+            return None
+        internal_type = field.get_internal_type()
+        if internal_type == 'DecimalField':
+            return pa.decimal128(field.max_digits, field.decimal_places)
+        if internal_type == 'DateField':
+            return pa.date32()
+        if internal_type == 'DateTimeField':
+            return pa.timestamp('us')
+        if internal_type == 'UUIDField':
+            return pa.uuid() if hasattr(pa, 'uuid') else pa.binary(16)
+        if internal_type in ('IntegerField', 'SmallIntegerField', 'BigIntegerField', 'PositiveIntegerField',
+                             'PositiveSmallIntegerField', 'AutoField', 'BigAutoField'):
+            return pa.int64()
+        if internal_type == 'BooleanField':
+            return pa.bool_()
+        if internal_type == 'FloatField':
+            return pa.float64()
+        return pa.string()
+
+    def _is_uuid_type(self, arrow_type):
+        return arrow_type == self.pa.binary(16) or getattr(arrow_type, 'extension_name', None) == 'arrow.uuid'
+
+    @classmethod
+    def _string(cls, value):
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, cls=DjangoJSONEncoder)
+        return str(value)
+
+
+class ParquetExportWriter(ArrowExportWriter):
+    """
+    Parquet export, every chunk is written as a row group. See ArrowExportWriter for column types.
+    """
+
+    def _open_writer(self):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(self.stream, self.schema)
+
+
+EXPORT_WRITERS = {
+    'csv': CsvExportWriter,
+    'xlsx': XlsxExportWriter,
+    'arrow': ArrowExportWriter,
+    'parquet': ParquetExportWriter,
+}
+
+
+def stream_export(qs, values, user, column_names=None, patches=None, file_format='csv', chunk_size=None):
+    """
+    Export of values of qs rows, the counterpart of ExportableQueryModel.create_csv_export with flat memory usage.
+    Rows are read with a server side cursor in chunks of chunk_size, patches are applied to every chunk separately
+    and every chunk is appended to a temporary file, which is stored as the content of the export.
+    """
+    if file_format not in EXPORT_WRITERS:
+        raise ValueError(f"Unsupported export format {file_format}")
+    writer_class = EXPORT_WRITERS[file_format]
+    if writer_class.required_package and find_spec(writer_class.required_package) is None:
+        raise ImportError(f"Export format {file_format} requires {writer_class.required_package} package, "
+                          f"install openimis-be-invoice[{writer_class.extra}]")
+    column_names = column_names or {}
+    chunk_size = chunk_size or InvoiceConfig.export_chunk_size
+    rows = qs.prefetch_related(None).values_list(*values).iterator(chunk_size=chunk_size)
+    filename = f"{uuid.uuid4()}.{file_format}"
+    fields = {column_names.get(value) or value: _model_field(qs.model, value) for value in values}
+    with tempfile.TemporaryFile() as stream:
+        # Model fields of the columns are passed only to writers typing columns by them
+        writer = writer_class(stream, fields) if writer_class.typed_columns else writer_class(stream)
+        exported = 0
+        for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+            writer.write(_patch_chunk(chunk, values, column_names, patches))
+            exported += len(chunk)
+        if not exported:
+            # Header only
+            writer.write(_patch_chunk([], values, column_names, patches))
+        writer.close()
+        stream.seek(0)
+        export = ExportableQueryModel(
+            name=filename,
+            model=qs.model.__name__,
+            content=File(stream, filename),
+            user=user,
+            sql_query=qs.query.sql_with_params(),
+            file_format=file_format,
+        )
+        export.save()
+    logger.info(f"Exported {exported} {qs.model.__name__} rows to {filename}")
+    return export
+
+
+def _patch_chunk(chunk, values, column_names, patches):
+    content = DataFrame.from_records(chunk, columns=values)
+    for patch in patches or []:
+        content = patch(content)
+    content.columns = [column_names.get(column) or column for column in content.columns]
+    return content
+
+
+def _model_field(model, path):
+    # Field of the values_list path, the referenced field for foreign keys
+    field = None
+    for name in path.split('__'):
+        if model is None:
+            return None
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        model = field.related_model if field.is_relation else None
+    if field is not None and field.many_to_one:
+        return field.target_field
+    return field if field is not None and field.concrete else None
+
+
+def _is_null(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
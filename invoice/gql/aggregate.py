@@ -0,0 +1,66 @@
+from functools import partial
+
+import graphene
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import Trunc
+from graphene_django.filter.utils import get_filterset_class, get_filtering_args_from_filterset
+
+from invoice.gql.gql_types.aggregate_types import AggregatePeriodEnum, GenericInvoiceAggregateGQLType
+from invoice.services.invoiceRollup import InvoiceRollupService
+
+
+class GenericInvoiceAggregateField(graphene.Field):
+    """
+    Sums and counts of invoices or bills grouped by status, currency and optionally a time bucket of date_field.
+    Accepts the filters of the connection of gql_type. The resolver returns the queryset of documents visible to the
+    user, the field applies the filters and aggregates in the database.
+    When only status, currency and date filters are used, totals are read from the rollup of rollup_document_type.
+    Soft deleted documents are never counted, in both cases.
+    """
+
+    def __init__(self, gql_type, date_field, rollup_document_type=None, **kwargs):
+        self.filterset_class = get_filterset_class(
+            None, model=gql_type._meta.model, fields=gql_type._meta.filter_fields)
+        self.date_field = date_field
+        self.rollup_document_type = rollup_document_type
+        kwargs.setdefault('period', AggregatePeriodEnum())
+        super().__init__(
+            graphene.List(GenericInvoiceAggregateGQLType),
+            **get_filtering_args_from_filterset(self.filterset_class, gql_type),
+            **kwargs
+        )
+
+    def get_resolver(self, parent_resolver):
+        return partial(self.aggregate_resolver, super().get_resolver(parent_resolver))
+
+    def aggregate_resolver(self, resolver, root, info, **args):
+        qs = resolver(root, info, **args)
+        if self.rollup_document_type is not None \
+                and InvoiceRollupService.can_aggregate(self.rollup_document_type, args, self.date_field):
+            return InvoiceRollupService.aggregate(self.rollup_document_type, args, self.date_field)
+        filter_kwargs = {k: v for k, v in args.items() if k in self.filterset_class.base_filters}
+        qs = self.filterset_class(data=filter_kwargs, queryset=qs, request=info.context).qs
+        return aggregate_generic_invoices(qs, self.date_field, args.get('period'))
+
+
+AGGREGATE_AMOUNT_FIELDS = ('amount_total', 'amount_net', 'amount_discount')
+
+
+def aggregate_generic_invoices(qs, date_field, period=None):
+    # Same rows as the rollup, which keeps totals of documents that are not deleted
+    qs = qs.filter(is_deleted=False)
+    group_by = ['status', 'currency_code']
+    if period:
+        qs = qs.annotate(period=Trunc(date_field, period, output_field=DateField()))
+        group_by.append('period')
+    # Annotations can't reuse names of model fields, sums are renamed afterwards
+    rows = qs.order_by() \
+        .values(*group_by) \
+        .annotate(aggregate_count=Count('id'),
+                  **{f'aggregate_{field}': Sum(field) for field in AGGREGATE_AMOUNT_FIELDS}) \
+        .order_by(*reversed(group_by))
+    return [_rename_aggregates(row) for row in rows]
+
+
+def _rename_aggregates(row):
+    return {key[len('aggregate_'):] if key.startswith('aggregate_') else key: value for key, value in row.items()}
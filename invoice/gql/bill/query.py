@@ -1,43 +1,20 @@
 import graphene
 from django.contrib.auth.models import AnonymousUser
-from django.contrib.contenttypes.models import ContentType
 from django.db.models import Q
-from pandas import DataFrame
 
-from core.gql.export_mixin import ExportableQueryMixin
-from core.schema import OrderedDjangoFilterConnectionField
 from core.utils import append_validity_filter
 from invoice.apps import InvoiceConfig
+from invoice.gql.aggregate import GenericInvoiceAggregateField
+from invoice.gql.connection_fields import EstimatedCountDjangoFilterConnectionField
+from invoice.gql.export_mixin import StreamingExportQueryMixin
+from invoice.gql.export_patches import patch_subjects
+from invoice.gql.filter_mixin import GenericFilterGQLTypeMixin
 from invoice.gql.gql_types.bill_types import BillGQLType
-from invoice.models import Bill
+from invoice.models import Bill, InvoiceRollup
 import graphene_django_optimizer as gql_optimizer
 
-from policy.models import Policy
 
-
-def patch_subjects(bills_df: DataFrame):
-    subject_df = bills_df[['subject_type', 'subject_id']].drop_duplicates()
-    bills_df['subject_class'] = 'undefined'
-    for subject in subject_df['subject_type'].unique():
-        model = ContentType.objects.get(id=subject).model_class()
-        entities_for_model = subject_df[subject_df['subject_type'] == subject]['subject_id']
-        if model == Policy:
-            subject_names = model.objects \
-                .filter(id__in=entities_for_model) \
-                .values('id', 'family__head_insuree__chf_id',
-                        'family__head_insuree__last_name', 'family__head_insuree__other_names')
-            names = {
-                str(x['id']): F"{x['family__head_insuree__other_names']} {x['family__head_insuree__last_name']} ({x['family__head_insuree__chf_id']})"
-                for x in subject_names
-            }
-            updated = bills_df['subject_type'] == subject
-            bills_df.loc[updated, 'subject_id'] = bills_df[updated]['subject_id'].apply(lambda x: names[x])
-        bills_df.loc[bills_df['subject_type'] == subject, 'subject_class'] = model.__name__
-        bills_df['subject_type'] = bills_df.pop('subject_class')
-    return bills_df
-
-
-class BillQueryMixin(ExportableQueryMixin):
+class BillQueryMixin(StreamingExportQueryMixin):
     export_patches = {
         'bill': [
             patch_subjects
@@ -45,7 +22,7 @@ class BillQueryMixin(ExportableQueryMixin):
     }
 
     exportable_fields = ['bill']
-    bill = OrderedDjangoFilterConnectionField(
+    bill = EstimatedCountDjangoFilterConnectionField(
         BillGQLType,
         orderBy=graphene.List(of_type=graphene.String),
         dateValidFrom__Gte=graphene.DateTime(),
@@ -54,16 +31,36 @@ class BillQueryMixin(ExportableQueryMixin):
         client_mutation_id=graphene.String(),
         subject_type_filter=graphene.String(),
         thirdparty_type_filter=graphene.String(),
+        search=graphene.String(),
+        search_prefix=graphene.String(),
+    )
+    bill_aggregate = GenericInvoiceAggregateField(
+        BillGQLType,
+        'date_bill',
+        rollup_document_type=InvoiceRollup.DocumentType.BILL,
+        dateValidFrom__Gte=graphene.DateTime(),
+        dateValidTo__Lte=graphene.DateTime(),
+        applyDefaultValidityFilter=graphene.Boolean(),
+        subject_type_filter=graphene.String(),
+        thirdparty_type_filter=graphene.String(),
     )
 
     def resolve_bill(self, info, **kwargs):
         BillQueryMixin._check_permissions(info.context.user)
+        return gql_optimizer.query(BillQueryMixin._get_bill_queryset(info, **kwargs), info)
+
+    def resolve_bill_aggregate(self, info, **kwargs):
+        BillQueryMixin._check_permissions(info.context.user)
+        return Bill.get_queryset(BillQueryMixin._get_bill_queryset(info, **kwargs), info)
+
+    @staticmethod
+    def _get_bill_queryset(info, **kwargs):
         filters = []
         filters += append_validity_filter(**kwargs)
 
         client_mutation_id = kwargs.get("client_mutation_id", None)
         if client_mutation_id:
-            filters.append(Q(mutations__mutation__client_mutation_id=client_mutation_id))
+            filters.append(GenericFilterGQLTypeMixin.get_client_mutation_filter(Bill, client_mutation_id))
 
         subject_type = kwargs.pop("subject_type_filter", None)
         if subject_type:
@@ -73,11 +70,20 @@ class BillQueryMixin(ExportableQueryMixin):
         if thirdparty_type:
             filters.append(Q(thirdparty_type__model=thirdparty_type))
 
+        search = kwargs.get("search", None)
+        if search:
+            filters.append(GenericFilterGQLTypeMixin.get_search_filter(
+                search, GenericFilterGQLTypeMixin.SEARCH_FIELDS_INVOICE))
+
+        search_prefix = kwargs.get("search_prefix", None)
+        if search_prefix:
+            filters.append(GenericFilterGQLTypeMixin.get_search_filter(
+                search_prefix, GenericFilterGQLTypeMixin.SEARCH_FIELDS_INVOICE, lookup='istartswith'))
+
         qs = Bill.objects.filter(*filters)
         if InvoiceConfig.bill_user_filter:
             qs = InvoiceConfig.bill_user_filter(qs, info.context.user)
-
-        return gql_optimizer.query(qs, info)
+        return qs
 
     @staticmethod
     def _check_permissions(user):
@@ -1,10 +1,10 @@
 import graphene
 from django.contrib.auth.models import AnonymousUser
-from django.db.models import Q
 
 from core.schema import OrderedDjangoFilterConnectionField
 from core.utils import append_validity_filter
 from invoice.apps import InvoiceConfig
+from invoice.gql.filter_mixin import GenericFilterGQLTypeMixin
 from invoice.gql.gql_types.bill_types import BillPaymentGQLType
 from invoice.models import BillPayment, Bill
 import graphene_django_optimizer as gql_optimizer
@@ -26,7 +26,7 @@ class BillPaymentQueryMixin:
 
         client_mutation_id = kwargs.get("client_mutation_id", None)
         if client_mutation_id:
-            filters.append(Q(mutations__mutation__client_mutation_id=client_mutation_id))
+            filters.append(GenericFilterGQLTypeMixin.get_client_mutation_filter(BillPayment, client_mutation_id))
 
         bill_payment_qs = BillPayment.objects.filter(*filters)
 
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import uuid
+
+import graphene
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from graphene_django.utils import maybe_queryset
+from graphql_relay import from_global_id
+from graphql_relay.connection.arrayconnection import get_offset_with_default
+
+from core.schema import OrderedDjangoFilterConnectionField
+from invoice.apps import InvoiceConfig
+
+
+class KeysetDjangoFilterConnectionField(OrderedDjangoFilterConnectionField):
+    """
+    OrderedDjangoFilterConnectionField with keyset (seek) pagination. With keysetAfter set to the id of the last
+    node of the previous page, the next page starts right after that node by filtering on the ordering columns
+    instead of skipping rows with an offset, so that deep pages cost the same as the first one. The default ordering
+    is served by (date_created, id) indexes of invoices, bills and payments.
+    Keyset mode is enabled by keysetAfter or by keyset for the first page. In keyset mode ordering ends with the
+    primary key to make it total, without orderBy it is (-date_created, -id), and empty values are ordered as the
+    greatest ones. Without keyset mode the ordering of the connection isn't changed.
+    """
+    DEFAULT_ORDERING = ('-date_created',)
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('keyset', graphene.Boolean())
+        kwargs.setdefault('keysetAfter', graphene.String())
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        qs = super().resolve_queryset(connection, iterable, info, args, filtering_args, filterset_class)
+        if not args.get('keyset') and not args.get('keysetAfter'):
+            return qs
+        ordering = cls._keyset_ordering(qs)
+        if ordering is None:
+            # Random or expression based ordering, only offset pagination is possible
+            raise ValueError("keyset pagination can be used only with ordering by model fields")
+        # Empty values are the greatest, as in PostgreSQL indexes, so that indexes serve both directions
+        qs = qs.order_by(*(
+            F(field).desc(nulls_first=True) if descending else F(field).asc(nulls_last=True)
+            for field, descending in ordering
+        ))
+        if args.get('keysetAfter'):
+            if args.get('after') or args.get('offset'):
+                raise ValueError("keysetAfter can't be combined with after or offset")
+            qs = cls._seek(qs, ordering, cls._decode_keyset_after(args['keysetAfter']))
+        return qs
+
+    @classmethod
+    def _keyset_ordering(cls, qs):
+        order_by = qs.query.order_by or qs.model._meta.ordering or cls.DEFAULT_ORDERING
+        if not all(isinstance(field, str) and field != '?' for field in order_by):
+            return None
+        ordering = [(field.lstrip('-'), field.startswith('-')) for field in order_by]
+        for field, _ in ordering:
+            # The anchor node is read from the model, annotations and related lookups aren't available there
+            if not cls._is_model_field(qs.model, field):
+                raise ValueError(f"keyset pagination can't be ordered by {field}, "
+                                 f"only by fields of {qs.model.__name__}")
+        pk_name = qs.model._meta.pk.name
+        if not any(field in (pk_name, 'pk') for field, _ in ordering):
+            ordering.append((pk_name, ordering[-1][1]))
+        return ordering
+
+    @classmethod
+    def _is_model_field(cls, model, name):
+        if name == 'pk':
+            return True
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        return field.concrete and not field.is_relation
+
+    @classmethod
+    def _seek(cls, qs, ordering, after_id):
+        anchor = qs.model.objects.filter(pk=after_id).values(*(field for field, _ in ordering)).first()
+        if anchor is None:
+            raise ValueError(f"keysetAfter {after_id} not found")
+        # (f1, f2, ...) > (v1, v2, ...) expanded as f1 > v1 OR (f1 = v1 AND f2 > v2) OR ...
+        seek = Q(pk__in=[])
+        equal = Q()
+        for field, descending in ordering:
+            value = anchor[field]
+            after = cls._after(field, descending, value)
+            if after is not None:
+                seek |= equal & after
+            equal &= Q(**{f"{field}__isnull": True}) if value is None else Q(**{field: value})
+        return qs.filter(seek)
+
+    @classmethod
+    def _after(cls, field, descending, value):
+        # Rows ordered after value in the field, empty values are greater than any value
+        if value is None:
+            return None if not descending else Q(**{f"{field}__isnull": False})
+        if descending:
+            return Q(**{f"{field}__lt": value})
+        return Q(**{f"{field}__gt": value}) | Q(**{f"{field}__isnull": True})
+
+    @classmethod
+    def _decode_keyset_after(cls, keyset_after):
+        # Plain uuid or relay node id of the node are accepted
+        try:
+            return uuid.UUID(keyset_after)
+        except ValueError:
+            pass
+        try:
+            _, node_id = from_global_id(keyset_after)
+        except Exception:
+            node_id = None
+        if not node_id:
+            raise ValueError(f"Invalid keysetAfter: {keyset_after}")
+        return node_id
+
+
+class EstimatedCountDjangoFilterConnectionField(KeysetDjangoFilterConnectionField):
+    """
+    KeysetDjangoFilterConnectionField with estimated totalCount. Instead of an exact COUNT(*) over the filtered
+    queryset the total is taken from the PostgreSQL planner estimate, or from a count cached for
+    gql_total_count_cache_ttl seconds and keyed by the SQL of the filtered queryset. Estimates below
+    gql_estimated_total_count_threshold are replaced by the (cached) exact count, as planner estimates of small
+    results are unreliable.
+    Estimation is enabled by gql_estimated_total_count, exactCount argument overrides it for a single query.
+    The page is counted with one row over its size, so that hasNextPage stays exact. Backward pagination (last,
+    before) needs the exact total and always counts.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('exactCount', graphene.Boolean())
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None, user=None):
+        iterable = maybe_queryset(iterable)
+        first = args.get('first') or max_limit
+        if not cls._exact_count(args) and first and not args.get('last') and not args.get('before') \
+                and isinstance(iterable, QuerySet):
+            iterable = cls._with_estimated_count(iterable, args, first)
+        return super().resolve_connection(connection, args, iterable, max_limit, user=user)
+
+    @classmethod
+    def _with_estimated_count(cls, qs, args, first):
+        start = get_offset_with_default(args.get('after'), -1) + 1 + (args.get('offset') or 0)
+        # Bounded count of the page and one row after it, the row over the page size keeps hasNextPage exact
+        rows = qs[start:start + first + 1].count()
+        if rows > first:
+            length = max(cls._estimated_count(qs), start + rows)
+        else:
+            # Last page, the total is known
+            length = start + rows
+        # Only the count of the resolved queryset is replaced, paging is left to the parent connection field
+        qs = qs.all()
+        qs.count = lambda: length
+        return qs
+
+    @classmethod
+    def _exact_count(cls, args):
+        exact_count = args.get('exactCount')
+        if exact_count is None:
+            return not InvoiceConfig.gql_estimated_total_count
+        return exact_count
+
+    @classmethod
+    def _estimated_count(cls, qs):
+        qs = qs.order_by()
+        if connections[qs.db].vendor == 'postgresql':
+            estimate = cls._planner_estimate(qs)
+            if estimate >= InvoiceConfig.gql_estimated_total_count_threshold:
+                return estimate
+        return cls._cached_count(qs)
+
+    @classmethod
+    def _planner_estimate(cls, qs):
+        sql, params = qs.query.sql_with_params()
+        with connections[qs.db].cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    @classmethod
+    def _cached_count(cls, qs):
+        sql, params = qs.query.sql_with_params()
+        key = hashlib.sha256(f"{qs.db}:{sql}:{params}".encode()).hexdigest()
+        return cache.get_or_set(f"invoice_gql_count_{key}", qs.count, InvoiceConfig.gql_total_count_cache_ttl)
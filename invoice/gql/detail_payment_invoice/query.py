@@ -2,17 +2,17 @@ import graphene
 import graphene_django_optimizer as gql_optimizer
 
 from django.contrib.auth.models import AnonymousUser
-from django.db.models import Q
 
-from core.schema import OrderedDjangoFilterConnectionField
 from core.utils import append_validity_filter
 from invoice.apps import InvoiceConfig
+from invoice.gql.connection_fields import EstimatedCountDjangoFilterConnectionField
+from invoice.gql.filter_mixin import GenericFilterGQLTypeMixin
 from invoice.gql.gql_types.payment_types import DetailPaymentInvoiceGQLType
 from invoice.models import DetailPaymentInvoice
 
 
 class DetailPaymentInvoiceQueryMixin:
-    detail_payment_invoice = OrderedDjangoFilterConnectionField(
+    detail_payment_invoice = EstimatedCountDjangoFilterConnectionField(
         DetailPaymentInvoiceGQLType,
         orderBy=graphene.List(of_type=graphene.String),
         dateValidFrom__Gte=graphene.DateTime(),
@@ -27,7 +27,7 @@ class DetailPaymentInvoiceQueryMixin:
 
         client_mutation_id = kwargs.get("client_mutation_id", None)
         if client_mutation_id:
-            filters.append(Q(mutations__mutation__client_mutation_id=client_mutation_id))
+            filters.append(GenericFilterGQLTypeMixin.get_client_mutation_filter(DetailPaymentInvoice, client_mutation_id))
 
         DetailPaymentInvoiceQueryMixin._check_permissions(info.context.user)
         return gql_optimizer.query(DetailPaymentInvoice.objects.filter(*filters).all(), info)
@@ -0,0 +1,65 @@
+import json
+import types
+
+from core.custom_filters import CustomFilterWizardStorage
+from core.gql.export_mixin import ExportableQueryMixin
+from invoice.exports import stream_export
+
+
+class StreamingExportQueryMixin(ExportableQueryMixin):
+    """
+    ExportableQueryMixin writing exports with invoice.exports.stream_export, export patches are applied per chunk
+    of rows and the file is written incrementally instead of from a DataFrame of the whole queryset.
+    The exporter of ExportableQueryMixin writes the file with ExportableQueryModel.create_csv_export and has no hook
+    for the writer, so the export resolver is created here. It relies only on the public interface of the mixin.
+    """
+
+    @classmethod
+    def create_export_function(cls, field_name):
+        new_function_name = f"resolve_{field_name}_export"
+        default_resolve = getattr(cls, f"resolve_{field_name}", None)
+
+        if not default_resolve:
+            raise AttributeError(
+                f"Query {cls} doesn't provide resolve function for {field_name}. "
+                f"Export cannot be created"
+            )
+
+        def exporter(cls, self, info, **kwargs):
+            custom_filters = kwargs.pop("customFilters", None)
+            export_fields = [cls._adjust_notation(f) for f in kwargs.pop("fields")]
+            fields_mapping = json.loads(kwargs.pop("fields_columns"))
+            file_format = kwargs.pop("file_format", None) or "csv"
+
+            source_field = getattr(cls, field_name)
+            filter_kwargs = {
+                k: v for k, v in kwargs.items() if k in source_field.filtering_args
+            }
+
+            qs = default_resolve(None, info, **kwargs)
+            qs = qs.filter(**filter_kwargs)
+            qs = cls.append_export_custom_filters(custom_filters, qs)
+            export_file = stream_export(
+                qs,
+                export_fields,
+                info.context.user,
+                column_names=fields_mapping,
+                patches=cls.get_patches_for_field(field_name),
+                file_format=file_format,
+            )
+
+            return export_file.name
+
+        setattr(cls, new_function_name, types.MethodType(exporter, cls))
+
+    @classmethod
+    def append_export_custom_filters(cls, custom_filters, queryset):
+        if not custom_filters:
+            return queryset
+        return CustomFilterWizardStorage.build_custom_filters_queryset(
+            cls.get_module_name(),
+            cls.get_object_type(),
+            custom_filters,
+            queryset,
+            relation=cls.get_related_field(),
+        )
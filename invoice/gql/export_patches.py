@@ -0,0 +1,55 @@
+from django.contrib.contenttypes.models import ContentType
+from pandas import DataFrame
+
+# Labels of exported subjects by "app_label.model_name", values of the fields are formatted with the pattern.
+# Subjects of other types with a code field are labelled with the code.
+SUBJECT_LABELS = {
+    'policy.policy': (
+        ('family__head_insuree__other_names', 'family__head_insuree__last_name', 'family__head_insuree__chf_id'),
+        '{} {} ({})'
+    ),
+    'insuree.family': (('head_insuree__other_names', 'head_insuree__last_name', 'head_insuree__chf_id'), '{} {} ({})'),
+    'insuree.insuree': (('other_names', 'last_name', 'chf_id'), '{} {} ({})'),
+    'contract.contract': (('code',), '{}'),
+    'policyholder.policyholder': (('code', 'trade_name'), '{} {}'),
+    'claim_batch.batchrun': (('location__name', 'run_date'), '{} {}'),
+}
+
+
+def patch_subjects(df: DataFrame):
+    """
+    Replaces subject ids with labels of the subjects and subject content type ids with model names. Labels are
+    fetched with one query per subject type and joined to the rows with a single merge.
+    """
+    if 'subject_type' not in df.columns:
+        return df
+    subject_types = df['subject_type'].dropna().unique()
+    models = {type_id: ContentType.objects.get_for_id(int(type_id)).model_class() for type_id in subject_types}
+
+    if 'subject_id' in df.columns:
+        labels = [
+            (type_id, subject_id, label)
+            for type_id, model in models.items() if model is not None
+            for subject_id, label in _subject_labels(model, df.loc[df['subject_type'] == type_id, 'subject_id'])
+        ]
+        if labels:
+            labels_df = DataFrame(labels, columns=['subject_type', 'subject_id', 'subject_label'])
+            df = df.merge(labels_df, on=['subject_type', 'subject_id'], how='left')
+            df['subject_id'] = df.pop('subject_label').fillna(df['subject_id'])
+
+    class_names = {type_id: model.__name__ for type_id, model in models.items() if model is not None}
+    df['subject_type'] = df['subject_type'].map(class_names).fillna('undefined')
+    return df
+
+
+def _subject_labels(model, subject_ids):
+    fields, pattern = SUBJECT_LABELS.get(model._meta.label_lower, (None, None))
+    if fields is None:
+        if not any(field.name == 'code' for field in model._meta.concrete_fields):
+            return []
+        fields, pattern = ('code',), '{}'
+    ids = subject_ids.dropna().unique().tolist()
+    return [
+        (str(row[0]), pattern.format(*row[1:]))
+        for row in model.objects.filter(pk__in=ids).values_list('pk', *fields)
+    ]
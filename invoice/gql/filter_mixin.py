@@ -1,5 +1,42 @@
 
+from django.db.models import Q
+
+from core.models import MutationLog
+
+
 class GenericFilterGQLTypeMixin:
+    # Fields matched by the search and searchPrefix arguments, they have text search indexes (see migration 0017)
+    SEARCH_FIELDS_INVOICE = ('code', 'code_ext', 'code_tp', 'payment_reference', 'note')
+    SEARCH_FIELDS_PAYMENT_INVOICE = ('code_ext', 'code_tp', 'payer_ref', 'payer_name')
+
+    @classmethod
+    def get_search_filter(cls, search, fields, lookup='icontains'):
+        """
+        Q matching rows containing search in any of fields, or starting with it for lookup istartswith.
+        With pg_trgm the trigram index of every field answers both lookups and PostgreSQL combines them with
+        a bitmap OR, instead of scanning the table. Without trigram indexes only istartswith is answered from
+        the prefix indexes (see migration 0017).
+        """
+        search_filter = Q()
+        for field in fields:
+            search_filter |= Q(**{f"{field}__{lookup}": search})
+        return search_filter
+
+    @classmethod
+    def get_client_mutation_filter(cls, model, client_mutation_id):
+        """
+        Q matching rows of model linked to the mutation with client_mutation_id. Ids of the mutation logs and of the
+        linked rows are read from the client_mutation_id and mutation_id indexes, so that the queried table isn't
+        joined with the link table and MutationLog.
+        """
+        link = model._meta.get_field('mutations')
+        mutation_ids = list(MutationLog.objects
+                            .filter(client_mutation_id=client_mutation_id)
+                            .values_list('id', flat=True))
+        linked_ids = link.related_model.objects \
+            .filter(mutation_id__in=mutation_ids) \
+            .values_list(link.field.attname, flat=True)
+        return Q(id__in=list(linked_ids))
 
     @classmethod
     def get_base_filters_invoice(cls):
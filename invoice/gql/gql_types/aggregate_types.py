@@ -0,0 +1,20 @@
+import graphene
+
+
+class AggregatePeriodEnum(graphene.Enum):
+    DAY = 'day'
+    WEEK = 'week'
+    MONTH = 'month'
+    QUARTER = 'quarter'
+    YEAR = 'year'
+
+
+class GenericInvoiceAggregateGQLType(graphene.ObjectType):
+    status = graphene.Int()
+    currency_code = graphene.String()
+    # First day of the time bucket, empty when aggregated without period
+    period = graphene.Date()
+    count = graphene.Int()
+    amount_total = graphene.Decimal()
+    amount_net = graphene.Decimal()
+    amount_discount = graphene.Decimal()
@@ -1,14 +1,14 @@
 import graphene
 import json
+from django.contrib.contenttypes.models import ContentType
 from django.core.serializers.json import DjangoJSONEncoder
 from graphene_django import DjangoObjectType
 
 from core import prefix_filterset, ExtendedConnection
 from invoice.gql.filter_mixin import GenericFilterGQLTypeMixin
+from invoice.gql.loaders import load_generic_object, serialize_generic_object, get_loader, LocationLoader
 from invoice.models import Bill, \
     BillItem, BillEvent, BillPayment
-from invoice.utils import underscore_to_camel
-from location.models import Location
 
 
 class BillGQLType(DjangoObjectType, GenericFilterGQLTypeMixin):
@@ -20,46 +20,41 @@ class BillGQLType(DjangoObjectType, GenericFilterGQLTypeMixin):
     thirdparty_type_name = graphene.String()
 
     def resolve_subject_type(root, info):
-        if root.subject_type:
-            return root.subject_type.id
+        return root.subject_type_id
 
     def resolve_subject_type_name(root, info):
-        if root.subject_type:
-            return root.subject_type.name
+        if root.subject_type_id:
+            return ContentType.objects.get_for_id(root.subject_type_id).name
 
     def resolve_thirdparty_type(root, info):
-        if root.thirdparty_type:
-            return root.thirdparty_type.id
+        return root.thirdparty_type_id
 
     def resolve_thirdparty_type_name(root, info):
-        if root.thirdparty_type:
-            return root.thirdparty_type.name
+        if root.thirdparty_type_id:
+            return ContentType.objects.get_for_id(root.thirdparty_type_id).name
 
     def resolve_subject(root, info):
-        if root.subject:
-            subject_object_dict = root.subject.__dict__
-            subject_object_dict.pop('_state', None)
-            subject_object_dict = {
-                underscore_to_camel(k): v for k, v in list(subject_object_dict.items())
-            }
-            if root.subject_type.name == "batch run" and subject_object_dict.get('locationId', None):
-                location = Location.objects.filter(id=subject_object_dict['locationId'], validity_to__isnull=True)
-                location = location.values('code', 'name')
-                subject_object_dict['location'] = {
-                    underscore_to_camel(k): v for k, v in location.first().items()
-                }
-            subject_object_dict = json.dumps(subject_object_dict, cls=DjangoJSONEncoder)
-            return subject_object_dict
+        return load_generic_object(info, root.subject_type_id, root.subject_id).then(
+            lambda subject: BillGQLType._serialize_subject(info, root, subject)
+        )
 
     def resolve_thirdparty(root, info):
-        if root.thirdparty:
-            thirdparty_object_dict = root.thirdparty.__dict__
-            thirdparty_object_dict.pop('_state', None)
-            thirdparty_object_dict = {
-                underscore_to_camel(k): v for k, v in list(thirdparty_object_dict.items())
-            }
-            thirdparty_object_dict = json.dumps(thirdparty_object_dict, cls=DjangoJSONEncoder)
-            return thirdparty_object_dict
+        return load_generic_object(info, root.thirdparty_type_id, root.thirdparty_id).then(serialize_generic_object)
+
+    @staticmethod
+    def _serialize_subject(info, root, subject):
+        if not subject:
+            return None
+        # Loaded projection is shared by all rows with the same subject, enrichment is added to a copy
+        subject_object_dict = dict(subject)
+        if ContentType.objects.get_for_id(root.subject_type_id).name == "batch run" \
+                and subject_object_dict.get('locationId', None):
+            # Locations of all batch run subjects of the page are fetched with a single query
+            def add_location(location):
+                subject_object_dict['location'] = location
+                return json.dumps(subject_object_dict, cls=DjangoJSONEncoder)
+            return get_loader(info, LocationLoader).load(subject_object_dict['locationId']).then(add_location)
+        return json.dumps(subject_object_dict, cls=DjangoJSONEncoder)
 
     class Meta:
         model = Bill
@@ -82,24 +77,14 @@ class BillItemGQLType(DjangoObjectType, GenericFilterGQLTypeMixin):
     line = graphene.JSONString()
 
     def resolve_line_type(root, info):
-        if root.line_type:
-            return root.line_type.id
+        return root.line_type_id
 
     def resolve_line_type_name(root, info):
-        if root.line_type:
-            return root.line_type.name
+        if root.line_type_id:
+            return ContentType.objects.get_for_id(root.line_type_id).name
 
     def resolve_line(root, info):
-        if root.line:
-            line_object_dict = root.line.__dict__
-            line_object_dict.pop('_state', None)
-            key_values = list(line_object_dict.items())
-            line_object_dict.clear()
-            for k, v in key_values:
-                new_key = underscore_to_camel(k)
-                line_object_dict[new_key] = v
-            line_object_dict = json.dumps(line_object_dict, cls=DjangoJSONEncoder)
-            return line_object_dict
+        return load_generic_object(info, root.line_type_id, root.line_id).then(serialize_generic_object)
 
     class Meta:
         model = BillItem
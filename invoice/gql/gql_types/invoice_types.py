@@ -1,14 +1,14 @@
 import graphene
 import json
+from django.contrib.contenttypes.models import ContentType
 from django.core.serializers.json import DjangoJSONEncoder
 from graphene_django import DjangoObjectType
 
 from core import prefix_filterset, ExtendedConnection
-from insuree.models import Insuree
 from invoice.gql.filter_mixin import GenericFilterGQLTypeMixin
+from invoice.gql.loaders import load_generic_object, serialize_generic_object, get_loader, HeadInsureeLoader
 from invoice.models import Invoice, InvoiceLineItem, InvoicePayment, InvoiceEvent, InvoiceMutation, \
     InvoicePaymentMutation, InvoiceLineItemMutation, InvoiceEventMutation
-from invoice.utils import underscore_to_camel
 
 
 class InvoiceGQLType(DjangoObjectType, GenericFilterGQLTypeMixin):
@@ -20,47 +20,42 @@ class InvoiceGQLType(DjangoObjectType, GenericFilterGQLTypeMixin):
     thirdparty_type_name = graphene.String()
 
     def resolve_subject_type(root, info):
-        if root.subject_type:
-            return root.subject_type.id
+        return root.subject_type_id
 
     def resolve_subject_type_name(root, info):
-        if root.subject_type:
-            return root.subject_type.name
+        if root.subject_type_id:
+            return ContentType.objects.get_for_id(root.subject_type_id).name
 
     def resolve_thirdparty_type(root, info):
-        if root.thirdparty_type:
-            return root.thirdparty_type.id
+        return root.thirdparty_type_id
 
     def resolve_thirdparty_type_name(root, info):
-        if root.thirdparty_type:
-            return root.thirdparty_type.name
+        if root.thirdparty_type_id:
+            return ContentType.objects.get_for_id(root.thirdparty_type_id).name
 
     def resolve_subject(root, info):
-        if root.subject:
-            subject_object_dict = root.subject.__dict__
-            subject_object_dict.pop('_state', None)
-            subject_object_dict = {
-                underscore_to_camel(k): v for k, v in list(subject_object_dict.items())
-            }
-            if root.subject_type.name == "family":
-                insuree = Insuree.objects.filter(id=subject_object_dict['headInsureeId'], validity_to__isnull=True)
-                insuree = insuree.values('id', 'chf_id', 'uuid', 'last_name', 'other_names')
-                subject_object_dict['headInsuree'] = {
-                    underscore_to_camel(k): v for k, v in insuree.first().items()
-                }
-            subject_object_dict = json.dumps(subject_object_dict, cls=DjangoJSONEncoder)
-            return subject_object_dict
+        return load_generic_object(info, root.subject_type_id, root.subject_id).then(
+            lambda subject: InvoiceGQLType._serialize_subject(info, root, subject)
+        )
 
     def resolve_thirdparty(root, info):
-        if root.thirdparty:
-            thirdparty_object_dict = root.thirdparty.__dict__
-
-            thirdparty_object_dict.pop('_state', None)
-            thirdparty_object_dict = {
-                underscore_to_camel(k): v for k, v in list(thirdparty_object_dict.items())
-            }
-            thirdparty_object_dict = json.dumps(thirdparty_object_dict, cls=DjangoJSONEncoder)
-            return thirdparty_object_dict
+        return load_generic_object(info, root.thirdparty_type_id, root.thirdparty_id).then(serialize_generic_object)
+
+    @staticmethod
+    def _serialize_subject(info, root, subject):
+        if not subject:
+            return None
+        # Loaded projection is shared by all rows with the same subject, enrichment is added to a copy
+        subject_object_dict = dict(subject)
+        if ContentType.objects.get_for_id(root.subject_type_id).name == "family" \
+                and subject_object_dict.get('headInsureeId', None):
+            # Head insurees of all family subjects of the page are fetched with a single query
+            def add_head_insuree(insuree):
+                subject_object_dict['headInsuree'] = insuree
+                return json.dumps(subject_object_dict, cls=DjangoJSONEncoder)
+            head_insuree_id = subject_object_dict['headInsureeId']
+            return get_loader(info, HeadInsureeLoader).load(head_insuree_id).then(add_head_insuree)
+        return json.dumps(subject_object_dict, cls=DjangoJSONEncoder)
 
     class Meta:
         model = Invoice
@@ -83,24 +78,14 @@ class InvoiceLineItemGQLType(DjangoObjectType, GenericFilterGQLTypeMixin):
     line_type_name = graphene.String()
 
     def resolve_line_type(root, info):
-        if root.line_type:
-            return root.line_type.id
+        return root.line_type_id
 
     def resolve_line_type_name(root, info):
-        if root.line_type:
-            return root.line_type.name
+        if root.line_type_id:
+            return ContentType.objects.get_for_id(root.line_type_id).name
 
     def resolve_line(root, info):
-        if root.line:
-            line_object_dict = root.line.__dict__
-            line_object_dict.pop('_state', None)
-            key_values = list(line_object_dict.items())
-            line_object_dict.clear()
-            for k, v in key_values:
-                new_key = underscore_to_camel(k)
-                line_object_dict[new_key] = v
-            line_object_dict = json.dumps(line_object_dict, cls=DjangoJSONEncoder)
-            return line_object_dict
+        return load_generic_object(info, root.line_type_id, root.line_id).then(serialize_generic_object)
 
     class Meta:
         model = InvoiceLineItem
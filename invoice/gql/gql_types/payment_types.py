@@ -1,14 +1,13 @@
-import json
 import graphene
 
-from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.contenttypes.models import ContentType
 from graphene_django import DjangoObjectType
 
 from core import prefix_filterset, ExtendedConnection
 from invoice.apps import InvoiceConfig
 from invoice.gql.filter_mixin import GenericFilterGQLTypeMixin
+from invoice.gql.loaders import load_generic_object, serialize_generic_object
 from invoice.models import PaymentInvoice, DetailPaymentInvoice
-from invoice.utils import underscore_to_camel
 from django.utils.translation import gettext as _
 from django.core.exceptions import PermissionDenied
 
@@ -35,25 +34,20 @@ class DetailPaymentInvoiceGQLType(DjangoObjectType, GenericFilterGQLTypeMixin):
     def resolve_subject_type(root, info):
         if not info.context.user.has_perms(InvoiceConfig.gql_invoice_payment_search_perms):
             raise PermissionDenied(_("unauthorized"))
-        return root.subject_type.id
+        return root.subject_type_id
 
     subject_type_name = graphene.String()
     def resolve_subject_type_name(root, info):
         if not info.context.user.has_perms(InvoiceConfig.gql_invoice_payment_search_perms):
             raise PermissionDenied(_("unauthorized"))
-        return root.subject_type.name
+        if root.subject_type_id:
+            return ContentType.objects.get_for_id(root.subject_type_id).name
 
     subject = graphene.JSONString()
     def resolve_subject(root, info):
         if not info.context.user.has_perms(InvoiceConfig.gql_invoice_payment_search_perms):
             raise PermissionDenied(_("unauthorized"))
-        subject_object_dict = root.subject.__dict__
-        subject_object_dict.pop('_state', None)
-        subject_object_dict = {
-            underscore_to_camel(k): v for k, v in list(subject_object_dict.items())
-        }
-        subject_object_dict = json.dumps(subject_object_dict, cls=DjangoJSONEncoder)
-        return subject_object_dict
+        return load_generic_object(info, root.subject_type_id, root.subject_id).then(serialize_generic_object)
 
     class Meta:
         model = DetailPaymentInvoice
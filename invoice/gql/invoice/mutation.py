@@ -9,8 +9,8 @@ from policy.apps import PolicyConfig
 from core.gql.gql_mutations.base_mutation import BaseMutation, BaseHistoryModelDeleteMutationMixin
 from core.schema import OpenIMISMutation
 from invoice.apps import InvoiceConfig
-from invoice.models import Invoice
-from invoice.services import InvoiceService
+from invoice.models import Invoice, InvoiceGenerationRun
+from invoice.services import InvoiceService, InvoiceGenerationService
 
 logger = logging.getLogger(__name__)
 
@@ -64,11 +64,16 @@ class GenerateTimeframeInvoices(BaseMutation):
         try:
             # invoice_creation_from_calculation doesn't have implementation,
             # it sends a signal, if a binded function throws an exception it's message is returned.
-            service = cls._invoice_service_class(user)
-            service.invoice_creation_from_calculation(user=user, from_date=from_date, to_date=to_date)
+            # Subjects are processed in partitions, a failed run is resumed by the next request for the same timeframe.
+            service = InvoiceGenerationService(user, invoice_service_class=cls._invoice_service_class)
+            run = service.generate(from_date, to_date)
+        except ValidationError as e:
+            return "; ".join(e.messages)
         except Exception as e:
             logger.exception(F"Exception occurred during invoice generation. Details: {e}")
             return str(e)
+        if run.status == InvoiceGenerationRun.Status.FAILED:
+            return "; ".join(error['error'] for error in run.errors)
         return None
 
     class Input(OpenIMISMutation.Input):
@@ -2,32 +2,52 @@ import graphene
 from django.contrib.auth.models import AnonymousUser
 from django.db.models import Q
 
-from core.schema import OrderedDjangoFilterConnectionField
 from core.utils import append_validity_filter
 from invoice.apps import InvoiceConfig
+from invoice.gql.aggregate import GenericInvoiceAggregateField
+from invoice.gql.connection_fields import EstimatedCountDjangoFilterConnectionField
+from invoice.gql.filter_mixin import GenericFilterGQLTypeMixin
 from invoice.gql.gql_types.invoice_types import InvoiceGQLType
-from invoice.models import Invoice
+from invoice.models import Invoice, InvoiceRollup
 import graphene_django_optimizer as gql_optimizer
 
 
 class InvoiceQueryMixin:
-    invoice = OrderedDjangoFilterConnectionField(
+    invoice = EstimatedCountDjangoFilterConnectionField(
         InvoiceGQLType,
         orderBy=graphene.List(of_type=graphene.String),
         dateValidFrom__Gte=graphene.DateTime(),
         dateValidTo__Lte=graphene.DateTime(),
         applyDefaultValidityFilter=graphene.Boolean(),
-        client_mutation_id=graphene.String()
+        client_mutation_id=graphene.String(),
+        search=graphene.String(),
+        search_prefix=graphene.String(),
+    )
+    invoice_aggregate = GenericInvoiceAggregateField(
+        InvoiceGQLType,
+        'date_invoice',
+        rollup_document_type=InvoiceRollup.DocumentType.INVOICE,
+        dateValidFrom__Gte=graphene.DateTime(),
+        dateValidTo__Lte=graphene.DateTime(),
+        applyDefaultValidityFilter=graphene.Boolean(),
     )
 
     def resolve_invoice(self, info, **kwargs):
         InvoiceQueryMixin._check_permissions(info.context.user)
+        return gql_optimizer.query(InvoiceQueryMixin._get_invoice_queryset(info, **kwargs), info)
+
+    def resolve_invoice_aggregate(self, info, **kwargs):
+        InvoiceQueryMixin._check_permissions(info.context.user)
+        return Invoice.get_queryset(InvoiceQueryMixin._get_invoice_queryset(info, **kwargs), info)
+
+    @staticmethod
+    def _get_invoice_queryset(info, **kwargs):
         filters = []
         filters += append_validity_filter(**kwargs)
 
         client_mutation_id = kwargs.get("client_mutation_id", None)
         if client_mutation_id:
-            filters.append(Q(mutations__mutation__client_mutation_id=client_mutation_id))
+            filters.append(GenericFilterGQLTypeMixin.get_client_mutation_filter(Invoice, client_mutation_id))
 
         subject_type = kwargs.get("subject_type", None)
         if subject_type:
@@ -37,11 +57,20 @@ class InvoiceQueryMixin:
         if thirdparty_type:
             filters.append(Q(thirdparty_type__model=thirdparty_type))
 
+        search = kwargs.get("search", None)
+        if search:
+            filters.append(GenericFilterGQLTypeMixin.get_search_filter(
+                search, GenericFilterGQLTypeMixin.SEARCH_FIELDS_INVOICE))
+
+        search_prefix = kwargs.get("search_prefix", None)
+        if search_prefix:
+            filters.append(GenericFilterGQLTypeMixin.get_search_filter(
+                search_prefix, GenericFilterGQLTypeMixin.SEARCH_FIELDS_INVOICE, lookup='istartswith'))
+
         qs = Invoice.objects.filter(*filters)
         if InvoiceConfig.invoice_user_filter:
             qs = InvoiceConfig.invoice_user_filter(qs, info.context.user)
-
-        return gql_optimizer.query(qs, info)
+        return qs
 
     @staticmethod
     def _check_permissions(user):
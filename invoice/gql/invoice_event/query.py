@@ -1,10 +1,10 @@
 import graphene
 from django.contrib.auth.models import AnonymousUser
-from django.db.models import Q
 
 from core.schema import OrderedDjangoFilterConnectionField
 from core.utils import append_validity_filter
 from invoice.apps import InvoiceConfig
+from invoice.gql.filter_mixin import GenericFilterGQLTypeMixin
 from invoice.gql.gql_types.invoice_types import InvoiceEventGQLType
 from invoice.models import InvoiceEvent, Invoice
 import graphene_django_optimizer as gql_optimizer
@@ -27,7 +27,7 @@ class InvoiceEventQueryMixin:
 
         client_mutation_id = kwargs.get("client_mutation_id", None)
         if client_mutation_id:
-            filters.append(Q(mutations__mutation__client_mutation_id=client_mutation_id))
+            filters.append(GenericFilterGQLTypeMixin.get_client_mutation_filter(InvoiceEvent, client_mutation_id))
 
         invoice_event_qs = InvoiceEvent.objects.filter(*filters)
 
@@ -5,6 +5,7 @@ from django.db.models import Q
 from core.schema import OrderedDjangoFilterConnectionField
 from core.utils import append_validity_filter
 from invoice.apps import InvoiceConfig
+from invoice.gql.filter_mixin import GenericFilterGQLTypeMixin
 from invoice.gql.gql_types.invoice_types import InvoiceLineItemGQLType
 from invoice.models import InvoiceLineItem, Invoice
 import graphene_django_optimizer as gql_optimizer
@@ -27,7 +28,7 @@ class InvoiceLineItemQueryMixin:
 
         client_mutation_id = kwargs.get("client_mutation_id", None)
         if client_mutation_id:
-            filters.append(Q(mutations__mutation__client_mutation_id=client_mutation_id))
+            filters.append(GenericFilterGQLTypeMixin.get_client_mutation_filter(InvoiceLineItem, client_mutation_id))
 
         line_type = kwargs.get("line_type", None)
         if line_type:
@@ -0,0 +1,101 @@
+import json
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from insuree.models import Insuree
+from invoice.apps import InvoiceConfig
+from invoice.utils import underscore_to_camel
+from location.models import Location
+
+# model -> {field: camelCase key}
+_projections = {}
+
+
+class GenericObjectLoader(DataLoader):
+    """
+    Loads targets of generic foreign keys, keys are (content type id, object id) pairs. Pairs requested while
+    resolving a page are collected and every content type is fetched with a single id__in query.
+    Objects are loaded as projections (see get_projection), dicts with camelCase keys.
+    """
+
+    def batch_load_fn(self, keys):
+        ids_by_type = defaultdict(set)
+        for content_type_id, object_id in keys:
+            ids_by_type[content_type_id].add(object_id)
+        objects = {}
+        for content_type_id, object_ids in ids_by_type.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            if model is None:
+                continue
+            projection = get_projection(model)
+            pk_name = model._meta.pk.attname
+            for row in model._base_manager.filter(pk__in=object_ids).values(*{pk_name, *projection}):
+                objects[(content_type_id, str(row[pk_name]))] = {key: row[field] for field, key in projection.items()}
+        return Promise.resolve([objects.get((content_type_id, str(object_id))) for content_type_id, object_id in keys])
+
+
+class ValuesLoader(DataLoader):
+    """
+    Loads values() of model rows by id, all ids requested while resolving a page are fetched with a single query.
+    Rows are returned with keys converted to camelCase.
+    """
+    model = None
+    fields = ()
+    filters = {}
+
+    def batch_load_fn(self, keys):
+        rows = {}
+        for row in self.model.objects.filter(id__in=set(keys), **self.filters).values(*{'id', *self.fields}):
+            rows[row['id']] = {underscore_to_camel(field): row[field] for field in self.fields}
+        return Promise.resolve([rows.get(key) for key in keys])
+
+
+class HeadInsureeLoader(ValuesLoader):
+    model = Insuree
+    fields = ('id', 'chf_id', 'uuid', 'last_name', 'other_names')
+    filters = {'validity_to__isnull': True}
+
+
+class LocationLoader(ValuesLoader):
+    model = Location
+    fields = ('code', 'name')
+    filters = {'validity_to__isnull': True}
+
+
+def get_loader(info, loader_class):
+    # Loaders are cached on the request, so that they batch and cache only within a single GraphQL request
+    loaders = getattr(info.context, 'invoice_loaders', None)
+    if loaders is None:
+        loaders = {}
+        setattr(info.context, 'invoice_loaders', loaders)
+    if loader_class not in loaders:
+        loaders[loader_class] = loader_class()
+    return loaders[loader_class]
+
+
+def load_generic_object(info, content_type_id, object_id):
+    if not content_type_id or not object_id:
+        return Promise.resolve(None)
+    return get_loader(info, GenericObjectLoader).load((content_type_id, str(object_id)))
+
+
+def get_projection(model):
+    """
+    Fields of model serialized in GraphQL JSON fields, mapped to their camelCase keys. Fields are taken from
+    gql_generic_object_fields ("app_label.model_name": [fields]), all concrete fields of the model by default.
+    """
+    if model not in _projections:
+        fields = InvoiceConfig.gql_generic_object_fields.get(model._meta.label_lower) \
+            or [field.attname for field in model._meta.concrete_fields]
+        _projections[model] = {field: underscore_to_camel(field) for field in fields}
+    return _projections[model]
+
+
+def serialize_generic_object(obj):
+    if obj is None:
+        return None
+    return json.dumps(obj, cls=DjangoJSONEncoder)
@@ -2,17 +2,17 @@ import graphene
 import graphene_django_optimizer as gql_optimizer
 
 from django.contrib.auth.models import AnonymousUser
-from django.db.models import Q
 
-from core.schema import OrderedDjangoFilterConnectionField
 from core.utils import append_validity_filter
 from invoice.apps import InvoiceConfig
+from invoice.gql.connection_fields import EstimatedCountDjangoFilterConnectionField
+from invoice.gql.filter_mixin import GenericFilterGQLTypeMixin
 from invoice.gql.gql_types.payment_types import PaymentInvoiceGQLType
 from invoice.models import PaymentInvoice
 
 
 class PaymentInvoiceQueryMixin:
-    payment_invoice = OrderedDjangoFilterConnectionField(
+    payment_invoice = EstimatedCountDjangoFilterConnectionField(
         PaymentInvoiceGQLType,
         orderBy=graphene.List(of_type=graphene.String),
         subjectIds=graphene.List(of_type=graphene.UUID),
@@ -20,6 +20,8 @@ class PaymentInvoiceQueryMixin:
         dateValidTo__Lte=graphene.DateTime(),
         applyDefaultValidityFilter=graphene.Boolean(),
         client_mutation_id=graphene.String(),
+        search=graphene.String(),
+        search_prefix=graphene.String(),
     )
 
     def resolve_payment_invoice(self, info, **kwargs):
@@ -36,7 +38,17 @@ class PaymentInvoiceQueryMixin:
 
         client_mutation_id = kwargs.get("client_mutation_id", None)
         if client_mutation_id:
-            filters.append(Q(mutations__mutation__client_mutation_id=client_mutation_id))
+            filters.append(GenericFilterGQLTypeMixin.get_client_mutation_filter(PaymentInvoice, client_mutation_id))
+
+        search = kwargs.get("search", None)
+        if search:
+            filters.append(GenericFilterGQLTypeMixin.get_search_filter(
+                search, GenericFilterGQLTypeMixin.SEARCH_FIELDS_PAYMENT_INVOICE))
+
+        search_prefix = kwargs.get("search_prefix", None)
+        if search_prefix:
+            filters.append(GenericFilterGQLTypeMixin.get_search_filter(
+                search_prefix, GenericFilterGQLTypeMixin.SEARCH_FIELDS_PAYMENT_INVOICE, lookup='istartswith'))
 
         PaymentInvoiceQueryMixin._check_permissions(info.context.user)
         return gql_optimizer.query(query.filter(*filters).all(), info)
@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from invoice.apps import InvoiceConfig
+from invoice.models import InvoiceGenerationRun
+from invoice.services import InvoiceGenerationService
+
+
+class Command(BaseCommand):
+    help = "Generate invoices for a timeframe outside of a request. " \
+           "Subjects are processed in partitions, a failed run for the same timeframe is resumed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('date_from', type=datetime.date.fromisoformat, help="First date, YYYY-MM-DD")
+        parser.add_argument('date_to', type=datetime.date.fromisoformat, help="Last date, YYYY-MM-DD")
+        parser.add_argument('--username', required=True, help="User generating the invoices")
+        parser.add_argument('--partitions', type=int, default=None, help="Number of partitions of subjects, timeframe_invoice_generation_partitions by default")
+        parser.add_argument('--workers', type=int, default=None, help="Number of worker processes, timeframe_invoice_generation_workers by default")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if not user:
+            raise CommandError(f"User {options['username']} not found")
+
+        workers = options['workers'] or InvoiceConfig.timeframe_invoice_generation_workers
+        service = InvoiceGenerationService(user, partitions=options['partitions'], workers=workers)
+        try:
+            run = service.generate(options['date_from'], options['date_to'])
+        except ValidationError as exc:
+            raise CommandError("; ".join(exc.messages))
+        if run.status == InvoiceGenerationRun.Status.FAILED:
+            errors = "; ".join(f"{error['chunk']}: {error['error']}" for error in run.errors)
+            raise CommandError(f"Invoice generation run {run.id} failed: {errors}")
+        self.stdout.write(f"Invoice generation run {run.id} completed, {len(run.completed_chunks)} chunks processed")
@@ -0,0 +1,47 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from invoice.payment_statements import CSV, CAMT053, MT940
+from invoice.services import PaymentImportService
+
+FORMATS_BY_EXTENSION = {
+    '.csv': CSV,
+    '.xml': CAMT053,
+    '.sta': MT940,
+    '.mt940': MT940,
+}
+
+
+class Command(BaseCommand):
+    help = "Import payments from a CSV, CAMT.053 or MT940 statement file. " \
+           "The result of every statement line is written as CSV report."
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Statement file")
+        parser.add_argument('--username', required=True, help="User importing the payments")
+        parser.add_argument('--format', choices=[CSV, CAMT053, MT940], default=None,
+                            help="Statement format, guessed from the file extension by default")
+        parser.add_argument('--report', default=None, help="Report file, standard output by default")
+        parser.add_argument('--encoding', default='utf-8-sig', help="Encoding of CSV and MT940 statements")
+        parser.add_argument('--chunk-size', type=int, default=None, help="Number of lines in a single transaction")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if not user:
+            raise CommandError(f"User {options['username']} not found")
+        file_format = options['format'] or FORMATS_BY_EXTENSION.get(os.path.splitext(options['file'])[1].lower())
+        if not file_format:
+            raise CommandError(f"Unknown statement format of {options['file']}, use --format")
+
+        service = PaymentImportService(user, chunk_size=options['chunk_size'])
+        report = open(options['report'], 'w', newline='') if options['report'] else sys.stdout
+        try:
+            with open(options['file'], 'rb') as stream:
+                summary = service.import_statement(stream, file_format, report, encoding=options['encoding'])
+        finally:
+            if report is not sys.stdout:
+                report.close()
+        self.stderr.write(", ".join(f"{status}: {count}" for status, count in summary.items()))
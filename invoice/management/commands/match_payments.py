@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from invoice.services import PaymentMatchingService
+
+
+class Command(BaseCommand):
+    help = "Match unreconciled payments to open invoices and bills by their references."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help="User reconciling the payments")
+        parser.add_argument('--batch-size', type=int, default=None, help="Number of payments in a single transaction")
+        parser.add_argument('--ignore-amount', action='store_true',
+                            help="Match payments also when the amount received differs from the amount total")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if not user:
+            raise CommandError(f"User {options['username']} not found")
+
+        service = PaymentMatchingService(
+            user, batch_size=options['batch_size'], match_amount=not options['ignore_amount'])
+        summary = service.match()
+        self.stdout.write(", ".join(f"{key}: {value}" for key, value in summary.items()))
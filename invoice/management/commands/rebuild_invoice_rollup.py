@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from invoice.services import InvoiceRollupService
+
+
+class Command(BaseCommand):
+    help = "Recompute daily totals of invoices, bills and payments in tblInvoiceRollup from the document tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', choices=list(InvoiceRollupService.SOURCES), dest='models',
+                            help="Rebuild rollup of this document model only, can be repeated")
+
+    def handle(self, *args, **options):
+        InvoiceRollupService.rebuild(options['models'])
+        self.stdout.write("Invoice rollup rebuilt")
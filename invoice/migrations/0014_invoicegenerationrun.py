@@ -0,0 +1,34 @@
+import core.fields
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('invoice', '0013_alter_bill_code_ext_alter_bill_code_tp_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceGenerationRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date_from', core.fields.DateField(db_column='DateFrom')),
+                ('date_to', core.fields.DateField(db_column='DateTo')),
+                ('status', models.SmallIntegerField(choices=[(0, 'running'), (1, 'completed'), (2, 'failed')], db_column='Status', default=0)),
+                ('completed_chunks', models.JSONField(db_column='CompletedChunks', default=list)),
+                ('errors', models.JSONField(db_column='Errors', default=list)),
+                ('date_created', models.DateTimeField(auto_now_add=True, db_column='DateCreated')),
+                ('date_updated', models.DateTimeField(auto_now=True, db_column='DateUpdated')),
+                ('user', models.ForeignKey(blank=True, db_column='UserUUID', null=True, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'tblInvoiceGenerationRun',
+                'managed': True,
+            },
+        ),
+    ]
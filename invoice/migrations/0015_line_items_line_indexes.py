@@ -0,0 +1,48 @@
+from django.db import migrations, models
+
+# Only line item tables are queried by line reference (is_line_invoiced and prefetch of invoiced lines in
+# invoice.utils, line_type/line_id filters of the line item connections), historical tables aren't indexed
+LINE_INDEXES = [
+    ('invoicelineitem', models.Index(fields=['line_type', 'line_id'], name='invoice_line_item_line_idx')),
+    ('billitem', models.Index(fields=['line_type', 'line_id'], name='bill_item_line_idx')),
+]
+
+
+def create_line_indexes(apps, schema_editor):
+    # On PostgreSQL indexes are built concurrently, so line item tables are not locked for writes meanwhile
+    concurrently = schema_editor.connection.vendor == 'postgresql'
+    for model_name, index in LINE_INDEXES:
+        model = apps.get_model('invoice', model_name)
+        if concurrently:
+            schema_editor.add_index(model, index, concurrently=True)
+        else:
+            schema_editor.add_index(model, index)
+
+
+def drop_line_indexes(apps, schema_editor):
+    concurrently = schema_editor.connection.vendor == 'postgresql'
+    for model_name, index in LINE_INDEXES:
+        model = apps.get_model('invoice', model_name)
+        if concurrently:
+            schema_editor.remove_index(model, index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('invoice', '0014_invoicegenerationrun'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name=model_name, index=index) for model_name, index in LINE_INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(create_line_indexes, drop_line_indexes),
+            ],
+        ),
+    ]
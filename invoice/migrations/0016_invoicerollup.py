@@ -0,0 +1,77 @@
+import core.fields
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+# Document models in the rollup at the time of this migration:
+# (document type, model, date field, status field, currency field, subject type field, model fields of amounts)
+ROLLUP_SOURCES = (
+    (0, 'Invoice', 'date_invoice', 'status', 'currency_code', 'subject_type_id',
+     {'amount_total': 'amount_total', 'amount_net': 'amount_net', 'amount_discount': 'amount_discount'}),
+    (1, 'Bill', 'date_bill', 'status', 'currency_code', 'subject_type_id',
+     {'amount_total': 'amount_total', 'amount_net': 'amount_net', 'amount_discount': 'amount_discount'}),
+    (2, 'PaymentInvoice', 'date_payment', 'reconciliation_status', None, None,
+     {'amount_total': 'amount_received', 'fees': 'fees'}),
+)
+
+
+def populate_rollup(apps, schema_editor):
+    # Initial fill with historical models, the same rows are built by rebuild_invoice_rollup command
+    rollup_model = apps.get_model('invoice', 'InvoiceRollup')
+    for document_type, model_name, date_field, status_field, currency_field, subject_type_field, amount_fields \
+            in ROLLUP_SOURCES:
+        model = apps.get_model('invoice', model_name)
+        group_fields = [field for field in (date_field, status_field, currency_field, subject_type_field) if field]
+        rows = model._default_manager.filter(is_deleted=False).order_by().values(*group_fields).annotate(
+            rollup_count=models.Count('id'),
+            **{f'rollup_{field}': models.Sum(model_field) for field, model_field in amount_fields.items()}
+        )
+        rollup_model.objects.bulk_create([
+            rollup_model(
+                document_type=document_type,
+                day=row[date_field],
+                status=row[status_field],
+                currency_code=row[currency_field] if currency_field else '',
+                subject_type_id=row[subject_type_field] if subject_type_field else None,
+                count=row['rollup_count'],
+                **{field: row[f'rollup_{field}'] or 0 for field in amount_fields}
+            )
+            for row in rows
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('invoice', '0015_line_items_line_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('document_type', models.SmallIntegerField(choices=[(0, 'invoice'), (1, 'bill'), (2, 'payment')], db_column='DocumentType')),
+                ('day', core.fields.DateField(blank=True, db_column='Day', null=True)),
+                ('status', models.SmallIntegerField(db_column='Status')),
+                ('currency_code', models.CharField(db_column='CurrencyCode', default='', max_length=255)),
+                ('count', models.IntegerField(db_column='Count', default=0)),
+                ('amount_total', models.DecimalField(db_column='AmountTotal', decimal_places=2, default=0, max_digits=24)),
+                ('amount_net', models.DecimalField(db_column='AmountNet', decimal_places=2, default=0, max_digits=24)),
+                ('amount_discount', models.DecimalField(db_column='AmountDiscount', decimal_places=2, default=0, max_digits=24)),
+                ('fees', models.DecimalField(db_column='Fees', decimal_places=2, default=0, max_digits=24)),
+                ('subject_type', models.ForeignKey(blank=True, db_column='SubjectType', null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='contenttypes.contenttype')),
+            ],
+            options={
+                'db_table': 'tblInvoiceRollup',
+                'managed': True,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='invoicerollup',
+            index=models.Index(fields=['document_type', 'day', 'status', 'currency_code', 'subject_type'], name='invoice_rollup_key_idx'),
+        ),
+        migrations.RunPython(populate_rollup, migrations.RunPython.noop),
+    ]
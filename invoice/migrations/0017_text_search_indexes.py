@@ -0,0 +1,71 @@
+import logging
+
+from django.db import DatabaseError, migrations, models
+
+logger = logging.getLogger(__name__)
+
+# Fields searched with icontains/istartswith filters and the search/searchPrefix arguments of the connections
+SEARCH_FIELDS = {
+    'invoice': ['code', 'code_ext', 'code_tp', 'payment_reference', 'note'],
+    'bill': ['code', 'code_ext', 'code_tp', 'payment_reference', 'note'],
+    'paymentinvoice': ['code_ext', 'code_tp', 'payer_ref', 'payer_name'],
+}
+
+
+def _index_name(model, field):
+    return f"{model._meta.model_name}_{field.name}_search_idx"[:63]
+
+
+def _has_trigram_extension(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DatabaseError as exc:
+            # Usually missing privileges or contrib package, the migration runs outside of a transaction
+            logger.warning(f"pg_trgm extension can't be created, only searchPrefix is served by prefix indexes: "
+                           f"{exc}")
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    trigram = vendor == 'postgresql' and _has_trigram_extension(schema_editor)
+    for model_name, field_names in SEARCH_FIELDS.items():
+        model = apps.get_model('invoice', model_name)
+        for field in (model._meta.get_field(name) for name in field_names):
+            if vendor == 'postgresql':
+                # Django compares UPPER(column::text) for case insensitive lookups, indexes are on the same expression.
+                # Trigram indexes serve icontains and istartswith, pattern_ops indexes only istartswith.
+                method, opclass = ('gin', 'gin_trgm_ops') if trigram else ('btree', 'text_pattern_ops')
+                schema_editor.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{_index_name(model, field)}" '
+                    f'ON "{model._meta.db_table}" USING {method} (UPPER("{field.column}"::text) {opclass})'
+                )
+            elif field.get_internal_type() == 'CharField':
+                # Other backends compare with case insensitive collations, prefix searches can use a plain index
+                schema_editor.add_index(model, models.Index(fields=[field.name], name=_index_name(model, field)))
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for model_name, field_names in SEARCH_FIELDS.items():
+        model = apps.get_model('invoice', model_name)
+        for field in (model._meta.get_field(name) for name in field_names):
+            if vendor == 'postgresql':
+                schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{_index_name(model, field)}"')
+            elif field.get_internal_type() == 'CharField':
+                schema_editor.remove_index(model, models.Index(fields=[field.name], name=_index_name(model, field)))
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently on PostgreSQL, which can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('invoice', '0016_invoicerollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
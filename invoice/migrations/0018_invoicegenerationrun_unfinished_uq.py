@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0017_text_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='invoicegenerationrun',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('status', 1), _negated=True),
+                fields=('date_from', 'date_to'),
+                name='invoice_generation_run_unfinished_uq'
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations, models
+
+# Indexes of the default (-date_created, -id) ordering of keyset paginated connections
+KEYSET_INDEXES = [
+    ('invoice', models.Index(fields=['date_created', 'id'], name='invoice_created_id_idx')),
+    ('bill', models.Index(fields=['date_created', 'id'], name='bill_created_id_idx')),
+    ('paymentinvoice', models.Index(fields=['date_created', 'id'], name='payment_invoice_created_id_idx')),
+]
+
+
+def create_keyset_indexes(apps, schema_editor):
+    # On PostgreSQL indexes are built concurrently, so document tables are not locked for writes meanwhile
+    concurrently = schema_editor.connection.vendor == 'postgresql'
+    for model_name, index in KEYSET_INDEXES:
+        model = apps.get_model('invoice', model_name)
+        if concurrently:
+            schema_editor.add_index(model, index, concurrently=True)
+        else:
+            schema_editor.add_index(model, index)
+
+
+def drop_keyset_indexes(apps, schema_editor):
+    concurrently = schema_editor.connection.vendor == 'postgresql'
+    for model_name, index in KEYSET_INDEXES:
+        model = apps.get_model('invoice', model_name)
+        if concurrently:
+            schema_editor.remove_index(model, index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('invoice', '0018_invoicegenerationrun_unfinished_uq'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name=model_name, index=index) for model_name, index in KEYSET_INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(create_keyset_indexes, drop_keyset_indexes),
+            ],
+        ),
+    ]
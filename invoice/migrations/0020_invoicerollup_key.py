@@ -0,0 +1,44 @@
+from collections import defaultdict
+
+from django.db import migrations, models
+
+AMOUNT_FIELDS = ('count', 'amount_total', 'amount_net', 'amount_discount', 'fees')
+
+
+def _key(row):
+    # Same as InvoiceRollup.build_key
+    return f"{row.document_type}|{row.day or ''}|{row.status}|{row.currency_code or ''}|{row.subject_type_id or ''}"
+
+
+def fill_rollup_keys(apps, schema_editor):
+    # Rows of the same key created by concurrent transactions are merged into one before the key becomes unique
+    rollup_model = apps.get_model('invoice', 'InvoiceRollup')
+    rows_by_key = defaultdict(list)
+    for row in rollup_model.objects.all():
+        rows_by_key[_key(row)].append(row)
+    for key, rows in rows_by_key.items():
+        row, duplicates = rows[0], rows[1:]
+        totals = {field: sum(getattr(rollup_row, field) for rollup_row in rows) for field in AMOUNT_FIELDS}
+        rollup_model.objects.filter(id__in=[duplicate.id for duplicate in duplicates]).delete()
+        rollup_model.objects.filter(id=row.id).update(key=key, **totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0019_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicerollup',
+            name='key',
+            field=models.CharField(db_column='Key', max_length=300, null=True),
+        ),
+        migrations.RunPython(fill_rollup_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='invoicerollup',
+            name='key',
+            field=models.CharField(db_column='Key', max_length=300, unique=True),
+        ),
+    ]
@@ -2,7 +2,7 @@ from django.db import models
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
-from core.models import HistoryBusinessModel, HistoryModel, UUIDModel, ObjectMutation, MutationLog
+from core.models import HistoryBusinessModel, HistoryModel, UUIDModel, ObjectMutation, MutationLog, User
 from core.fields import DateField
 from datetime import date
 from invoice.apps import InvoiceConfig
@@ -152,6 +152,9 @@ class Invoice(GenericInvoice):
     class Meta:
         managed = True
         db_table = 'tblInvoice'
+        indexes = [
+            models.Index(fields=['date_created', 'id'], name='invoice_created_id_idx'),
+        ]
 
 
 class InvoiceLineItem(GenericInvoiceLineItem):
@@ -165,6 +168,9 @@ class InvoiceLineItem(GenericInvoiceLineItem):
     class Meta:
         managed = True
         db_table = 'tblInvoiceLineItem'
+        indexes = [
+            models.Index(fields=['line_type', 'line_id'], name='invoice_line_item_line_idx'),
+        ]
 
 
 class InvoicePayment(GenericInvoicePayment):
@@ -195,6 +201,9 @@ class Bill(GenericInvoice):
     class Meta:
         managed = True
         db_table = 'tblBill'
+        indexes = [
+            models.Index(fields=['date_created', 'id'], name='bill_created_id_idx'),
+        ]
 
 
 class BillItem(GenericInvoiceLineItem):
@@ -208,6 +217,9 @@ class BillItem(GenericInvoiceLineItem):
     class Meta:
         managed = True
         db_table = 'tblBillLineItem'
+        indexes = [
+            models.Index(fields=['line_type', 'line_id'], name='bill_item_line_idx'),
+        ]
 
 
 class BillPayment(GenericInvoicePayment):
@@ -330,6 +342,9 @@ class PaymentInvoice(GenericInvoiceQuerysetMixin, HistoryModel):
     class Meta:
         managed = True
         db_table = "tblPaymentInvoice"
+        indexes = [
+            models.Index(fields=['date_created', 'id'], name='payment_invoice_created_id_idx'),
+        ]
 
 
 class DetailPaymentInvoice(GenericInvoiceQuerysetMixin, HistoryModel):
@@ -377,3 +392,76 @@ class DetailPaymentInvoiceMutation(UUIDModel, ObjectMutation):
     class Meta:
         managed = True
         db_table = "paymentinvoice_DetailPaymentInvoiceMutation"
+
+
+class InvoiceGenerationRun(UUIDModel):
+    """
+    Progress of timeframe invoice generation. Subjects of the timeframe are processed in partitions (chunks)
+    committed independently, every processed chunk is recorded so that a failed or interrupted run can be resumed.
+    """
+    class Status(models.IntegerChoices):
+        RUNNING = 0, _('running')
+        COMPLETED = 1, _('completed')
+        FAILED = 2, _('failed')
+
+    date_from = DateField(db_column='DateFrom')
+    date_to = DateField(db_column='DateTo')
+    status = models.SmallIntegerField(db_column='Status', choices=Status.choices, default=Status.RUNNING)
+    completed_chunks = models.JSONField(db_column='CompletedChunks', default=list)
+    errors = models.JSONField(db_column='Errors', default=list)
+
+    user = models.ForeignKey(User, models.DO_NOTHING, db_column='UserUUID', blank=True, null=True)
+    date_created = models.DateTimeField(db_column='DateCreated', auto_now_add=True)
+    date_updated = models.DateTimeField(db_column='DateUpdated', auto_now=True)
+
+    class Meta:
+        managed = True
+        db_table = "tblInvoiceGenerationRun"
+        constraints = [
+            # Only one unfinished run per timeframe, concurrent requests can't start the same timeframe twice
+            models.UniqueConstraint(
+                fields=['date_from', 'date_to'],
+                condition=~models.Q(status=1),
+                name='invoice_generation_run_unfinished_uq'
+            ),
+        ]
+
+
+class InvoiceRollup(UUIDModel):
+    """
+    Counts and amount sums of invoices, bills and payments by day, status, currency and subject type.
+    Maintained incrementally by the services changing these documents (see InvoiceRollupService), so that
+    statistics are computed from the rollup instead of the document tables. Documents written directly through
+    the models or querysets, outside of these services, aren't counted until rebuild_invoice_rollup is run.
+    """
+    class DocumentType(models.IntegerChoices):
+        INVOICE = 0, _('invoice')
+        BILL = 1, _('bill')
+        PAYMENT = 2, _('payment')
+
+    document_type = models.SmallIntegerField(db_column='DocumentType', choices=DocumentType.choices)
+    day = DateField(db_column='Day', blank=True, null=True)
+    status = models.SmallIntegerField(db_column='Status')
+    currency_code = models.CharField(db_column='CurrencyCode', max_length=255, default='')
+    subject_type = models.ForeignKey(ContentType, models.DO_NOTHING, db_column='SubjectType',
+                                     related_name='+', blank=True, null=True)
+    # Unique combination of the grouping fields above, empty day and subject type included
+    key = models.CharField(db_column='Key', max_length=300, unique=True)
+
+    count = models.IntegerField(db_column='Count', default=0)
+    amount_total = models.DecimalField(db_column='AmountTotal', max_digits=24, decimal_places=2, default=0)
+    amount_net = models.DecimalField(db_column='AmountNet', max_digits=24, decimal_places=2, default=0)
+    amount_discount = models.DecimalField(db_column='AmountDiscount', max_digits=24, decimal_places=2, default=0)
+    fees = models.DecimalField(db_column='Fees', max_digits=24, decimal_places=2, default=0)
+
+    class Meta:
+        managed = True
+        db_table = "tblInvoiceRollup"
+        indexes = [
+            models.Index(fields=['document_type', 'day', 'status', 'currency_code', 'subject_type'],
+                         name='invoice_rollup_key_idx'),
+        ]
+
+    @classmethod
+    def build_key(cls, document_type, day, status, currency_code, subject_type_id):
+        return f"{document_type}|{day or ''}|{status}|{currency_code or ''}|{subject_type_id or ''}"
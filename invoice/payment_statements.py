@@ -0,0 +1,163 @@
+"""
+Streaming parsers of bank and mobile money statement files. Every parser takes a binary file object and yields
+one dict per statement line, with the line number in the file (or the entry number for XML statements)
+under 'line'. Lines not representing an incoming payment are yielded with the reason under 'skip'.
+Parsed values are left as strings, they are converted by the importing service.
+"""
+import csv
+import io
+import re
+from xml.etree.ElementTree import iterparse
+
+CSV = 'csv'
+CAMT053 = 'camt053'
+MT940 = 'mt940'
+
+# Columns recognized in CSV statements, any other column is ignored
+CSV_COLUMNS = (
+    'code_ext', 'code_tp', 'code_receipt', 'label', 'amount_received', 'fees', 'date_payment', 'payment_origin',
+    'payer_ref', 'payer_name', 'reference', 'currency', 'subject_type', 'subject_id', 'status'
+)
+
+MT940_STATEMENT_LINE = re.compile(
+    r'^(?P<date>\d{6})(?P<entry_date>\d{4})?(?P<mark>R?[CD])(?P<funds_code>[A-Z])?(?P<amount>\d+,\d*)'
+    r'(?P<type>[NSF][A-Z0-9]{3})(?P<customer_ref>.*?)(//(?P<bank_ref>.*))?$'
+)
+MT940_TAG = re.compile(r'^:(?P<tag>\d{2}[A-Z]?):(?P<value>.*)$')
+
+
+def parse_statement(stream, file_format, encoding='utf-8-sig'):
+    if file_format == CSV:
+        return parse_csv(stream, encoding)
+    if file_format == CAMT053:
+        return parse_camt053(stream)
+    if file_format == MT940:
+        return parse_mt940(stream, encoding)
+    raise ValueError(f"Unsupported statement format: {file_format}")
+
+
+def parse_csv(stream, encoding='utf-8-sig'):
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding=encoding, newline=''))
+    for row in reader:
+        line = {column: (row.get(column) or '').strip() or None for column in CSV_COLUMNS}
+        line['line'] = reader.line_num
+        yield line
+
+
+def parse_camt053(stream):
+    # Entries are removed from the tree as soon as they are parsed, so that memory use does not depend on file size
+    statement = None
+    entry_number = 0
+    for event, element in iterparse(stream, events=('start', 'end')):
+        name = _local_name(element.tag)
+        if event == 'start':
+            if name == 'Stmt':
+                statement = element
+            continue
+        if name != 'Ntry':
+            continue
+        entry_number += 1
+        yield _parse_camt053_entry(element, entry_number)
+        element.clear()
+        if statement is not None:
+            statement.remove(element)
+
+
+def parse_mt940(stream, encoding='utf-8-sig'):
+    statement_line = None
+    current_tag = None
+    for line_number, text in enumerate(io.TextIOWrapper(stream, encoding=encoding), start=1):
+        text = text.rstrip('\r\n')
+        match = MT940_TAG.match(text)
+        if not match:
+            # Continuation of the previous field, relevant only for the information to account owner (:86:)
+            if statement_line and current_tag == '86' and text and text != '-}':
+                statement_line['reference'] = f"{statement_line['reference']} {text.strip()}"
+            continue
+        current_tag = match.group('tag')
+        if current_tag == '61':
+            if statement_line:
+                yield _finalize_mt940_line(statement_line)
+            statement_line = _parse_mt940_statement_line(match.group('value'), line_number)
+        elif current_tag == '86' and statement_line:
+            statement_line['reference'] = match.group('value').strip()
+        elif current_tag in ('62F', '62M', '20') and statement_line:
+            # Closing balance or next statement, the last statement line is complete
+            yield _finalize_mt940_line(statement_line)
+            statement_line = None
+    if statement_line:
+        yield _finalize_mt940_line(statement_line)
+
+
+def _parse_camt053_entry(entry, entry_number):
+    line = {column: None for column in CSV_COLUMNS}
+    line['line'] = entry_number
+    if _find_text(entry, 'CdtDbtInd') != 'CRDT':
+        line['skip'] = "Debit entry"
+        return line
+    if _find_text(entry, 'RvslInd') == 'true':
+        line['skip'] = "Reversal entry"
+        return line
+    amount = _find(entry, 'Amt')
+    line['amount_received'] = amount.text.strip() if amount is not None and amount.text else None
+    line['currency'] = amount.get('Ccy') if amount is not None else None
+    line['date_payment'] = _find_text(entry, 'BookgDt', 'Dt') or _find_text(entry, 'ValDt', 'Dt')
+    line['code_ext'] = _find_text(entry, 'AcctSvcrRef') \
+        or _find_text(entry, 'NtryDtls', 'TxDtls', 'Refs', 'AcctSvcrRef')
+    line['code_tp'] = _find_text(entry, 'NtryDtls', 'TxDtls', 'Refs', 'EndToEndId')
+    line['payer_name'] = _find_text(entry, 'NtryDtls', 'TxDtls', 'RltdPties', 'Dbtr', 'Nm')
+    line['payer_ref'] = _find_text(entry, 'NtryDtls', 'TxDtls', 'RltdPties', 'DbtrAcct', 'Id', 'IBAN') \
+        or _find_text(entry, 'NtryDtls', 'TxDtls', 'RltdPties', 'DbtrAcct', 'Id', 'Othr', 'Id')
+    line['reference'] = _find_text(entry, 'NtryDtls', 'TxDtls', 'RmtInf', 'Strd', 'CdtrRefInf', 'Ref') \
+        or _find_text(entry, 'NtryDtls', 'TxDtls', 'RmtInf', 'Ustrd')
+    line['label'] = _find_text(entry, 'AddtlNtryInf') or line['reference']
+    line['payment_origin'] = _find_text(entry, 'BkTxCd', 'Prtry', 'Cd')
+    return line
+
+
+def _parse_mt940_statement_line(value, line_number):
+    line = {column: None for column in CSV_COLUMNS}
+    line['line'] = line_number
+    match = MT940_STATEMENT_LINE.match(value.strip())
+    if not match:
+        line['skip'] = f"Invalid statement line: {value}"
+        return line
+    if match.group('mark') != 'C':
+        line['skip'] = "Debit or reversal entry"
+        return line
+    date = match.group('date')
+    line['date_payment'] = f"20{date[0:2]}-{date[2:4]}-{date[4:6]}"
+    line['amount_received'] = match.group('amount').replace(',', '.')
+    customer_ref = match.group('customer_ref').strip()
+    line['code_tp'] = customer_ref if customer_ref and customer_ref != 'NONREF' else None
+    line['code_ext'] = (match.group('bank_ref') or '').strip() or line['code_tp']
+    line['payment_origin'] = match.group('type')
+    line['reference'] = ''
+    return line
+
+
+def _finalize_mt940_line(line):
+    if not line.get('skip'):
+        line['reference'] = line['reference'] or None
+        line['label'] = line['reference'][:255] if line['reference'] else None
+    return line
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _find(element, *path):
+    # Namespace agnostic lookup, CAMT.053 namespaces differ between message versions
+    for name in path:
+        element = next((child for child in element if _local_name(child.tag) == name), None)
+        if element is None:
+            return None
+    return element
+
+
+def _find_text(element, *path):
+    found = _find(element, *path)
+    if found is None or not found.text:
+        return None
+    return found.text.strip() or None
@@ -1,7 +1,9 @@
 import graphene
 
 from core.schema import signal_mutation_module_validate
+from invoice.apps import InvoiceConfig
 from invoice.gql import query_mixins
+from invoice.gql.export_patches import patch_subjects
 from invoice.gql.invoice import DeleteInvoiceMutation, GenerateTimeframeInvoices
 from invoice.gql.invoice_event.mutation import CreateInvoiceEventMutation
 from invoice.gql.invoice_payment.mutation import (
@@ -56,7 +58,28 @@ class Query(
     query_mixins.DetailPaymentInvoiceQueryMixin,
     graphene.ObjectType
 ):
-    pass
+    # All connections get an <connection>_export field writing the export with StreamingExportQueryMixin
+    exportable_fields = [
+        'invoice',
+        'invoice_line_item',
+        'invoice_payment',
+        'invoice_event',
+        'bill',
+        'bill_item',
+        'bill_payment',
+        'bill_event',
+        'payment_invoice',
+        'detail_payment_invoice',
+    ]
+    export_patches = {
+        **query_mixins.BillQueryMixin.export_patches,
+        'invoice': [
+            patch_subjects
+        ],
+        'detail_payment_invoice': [
+            patch_subjects
+        ],
+    }
 
 
 class Mutation(graphene.ObjectType):
@@ -93,11 +116,13 @@ def _on_mutation_log(mutation_model, model, obj_type, sender, **kwargs):
         uuids = [uuid] if uuid else []
     if not uuids:
         return []
-    impacted = model.objects.filter(uuid__in=uuids).all()
-    for item in impacted:
-        mutation_model.objects.create(
-            **{obj_type: item, 'mutation_id':kwargs['mutation_log_id']}
-        )
+    # Links are created from ids of the impacted objects only, in batches instead of one insert per object
+    impacted_ids = model.objects.filter(uuid__in=uuids).values_list('id', flat=True)
+    mutation_model.objects.bulk_create(
+        [mutation_model(**{f'{obj_type}_id': item_id, 'mutation_id': kwargs['mutation_log_id']})
+         for item_id in impacted_ids],
+        batch_size=InvoiceConfig.bulk_create_batch_size
+    )
     return []
 
 
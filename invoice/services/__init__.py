@@ -4,3 +4,7 @@ from invoice.services.invoicePayments import InvoicePaymentsService
 from invoice.services.bill import BillService
 from invoice.services.billLineItem import BillLineItemService
 from invoice.services.paymentInvoice import PaymentInvoiceService
+from invoice.services.invoiceGeneration import InvoiceGenerationService
+from invoice.services.paymentImport import PaymentImportService
+from invoice.services.paymentMatching import PaymentMatchingService
+from invoice.services.invoiceRollup import InvoiceRollupService
@@ -1,16 +1,21 @@
 import decimal
 from typing import Union, List
 
+from invoice.apps import InvoiceConfig
 from invoice.models import Bill, BillItem
 from core.services import BaseService
 from invoice.services.billLineItem import BillLineItemService
+from invoice.services.bulkCreate import GenericInvoiceBulkCreateMixin
+from invoice.services.invoiceRollup import InvoiceRollupServiceMixin
 from core.services.utils import get_generic_type
 from invoice.validation.bill import BillModelValidation, BillItemStatus
 from core.signals import *
 
 
-class BillService(BaseService):
+class BillService(InvoiceRollupServiceMixin, GenericInvoiceBulkCreateMixin, BaseService):
     OBJECT_TYPE = Bill
+    LINE_ITEM_SERVICE = BillLineItemService
+    LINE_ITEM_RELATION = 'bill'
 
     def __init__(self, user, validation_class: BillModelValidation = BillModelValidation):
         super().__init__(user, validation_class)
@@ -50,6 +55,8 @@ class BillService(BaseService):
             # save in database this invoice and invoice line item
             bill_line_items = convert_results['bill_data_line']
             bill_service = BillService(user=user)
+            if InvoiceConfig.bill_bulk_create:
+                return bill_service.create_with_line_items(convert_results['bill_data'], bill_line_items)
             bill_line_item_service = BillLineItemService(user=user)
             result_bill = bill_service.create(convert_results['bill_data'])
             if result_bill["success"] is True:
@@ -71,6 +78,28 @@ class BillService(BaseService):
                 generated_bill = bill_service.update(bill_update)
                 return generated_bill
 
+    @classmethod
+    @register_service_signal('signal_after_invoice_module_bill_create_batch_service')
+    def bill_create_batch(cls, **kwargs):
+        """
+        Create bills for many convert results at once, e.g. for commission and contribution batch runs.
+        Every element of 'convert_results' has the same structure as convert_results of bill_create.
+        Bills and their line items are written in bulk, in one transaction per chunk of 'chunk_size' bills.
+        @return: List of service results, one for every convert result containing bill data.
+        """
+        convert_results = [
+            convert_result for convert_result in kwargs.get('convert_results', [])
+            if 'bill_data' in convert_result and 'bill_data_line' in convert_result
+        ]
+        if not convert_results:
+            return []
+        user = kwargs.get('user', None) or convert_results[0]['user']
+        bill_service = BillService(user=user)
+        payloads = [
+            (convert_result['bill_data'], convert_result['bill_data_line']) for convert_result in convert_results
+        ]
+        return bill_service.create_many_with_line_items(payloads, chunk_size=kwargs.get('chunk_size', None))
+
     def _evaluate_generic_types(self, bill_data):
         if 'subject_type' in bill_data.keys():
             bill_data['subject_type'] = get_generic_type(bill_data['subject_type'])
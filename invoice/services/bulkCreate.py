@@ -0,0 +1,184 @@
+import decimal
+import logging
+from typing import List, Dict, Type, Tuple
+
+from django.db import transaction
+from django.db.models.fields import NOT_PROVIDED
+from simple_history.utils import bulk_create_with_history
+
+from core.services import BaseService
+from core.services.utils import (
+    output_exception,
+    output_result_success,
+    model_representation,
+    get_generic_type
+)
+from invoice.apps import InvoiceConfig
+from invoice.services.invoiceRollup import InvoiceRollupService
+
+logger = logging.getLogger(__name__)
+
+
+class BulkCreateMixin:
+    """
+    Bulk insert of HistoryModel instances together with their history records, for services with a user.
+    """
+
+    def _bulk_create(self, objs):
+        if not objs:
+            return []
+        return bulk_create_with_history(
+            objs,
+            type(objs[0]),
+            batch_size=InvoiceConfig.bulk_create_batch_size,
+            default_user=self.user
+        )
+
+    def _prepare_bulk_instance(self, instance, now):
+        # bulk_create bypasses HistoryModel.save and pre_save receivers, fields set there have to be filled here
+        instance.set_pk()
+        instance.user_created = self.user
+        instance.user_updated = self.user
+        instance.date_created = now
+        instance.date_updated = now
+        for field in instance._meta.concrete_fields:
+            if getattr(instance, field.attname) is None and field.default is not NOT_PROVIDED:
+                setattr(instance, field.attname, field.get_default())
+
+
+class GenericInvoiceBulkCreateMixin(BulkCreateMixin):
+    """
+    Bulk persistence path for generic invoices (Invoice, Bill) together with their line items.
+    Line item payloads are adjusted with the line item service, totals of the invoice are computed up front
+    and all line items (with their history rows) are inserted with bulk_create, instead of going through
+    line item service create and invoice update for every single item. Invalid line items are logged and skipped,
+    the invoice is created with the remaining ones.
+    """
+    LINE_ITEM_SERVICE: Type[BaseService]
+    # Name of the line item foreign key pointing to the generic invoice
+    LINE_ITEM_RELATION: str
+
+    GENERIC_TYPE_FIELDS = ('subject_type', 'thirdparty_type')
+    LINE_ITEM_GENERIC_TYPE_FIELDS = ('line_type',)
+
+    def create_with_line_items(self, obj_data: Dict, line_items_data: List[Dict]):
+        from core import datetime
+        try:
+            with transaction.atomic():
+                generic_types = {}
+                obj_ = self._build_generic_invoice(obj_data, generic_types)
+                self.validation_class.validate_create(self.user, **obj_data)
+                line_items = self._build_line_items(obj_, line_items_data, generic_types, datetime.datetime.now())
+                self._assign_totals(obj_, line_items)
+                obj_.save(username=self.user.username)
+                self._bulk_create(line_items)
+                InvoiceRollupService.add(self.OBJECT_TYPE, [obj_.id])
+                dict_repr = model_representation(obj_)
+                return output_result_success(dict_representation=dict_repr)
+        except Exception as exc:
+            return output_exception(
+                model_name=self.OBJECT_TYPE.__name__, method="create_with_line_items", exception=exc)
+
+    def create_many_with_line_items(self, payloads: List[Tuple[Dict, List[Dict]]], chunk_size: int = None):
+        """
+        Create many generic invoices with their line items. Payloads are processed in chunks, every chunk is
+        validated up front and written with bulk inserts inside a single transaction.
+        @param payloads: List of (invoice data, list of line items data) tuples
+        @param chunk_size: Number of invoices written in one transaction, bulk_create_batch_size by default
+        @return: List of service results, one for every payload, in the order of payloads
+        """
+        chunk_size = chunk_size or InvoiceConfig.bulk_create_batch_size
+        results = []
+        generic_types = {}
+        for start in range(0, len(payloads), chunk_size):
+            results.extend(self._create_chunk_with_line_items(payloads[start:start + chunk_size], generic_types))
+        return results
+
+    def _create_chunk_with_line_items(self, payloads, generic_types):
+        from core import datetime
+        now = datetime.datetime.now()
+        results = [None] * len(payloads)
+        built = []
+        for index, (obj_data, line_items_data) in enumerate(payloads):
+            try:
+                obj_ = self._build_generic_invoice(obj_data, generic_types)
+                line_items = self._build_line_items(obj_, line_items_data, generic_types, now)
+                built.append((index, obj_data, obj_, line_items))
+            except Exception as exc:
+                results[index] = self._bulk_create_exception(exc)
+
+        errors = self.validation_class.validate_create_batch(self.user, [obj_data for _, obj_data, _, _ in built])
+        to_create = []
+        for (index, _, obj_, line_items), error in zip(built, errors):
+            if error:
+                results[index] = self._bulk_create_exception(error)
+                continue
+            self._assign_totals(obj_, line_items)
+            self._prepare_bulk_instance(obj_, now)
+            to_create.append((index, obj_, line_items))
+
+        try:
+            with transaction.atomic():
+                self._bulk_create([obj_ for _, obj_, _ in to_create])
+                self._bulk_create([item for _, _, line_items in to_create for item in line_items])
+                InvoiceRollupService.add(self.OBJECT_TYPE, [obj_.id for _, obj_, _ in to_create])
+        except Exception as exc:
+            logger.exception(f"Failed to create chunk of {len(to_create)} {self.OBJECT_TYPE.__name__} objects")
+            for index, _, _ in to_create:
+                results[index] = self._bulk_create_exception(exc)
+            return results
+
+        for index, obj_, _ in to_create:
+            results[index] = output_result_success(dict_representation=model_representation(obj_))
+        return results
+
+    def _build_generic_invoice(self, obj_data, generic_types):
+        self._resolve_generic_types(obj_data, self.GENERIC_TYPE_FIELDS, generic_types)
+        obj_data = self._adjust_create_payload(obj_data)
+        return self.OBJECT_TYPE(**obj_data)
+
+    def _build_line_items(self, obj_, line_items_data, generic_types, now):
+        line_item_service = self.LINE_ITEM_SERVICE(user=self.user)
+        line_item_model = line_item_service.OBJECT_TYPE
+        line_items = []
+        for line_item_data in line_items_data:
+            # As with line items created one by one, an invalid line item is logged and left out of the invoice
+            try:
+                line_item_data = dict(line_item_data)
+                line_item_data.pop(f'{self.LINE_ITEM_RELATION}_id', None)
+                self._resolve_generic_types(line_item_data, self.LINE_ITEM_GENERIC_TYPE_FIELDS, generic_types)
+                line_item_data = line_item_service._adjust_create_payload(line_item_data)
+                line_item_service.validation_class.validate_create(self.user, **line_item_data)
+                line_item = line_item_model(**line_item_data)
+            except Exception as exc:
+                logger.exception(f"Skipped invalid {line_item_model.__name__} of {self.OBJECT_TYPE.__name__} "
+                                 f"{obj_.code}: {exc}")
+                continue
+            setattr(line_item, self.LINE_ITEM_RELATION, obj_)
+            self._prepare_bulk_instance(line_item, now)
+            line_items.append(line_item)
+        return line_items
+
+    def _assign_totals(self, obj_, line_items):
+        obj_.amount_net = sum((self._as_decimal(item.amount_net) for item in line_items), decimal.Decimal(0))
+        obj_.amount_total = sum((self._as_decimal(item.amount_total) for item in line_items), decimal.Decimal(0))
+        obj_.amount_discount = sum((self._as_decimal(item.discount) for item in line_items), decimal.Decimal(0))
+
+    def _bulk_create_exception(self, exc):
+        return output_exception(model_name=self.OBJECT_TYPE.__name__, method="create_with_line_items", exception=exc)
+
+    @classmethod
+    def _resolve_generic_types(cls, data, fields, generic_types):
+        # ContentType lookups are shared between all payloads processed in one call
+        for field in fields:
+            generic_type = data.get(field, None)
+            if isinstance(generic_type, str):
+                if generic_type not in generic_types:
+                    generic_types[generic_type] = get_generic_type(generic_type)
+                data[field] = generic_types[generic_type]
+
+    @classmethod
+    def _as_decimal(cls, value):
+        if not value:
+            return decimal.Decimal(0)
+        return decimal.Decimal(str(value))
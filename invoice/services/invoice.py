@@ -1,15 +1,20 @@
 from typing import Union, List
 
+from invoice.apps import InvoiceConfig
 from invoice.models import Invoice, InvoiceLineItem
 from core.services import BaseService
 from core.services.utils import get_generic_type
+from invoice.services.bulkCreate import GenericInvoiceBulkCreateMixin
+from invoice.services.invoiceRollup import InvoiceRollupServiceMixin
 from invoice.services.invoiceLineItem import InvoiceLineItemService
 from invoice.validation.invoice import InvoiceModelValidation, InvoiceItemStatus
 from core.signals import *
 
 
-class InvoiceService(BaseService):
+class InvoiceService(InvoiceRollupServiceMixin, GenericInvoiceBulkCreateMixin, BaseService):
     OBJECT_TYPE = Invoice
+    LINE_ITEM_SERVICE = InvoiceLineItemService
+    LINE_ITEM_RELATION = 'invoice'
 
     def __init__(self, user, validation_class: InvoiceModelValidation = InvoiceModelValidation):
         super().__init__(user, validation_class)
@@ -42,10 +47,13 @@ class InvoiceService(BaseService):
 
     @classmethod
     @register_service_signal('invoice_creation_from_calculation')
-    def invoice_creation_from_calculation(cls, user, from_date, to_date):
+    def invoice_creation_from_calculation(cls, user, from_date, to_date, subject_partition=None):
         """
         It sends the invoice_creation_from_calculation signal which should inform the
         relevant calculation rule that invoices need to be generated.
+        subject_partition (partition index, number of partitions) is passed when generation is split into
+        partitions of subjects, rules should invoice only subjects of the partition, see
+        invoice.utils.in_subject_partition.
         """
         pass
 
@@ -67,6 +75,8 @@ class InvoiceService(BaseService):
             # save in database this invoice and invoice line item
             invoice_line_items = convert_results['invoice_data_line']
             invoice_service = InvoiceService(user=user)
+            if InvoiceConfig.invoice_bulk_create:
+                return invoice_service.create_with_line_items(convert_results['invoice_data'], invoice_line_items)
             invoice_line_item_service = InvoiceLineItemService(user=user)
             result_invoice = invoice_service.create(convert_results['invoice_data'])
             if result_invoice["success"] is True:
@@ -0,0 +1,160 @@
+import datetime
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from typing import List, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from invoice import worker
+from invoice.apps import InvoiceConfig
+from invoice.models import InvoiceGenerationRun
+from invoice.services.invoice import InvoiceService
+from invoice.utils import lock_invoiced_lines, prefetch_invoiced_lines
+
+logger = logging.getLogger(__name__)
+
+
+class InvoiceGenerationService:
+    """
+    Runs invoice_creation_from_calculation over a timeframe, optionally split into partitions of subjects. Every
+    partition (chunk) gets the whole timeframe and the subject_partition argument, calculation rules invoice only
+    subjects of the partition (see invoice.utils.in_subject_partition). Rules ignoring the argument invoice all
+    subjects in the first chunk, which are then skipped as already invoiced in the next ones, so partitioning never
+    changes what is invoiced. Every chunk is committed in its own transaction and recorded in InvoiceGenerationRun,
+    a failed or interrupted run for the same timeframe is resumed from the chunks that were not completed yet.
+    A run still in progress in another request or process is not resumed.
+    With more than one worker chunks are processed in a pool of worker processes, each using its own database
+    connection, and the outcome of all chunks is merged into the run. Workers are meant for the
+    generate_timeframe_invoices command, requests generate chunks sequentially. Lines are invoiced by workers under
+    advisory locks (see invoice.utils.lock_invoiced_lines), so parallel generation is available on PostgreSQL only.
+    """
+
+    def __init__(self, user, invoice_service_class=InvoiceService, partitions: int = None, workers: int = None):
+        self.user = user
+        self.invoice_service_class = invoice_service_class
+        # With a single partition calculation rules are invoked once, without the subject_partition argument
+        self.partitions = partitions or InvoiceConfig.timeframe_invoice_generation_partitions or 1
+        self.workers = workers or 1
+
+    def generate(self, from_date: datetime.date, to_date: datetime.date) -> InvoiceGenerationRun:
+        if self.workers > 1 and not self._parallel_generation_supported():
+            raise ValidationError("Parallel invoice generation requires PostgreSQL database")
+        run = self._get_or_create_run(from_date, to_date)
+        for chunk, error in self._process_chunks(run, self._pending_chunks(run)):
+            if error:
+                run.errors.append({'chunk': self._chunk_key(chunk), 'error': error})
+                run.status = InvoiceGenerationRun.Status.FAILED
+            else:
+                run.completed_chunks.append(self._chunk_key(chunk))
+            run.save()
+        if run.status != InvoiceGenerationRun.Status.FAILED:
+            run.status = InvoiceGenerationRun.Status.COMPLETED
+            run.save()
+        return run
+
+    def split_subjects(self) -> List[Tuple[int, int]]:
+        # Chunks are (partition index, number of partitions)
+        return [(index, self.partitions) for index in range(self.partitions)]
+
+    def _process_chunks(self, run, chunks):
+        if self.workers > 1 and len(chunks) > 1:
+            return self._process_in_parallel(run, chunks)
+        return self._process_sequentially(run, chunks)
+
+    def _process_sequentially(self, run, chunks):
+        # Sequential run stops on the first failed chunk, the remaining chunks are left for resume
+        for chunk in chunks:
+            error = generate_chunk(
+                self.invoice_service_class, self.user, run.date_from, run.date_to, self._subject_partition(chunk))
+            yield chunk, error
+            if error:
+                return
+
+    def _process_in_parallel(self, run, chunks):
+        workers = min(self.workers, len(chunks))
+        with self._executor(workers) as executor:
+            futures = {
+                executor.submit(worker.generate_chunk, self.invoice_service_class, self.user.id,
+                                run.date_from, run.date_to, self._subject_partition(chunk)): chunk
+                for chunk in chunks
+            }
+            for future in as_completed(futures):
+                try:
+                    error = future.result()
+                except Exception as exc:
+                    logger.exception(F"Invoice generation worker failed for {futures[future]}. Details: {exc}")
+                    error = str(exc)
+                yield futures[future], error
+
+    @classmethod
+    def _parallel_generation_supported(cls):
+        # Without advisory locks workers with overlapping subjects could invoice the same line twice
+        return connection.vendor == 'postgresql'
+
+    def _executor(self, workers):
+        # Workers are spawned rather than forked, a forked process would share the database connection
+        # (and possibly an open transaction) of the parent
+        context = multiprocessing.get_context('spawn')
+        return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=worker.setup)
+
+    def _pending_chunks(self, run):
+        completed = {tuple(chunk) for chunk in run.completed_chunks}
+        return [chunk for chunk in self.split_subjects() if tuple(self._chunk_key(chunk)) not in completed]
+
+    def _get_or_create_run(self, from_date, to_date):
+        # The unfinished run of the timeframe is locked until it's marked as running by this request, the unique
+        # constraint on unfinished runs prevents concurrent requests from creating two runs for the same timeframe
+        try:
+            with transaction.atomic():
+                run = InvoiceGenerationRun.objects \
+                    .select_for_update() \
+                    .filter(date_from=from_date, date_to=to_date) \
+                    .exclude(status=InvoiceGenerationRun.Status.COMPLETED) \
+                    .first()
+                if not run:
+                    return InvoiceGenerationRun.objects.create(date_from=from_date, date_to=to_date, user=self.user)
+                if run.status == InvoiceGenerationRun.Status.RUNNING and not self._is_stale(run):
+                    raise ValidationError(F"Invoice generation for {from_date} - {to_date} is already in progress")
+                logger.info(F"Resuming invoice generation run {run.id} for {from_date} - {to_date}")
+                run.status = InvoiceGenerationRun.Status.RUNNING
+                run.errors = []
+                run.save()
+                return run
+        except IntegrityError:
+            raise ValidationError(F"Invoice generation for {from_date} - {to_date} is already in progress")
+
+    @classmethod
+    def _is_stale(cls, run):
+        # Run is saved after every chunk, a running run without progress for the timeout was interrupted
+        timeout = datetime.timedelta(minutes=InvoiceConfig.timeframe_invoice_generation_run_timeout)
+        return run.date_updated < timezone.now() - timeout
+
+    @classmethod
+    def _chunk_key(cls, chunk):
+        return list(chunk)
+
+    def _subject_partition(self, chunk):
+        return chunk if self.partitions > 1 else None
+
+
+def generate_chunk(invoice_service_class, user, from_date, to_date, subject_partition=None, lock_lines=False):
+    # Rules are invoked without subject_partition when subjects aren't partitioned, as before partitioning
+    partition_kwargs = {'subject_partition': subject_partition} if subject_partition else {}
+    try:
+        # Lines converted by calculation rules are checked against the invoiced lines loaded once per type,
+        # chunks generated concurrently lock every line checked until the chunk is committed
+        with transaction.atomic(), prefetch_invoiced_lines(), \
+                (lock_invoiced_lines() if lock_lines else nullcontext()):
+            service = invoice_service_class(user)
+            service.invoice_creation_from_calculation(
+                user=user, from_date=from_date, to_date=to_date, **partition_kwargs)
+    except Exception as exc:
+        logger.exception(F"Exception occurred during invoice generation for {from_date} - {to_date}, "
+                         F"subject partition {subject_partition}. Details: {exc}")
+        return str(exc)
+    return None
+
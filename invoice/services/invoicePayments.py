@@ -3,6 +3,7 @@ from django.db import transaction
 from invoice.models import InvoicePayment, Invoice
 from core.services import BaseService
 from core.services.utils import check_authentication, output_exception
+from invoice.services.invoiceRollup import InvoiceRollupService
 from invoice.validation.invoicePayment import InvoicePaymentModelValidation
 
 
@@ -40,7 +41,8 @@ class InvoicePaymentsService(BaseService):
 
                 self._update_invoice_status(invoice_payment.invoice, Invoice.Status.PAID)
 
-                invoice_payment.invoice.save(username=self.user.username)
+                with InvoiceRollupService.track(Invoice, [invoice_payment.invoice.id]):
+                    invoice_payment.invoice.save(username=self.user.username)
                 return self.save_instance(invoice_payment)
         except Exception as exc:
             return output_exception(model_name="InvoicePayment", method="payment_received", exception=exc)
@@ -52,7 +54,8 @@ class InvoicePaymentsService(BaseService):
                 self._update_payment_status(invoice_payment, InvoicePayment.PaymentStatus.REFUNDED)
                 self._update_invoice_status(invoice_payment.invoice, Invoice.Status.SUSPENDED)
 
-                invoice_payment.invoice.save(username=self.user.username)
+                with InvoiceRollupService.track(Invoice, [invoice_payment.invoice.id]):
+                    invoice_payment.invoice.save(username=self.user.username)
                 return self.save_instance(invoice_payment)
         except Exception as exc:
             return output_exception(model_name="InvoicePayment", method="payment_refunded", exception=exc)
@@ -65,7 +68,8 @@ class InvoicePaymentsService(BaseService):
                 self._update_payment_status(invoice_payment.invoice, InvoicePayment.PaymentStatus.CANCELLED)
                 self._update_invoice_status(invoice_payment.invoice, Invoice.Status.SUSPENDED)
 
-                invoice_payment.invoice.save(username=self.user.username)
+                with InvoiceRollupService.track(Invoice, [invoice_payment.invoice.id]):
+                    invoice_payment.invoice.save(username=self.user.username)
                 return self.save_instance(invoice_payment)
         except Exception as exc:
             return output_exception(model_name="InvoicePayment", method="payment_refunded", exception=exc)
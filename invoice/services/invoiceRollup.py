@@ -0,0 +1,234 @@
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.apps import apps as django_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import Trunc
+
+from invoice.apps import InvoiceConfig
+from invoice.models import InvoiceRollup
+
+logger = logging.getLogger(__name__)
+
+
+class RollupSource:
+    """
+    Mapping of a document model to rollup rows. Amount fields map rollup amounts to fields of the model.
+    """
+
+    def __init__(self, document_type, model_name, date_field, status_field, amount_fields,
+                 currency_field=None, subject_type_field=None):
+        self.document_type = document_type
+        self.model_name = model_name
+        self.date_field = date_field
+        self.status_field = status_field
+        self.amount_fields = amount_fields
+        self.currency_field = currency_field
+        self.subject_type_field = subject_type_field
+
+    @property
+    def group_fields(self):
+        return [field for field in (self.date_field, self.status_field, self.currency_field, self.subject_type_field)
+                if field]
+
+    def key(self, row):
+        return (
+            row[self.date_field],
+            row[self.status_field],
+            row[self.currency_field] if self.currency_field else '',
+            row[self.subject_type_field] if self.subject_type_field else None,
+        )
+
+
+class InvoiceRollupService:
+    """
+    Maintains InvoiceRollup. Services changing amounts, dates or status of invoices, bills or payments wrap the
+    change in track(), contributions of the changed documents are subtracted before and added after the change,
+    only the rollup rows whose totals differ are written. Changes made outside of track() (direct model saves,
+    queryset updates, raw SQL or data imports) leave the rollup stale, rebuild() (rebuild_invoice_rollup command)
+    has to be run after them.
+    """
+    AMOUNT_FIELDS = ('amount_total', 'amount_net', 'amount_discount', 'fees')
+    GENERIC_INVOICE_AMOUNTS = {'amount_total': 'amount_total', 'amount_net': 'amount_net',
+                               'amount_discount': 'amount_discount'}
+
+    SOURCES = {
+        'invoice.invoice': RollupSource(
+            InvoiceRollup.DocumentType.INVOICE, 'Invoice', 'date_invoice', 'status', GENERIC_INVOICE_AMOUNTS,
+            currency_field='currency_code', subject_type_field='subject_type_id'),
+        'invoice.bill': RollupSource(
+            InvoiceRollup.DocumentType.BILL, 'Bill', 'date_bill', 'status', GENERIC_INVOICE_AMOUNTS,
+            currency_field='currency_code', subject_type_field='subject_type_id'),
+        'invoice.paymentinvoice': RollupSource(
+            InvoiceRollup.DocumentType.PAYMENT, 'PaymentInvoice', 'date_payment', 'reconciliation_status',
+            {'amount_total': 'amount_received', 'fees': 'fees'}),
+    }
+
+    # Filters of aggregate queries that can be answered from the rollup, by filterset argument
+    AGGREGATE_FILTERS = ('status', 'currency_code')
+    DATE_LOOKUPS = ('', '__lt', '__lte', '__gt', '__gte')
+
+    @classmethod
+    def get_source(cls, model):
+        if not InvoiceConfig.invoice_rollup_enabled:
+            return None
+        return cls.SOURCES.get(model._meta.label_lower)
+
+    @classmethod
+    @contextmanager
+    def track(cls, model, ids=()):
+        """
+        Context in which documents of model with given ids are changed. Ids of documents created in the context
+        can be appended to the yielded list.
+        """
+        source = cls.get_source(model)
+        ids = list(ids)
+        if source is None:
+            yield ids
+            return
+        with transaction.atomic():
+            before = cls._contributions(model, source, ids)
+            yield ids
+            after = cls._contributions(model, source, ids)
+            cls._apply(source, before, after)
+
+    @classmethod
+    def track_queryset(cls, qs):
+        ids = qs.values_list('id', flat=True) if cls.get_source(qs.model) else ()
+        return cls.track(qs.model, ids)
+
+    @classmethod
+    def add(cls, model, ids):
+        with cls.track(model) as tracked:
+            tracked.extend(ids)
+
+    @classmethod
+    def rebuild(cls, labels=None):
+        """
+        Recompute rollup rows of given document models ("app_label.model_name", all by default) from the document
+        tables.
+        """
+        for label in labels or cls.SOURCES:
+            source = cls.SOURCES[label]
+            model = django_apps.get_model('invoice', source.model_name)
+            with transaction.atomic():
+                InvoiceRollup.objects.filter(document_type=source.document_type).delete()
+                rows = [
+                    InvoiceRollup(**cls._key_fields(source, key), **values)
+                    for key, values in cls._group(model._default_manager.filter(is_deleted=False), source).items()
+                ]
+                InvoiceRollup.objects.bulk_create(rows, batch_size=InvoiceConfig.bulk_create_batch_size or 500)
+            logger.info(f"Rebuilt {len(rows)} rollup rows of {label}")
+
+    @classmethod
+    def can_aggregate(cls, document_type, args, date_field):
+        """
+        Whether aggregate query with given non empty arguments can be answered from the rollup.
+        """
+        if not InvoiceConfig.invoice_rollup_enabled:
+            return False
+        user_filter = {
+            InvoiceRollup.DocumentType.INVOICE: InvoiceConfig.invoice_user_filter,
+            InvoiceRollup.DocumentType.BILL: InvoiceConfig.bill_user_filter,
+        }.get(document_type)
+        if user_filter:
+            return False
+        supported = {'period', *cls.AGGREGATE_FILTERS, *(f'{date_field}{lookup}' for lookup in cls.DATE_LOOKUPS)}
+        return all(key in supported for key, value in args.items() if value is not None and value is not False)
+
+    @classmethod
+    def aggregate(cls, document_type, args, date_field):
+        filters = {'document_type': document_type}
+        for key, value in args.items():
+            if value is None or key == 'period':
+                continue
+            if key.startswith(date_field):
+                filters[f'day{key[len(date_field):]}'] = value
+            else:
+                filters[key] = value
+        qs = InvoiceRollup.objects.filter(**filters).exclude(count=0)
+        group_by = ['status', 'currency_code']
+        if args.get('period'):
+            qs = qs.annotate(period=Trunc('day', args['period'], output_field=DateField()))
+            group_by.append('period')
+        rows = qs.order_by() \
+            .values(*group_by) \
+            .annotate(aggregate_count=Sum('count'),
+                      **{f'aggregate_{field}': Sum(field) for field in cls.AMOUNT_FIELDS}) \
+            .order_by(*reversed(group_by))
+        return [
+            {key[len('aggregate_'):] if key.startswith('aggregate_') else key: value for key, value in row.items()}
+            for row in rows
+        ]
+
+    @classmethod
+    def _contributions(cls, model, source, ids):
+        if not ids:
+            return {}
+        return cls._group(model.objects.filter(id__in=set(ids), is_deleted=False), source)
+
+    @classmethod
+    def _group(cls, qs, source):
+        rows = qs.order_by().values(*source.group_fields).annotate(
+            rollup_count=Count('id'),
+            **{f'rollup_{field}': Sum(model_field) for field, model_field in source.amount_fields.items()}
+        )
+        return {
+            source.key(row): {
+                'count': row['rollup_count'],
+                **{field: row.get(f'rollup_{field}') or Decimal(0) for field in cls.AMOUNT_FIELDS},
+            }
+            for row in rows
+        }
+
+    @classmethod
+    def _apply(cls, source, before, after):
+        deltas = defaultdict(lambda: {'count': 0, **{field: Decimal(0) for field in cls.AMOUNT_FIELDS}})
+        for sign, contributions in ((-1, before), (1, after)):
+            for key, values in contributions.items():
+                for field, value in values.items():
+                    deltas[key][field] += sign * value
+        for key, delta in deltas.items():
+            if not any(delta.values()):
+                continue
+            key_fields = cls._key_fields(source, key)
+            # Rows are incremented in place, the row created by a concurrent transaction meanwhile is incremented
+            # after the insert fails on the unique key
+            if cls._increment(key_fields['key'], delta):
+                continue
+            try:
+                with transaction.atomic():
+                    InvoiceRollup.objects.create(**key_fields, **delta)
+            except IntegrityError:
+                cls._increment(key_fields['key'], delta)
+
+    @classmethod
+    def _increment(cls, key, delta):
+        return InvoiceRollup.objects.filter(key=key) \
+            .update(**{field: F(field) + value for field, value in delta.items()})
+
+    @classmethod
+    def _key_fields(cls, source, key):
+        day, status, currency_code, subject_type_id = key
+        key_fields = {'document_type': source.document_type, 'day': day, 'status': status,
+                      'currency_code': currency_code or '', 'subject_type_id': subject_type_id}
+        return {**key_fields, 'key': InvoiceRollup.build_key(**key_fields)}
+
+
+class InvoiceRollupServiceMixin:
+    """
+    Keeps the rollup up to date for objects saved and deleted with BaseService create, update and delete.
+    """
+
+    def save_instance(self, obj_):
+        with InvoiceRollupService.track(self.OBJECT_TYPE, [obj_.id] if obj_.id else []) as ids:
+            result = super().save_instance(obj_)
+            ids.append(obj_.id)
+        return result
+
+    def delete_instance(self, obj_):
+        with InvoiceRollupService.track(self.OBJECT_TYPE, [obj_.id]):
+            return super().delete_instance(obj_)
@@ -0,0 +1,171 @@
+import csv
+import datetime
+import decimal
+import logging
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from invoice.apps import InvoiceConfig
+from invoice.models import PaymentInvoice, DetailPaymentInvoice
+from invoice.payment_statements import parse_statement
+from invoice.services.bulkCreate import BulkCreateMixin
+from invoice.services.invoiceRollup import InvoiceRollupService
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentImportService(BulkCreateMixin):
+    """
+    Imports statement files (CSV, CAMT.053, MT940) as PaymentInvoice with a single DetailPaymentInvoice for every
+    incoming payment. The file is parsed line by line and written in chunks, every chunk in its own transaction.
+    Lines with code_ext (bank transaction reference) already imported are reported as duplicates, so that
+    the same statement can be imported again safely.
+    """
+    REPORT_COLUMNS = ('line', 'status', 'payment_id', 'code_ext', 'message')
+
+    CREATED = 'created'
+    DUPLICATE = 'duplicate'
+    SKIPPED = 'skipped'
+    FAILED = 'failed'
+
+    def __init__(self, user, chunk_size: int = None):
+        self.user = user
+        self.chunk_size = chunk_size or InvoiceConfig.payment_import_chunk_size
+        self._subject_types = {}
+
+    def import_statement(self, stream, file_format, report_stream=None, encoding='utf-8-sig'):
+        """
+        @param stream: Binary file object with the statement
+        @param file_format: One of invoice.payment_statements CSV, CAMT053, MT940
+        @param report_stream: Optional text file object, result of every line is written to it as CSV row
+        @return: Number of lines by result status
+        """
+        report = csv.writer(report_stream) if report_stream is not None else None
+        if report:
+            report.writerow(self.REPORT_COLUMNS)
+        summary = {self.CREATED: 0, self.DUPLICATE: 0, self.SKIPPED: 0, self.FAILED: 0}
+        chunk = []
+        for line in parse_statement(stream, file_format, encoding):
+            chunk.append(line)
+            if len(chunk) >= self.chunk_size:
+                self._report(self._import_chunk(chunk), summary, report)
+                chunk = []
+        if chunk:
+            self._report(self._import_chunk(chunk), summary, report)
+        return summary
+
+    def _import_chunk(self, lines):
+        now = datetime.datetime.now()
+        results = []
+        to_create = []
+        for line in lines:
+            if line.get('skip'):
+                results.append(self._result(line, self.SKIPPED, message=line['skip']))
+                continue
+            try:
+                to_create.append((line, *self._build_payment(line, now)))
+            except Exception as exc:
+                results.append(self._result(line, self.FAILED, message=str(exc)))
+
+        to_create = self._exclude_duplicates(to_create, results)
+        try:
+            with transaction.atomic():
+                self._bulk_create([payment for _, payment, _ in to_create])
+                self._bulk_create([detail for _, _, detail in to_create])
+                InvoiceRollupService.add(PaymentInvoice, [payment.id for _, payment, _ in to_create])
+        except Exception as exc:
+            logger.exception(f"Failed to import chunk of {len(to_create)} statement lines")
+            results.extend(self._result(line, self.FAILED, message=str(exc)) for line, _, _ in to_create)
+            return results
+
+        results.extend(self._result(line, self.CREATED, payment=payment) for line, payment, _ in to_create)
+        return results
+
+    def _exclude_duplicates(self, to_create, results):
+        # Lines of previous chunks are already committed, checking the database covers duplicates within the file
+        codes = {line['code_ext'] for line, _, _ in to_create if line['code_ext']}
+        existing = set(PaymentInvoice.objects.filter(code_ext__in=codes).values_list('code_ext', flat=True)) \
+            if codes else set()
+        unique = []
+        for line, payment, detail in to_create:
+            code_ext = line['code_ext']
+            if code_ext and code_ext in existing:
+                results.append(self._result(line, self.DUPLICATE, message="Payment already imported"))
+                continue
+            if code_ext:
+                existing.add(code_ext)
+            unique.append((line, payment, detail))
+        return unique
+
+    def _build_payment(self, line, now):
+        amount = self._parse_decimal(line['amount_received'], 'amount_received')
+        if amount is None:
+            raise ValueError("Missing amount_received")
+        fees = self._parse_decimal(line['fees'], 'fees')
+        payer_ref = line['payer_ref'] or line['payer_name']
+        if not payer_ref:
+            raise ValueError("Missing payer_ref")
+
+        payment = PaymentInvoice(
+            code_ext=line['code_ext'],
+            code_tp=line['code_tp'],
+            code_receipt=line['code_receipt'],
+            label=line['label'],
+            reconciliation_status=PaymentInvoice.ReconciliationStatus.NOT_RECONCILIATED,
+            fees=fees,
+            amount_received=amount,
+            date_payment=datetime.date.fromisoformat(line['date_payment']) if line['date_payment'] else None,
+            payment_origin=line['payment_origin'],
+            payer_ref=payer_ref,
+            payer_name=line['payer_name'],
+            json_ext={'statement': {
+                'line': line['line'],
+                'reference': line['reference'],
+                'currency': line['currency'],
+            }},
+        )
+        self._prepare_bulk_instance(payment, now)
+
+        detail = DetailPaymentInvoice(
+            payment=payment,
+            status=int(line['status']) if line['status'] else DetailPaymentInvoice.DetailPaymentStatus.ACCEPTED,
+            fees=fees,
+            amount=amount,
+        )
+        if line['subject_type'] and line['subject_id']:
+            detail.subject_type = self._get_subject_type(line['subject_type'])
+            detail.subject_id = line['subject_id']
+        self._prepare_bulk_instance(detail, now)
+        return payment, detail
+
+    def _get_subject_type(self, subject_type):
+        if subject_type not in self._subject_types:
+            self._subject_types[subject_type] = ContentType.objects.get(model__iexact=subject_type)
+        return self._subject_types[subject_type]
+
+    @classmethod
+    def _parse_decimal(cls, value, field):
+        if not value:
+            return None
+        try:
+            return decimal.Decimal(value).quantize(decimal.Decimal('0.01'))
+        except decimal.InvalidOperation:
+            raise ValueError(f"Invalid {field}: {value}")
+
+    @classmethod
+    def _result(cls, line, status, payment=None, message=''):
+        return {
+            'line': line['line'],
+            'status': status,
+            'payment_id': str(payment.id) if payment else '',
+            'code_ext': line.get('code_ext') or '',
+            'message': message,
+        }
+
+    @classmethod
+    def _report(cls, results, summary, report):
+        for result in sorted(results, key=lambda result: result['line']):
+            summary[result['status']] += 1
+            if report:
+                report.writerow([result[column] for column in cls.REPORT_COLUMNS])
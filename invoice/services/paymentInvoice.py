@@ -1,4 +1,9 @@
+from collections import defaultdict
+from typing import List, Tuple
+
+from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import F
 
 from core.services import BaseService
 from core.services.utils import (
@@ -8,17 +13,19 @@ from core.services.utils import (
     model_representation
 )
 from core.signals import *
+from invoice.apps import InvoiceConfig
 from invoice.models import (
     Bill,
     PaymentInvoice,
     Invoice,
     DetailPaymentInvoice
 )
-from invoice.utils import resolve_payment_details
+from invoice.services.invoiceRollup import InvoiceRollupService, InvoiceRollupServiceMixin
+from invoice.utils import resolve_payment_details, resolve_payments_details_ids
 from invoice.validation.paymentInvoice import PaymentInvoiceModelValidation
 
 
-class PaymentInvoiceService(BaseService):
+class PaymentInvoiceService(InvoiceRollupServiceMixin, BaseService):
 
     OBJECT_TYPE = PaymentInvoice
 
@@ -36,6 +43,7 @@ class PaymentInvoiceService(BaseService):
             with transaction.atomic():
                 payment = PaymentInvoice(**payment_invoice)
                 payment.save(username=self.user.username)
+                InvoiceRollupService.add(PaymentInvoice, [payment.id])
                 payment_detail.payment = payment
                 payment_detail.subject = self._get_generic_object(
                     payment_detail.subject_id,
@@ -76,6 +84,25 @@ class PaymentInvoiceService(BaseService):
         except Exception as exc:
             return output_exception(model_name="PaymentInvoice", method="payment_received", exception=exc)
 
+    @register_service_signal('signal_after_invoice_module_payments_received')
+    def payments_received(self, batch: List[Tuple[PaymentInvoice, DetailPaymentInvoice.DetailPaymentStatus]],
+                          chunk_size: int = None):
+        """
+        Receive many payments, e.g. from a settlement file. Payments are processed in chunks, lookups of linked
+        invoices and bills and amount validation are done for the whole chunk at once and status transitions
+        of a chunk are applied in a single transaction.
+        Receivers of signal_after_invoice_module_payment_received are notified about every payment, as if it was
+        received with payment_received, signal_after_invoice_module_payments_received is sent for the whole batch.
+        @param batch: List of (payment invoice, payment status) tuples
+        @param chunk_size: Number of payments processed in one transaction, bulk_create_batch_size by default
+        @return: List of service results, one for every payment, in the order of batch
+        """
+        chunk_size = chunk_size or InvoiceConfig.bulk_create_batch_size
+        results = []
+        for start in range(0, len(batch), chunk_size):
+            results.extend(self._payments_received_chunk(batch[start:start + chunk_size]))
+        return results
+
     @register_service_signal('signal_after_invoice_module_payment_refunded')
     def payment_refunded(self, payment_invoice):
         try:
@@ -104,6 +131,47 @@ class PaymentInvoiceService(BaseService):
         except Exception as exc:
             return output_exception(model_name="PaymentInvoice", method="payment_cancelled", exception=exc)
 
+    def _payments_received_chunk(self, chunk):
+        signal = REGISTERED_SERVICE_SIGNALS['signal_after_invoice_module_payment_received']
+        for payment in chunk:
+            signal.send_signal_before(sender=self, cls_=self, data=[tuple(payment), {}], context=None)
+        results = self._receive_payments_chunk(chunk)
+        for payment, result in zip(chunk, results):
+            signal.send_signal_after(sender=self, cls_=self, data=[tuple(payment), {}], context=None, result=result)
+        return results
+
+    def _receive_payments_chunk(self, chunk):
+        payments = [payment_invoice for payment_invoice, _ in chunk]
+        payments_details = resolve_payments_details_ids([payment_invoice.id for payment_invoice in payments])
+        errors = self.validation_class.validate_receive_payments(self.user, payments, payments_details)
+        try:
+            with transaction.atomic():
+                self._update_all_dependencies_for_payments(
+                    [payment for payment, error in zip(chunk, errors) if not error],
+                    payments_details,
+                    Invoice.Status.PAID
+                )
+        except Exception as exc:
+            errors = [error or exc for error in errors]
+
+        return [
+            output_exception(model_name="PaymentInvoice", method="payments_received", exception=error) if error
+            else output_result_success(dict_representation=model_representation(payment_invoice))
+            for payment_invoice, error in zip(payments, errors)
+        ]
+
+    def _update_all_dependencies_for_payments(self, batch, payments_details, invoice_status):
+        payments_by_status = defaultdict(list)
+        invoice_ids, bill_ids = set(), set()
+        for payment_invoice, payment_status in batch:
+            payments_by_status[payment_status].append(payment_invoice.id)
+            invoice_ids.update(payments_details[payment_invoice.id][0])
+            bill_ids.update(payments_details[payment_invoice.id][1])
+        for payment_status, payment_ids in payments_by_status.items():
+            self._update_detail(DetailPaymentInvoice.objects.filter(payment_id__in=payment_ids), payment_status)
+        self._update_detail(Invoice.objects.filter(id__in=invoice_ids), invoice_status)
+        self._update_detail(Bill.objects.filter(id__in=bill_ids), invoice_status)
+
     def _update_all_dependencies_for_payment(self, payment_invoice, payment_status, invoice_status):
         invoices, bills = resolve_payment_details(payment_invoice)
         payment_details = payment_invoice.invoice_payments.all()
@@ -112,10 +180,40 @@ class PaymentInvoiceService(BaseService):
         self._update_detail(bills, invoice_status)
 
     def _update_detail(self, detail_collection, status):
-        for detail in detail_collection:
-            if detail.status != status:
-                detail.status = status
-                detail.save(username=self.user.username)
+        with InvoiceRollupService.track_queryset(detail_collection):
+            if InvoiceConfig.payment_bulk_status_update:
+                self._bulk_update_status(detail_collection, status)
+                return
+            for detail in detail_collection:
+                if detail.status != status:
+                    detail.status = status
+                    detail.save(username=self.user.username)
+
+    def _bulk_update_status(self, detail_collection, status):
+        # Equivalent of HistoryModel.save for every row changing status, done with a single UPDATE.
+        # Cached objects and history records are refreshed in bulk afterwards from the updated rows.
+        from core import datetime
+        model = detail_collection.model
+        rows = detail_collection.exclude(status=status)
+        if hasattr(model, 'replacement_uuid') and rows.filter(replacement_uuid__isnull=False).exists():
+            raise ValidationError("Update error! You cannot update replaced entity")
+        ids = list(rows.values_list('id', flat=True))
+        if not ids:
+            return
+        model.objects.filter(id__in=ids).update(
+            status=status,
+            date_updated=datetime.datetime.now(),
+            user_updated=self.user,
+            version=F('version') + 1
+        )
+        updated = list(model.objects.filter(id__in=ids))
+        model.bulk_update_cache(updated)
+        model.history.bulk_history_create(
+            updated,
+            batch_size=InvoiceConfig.bulk_create_batch_size,
+            update=True,
+            default_user=self.user
+        )
 
     @classmethod
     def _get_generic_object(cls, subject_id, subject_type):
@@ -0,0 +1,193 @@
+import decimal
+import logging
+import re
+import uuid
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
+from simple_history.utils import bulk_update_with_history
+
+from invoice.apps import InvoiceConfig
+from invoice.models import Invoice, Bill, PaymentInvoice, DetailPaymentInvoice
+from invoice.services.invoiceRollup import InvoiceRollupService
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentMatchingService:
+    """
+    Matches unreconciled payments, whose payment detail has no subject yet, to open invoices and bills.
+    Open invoices and bills are loaded once into hash indexes on payment_reference, code and code_ext,
+    references of the payment (remittance information, code_tp and label) are looked up in the indexes.
+    A payment is matched when all references point to a single invoice or bill and, unless disabled,
+    the amount received equals its amount total. Every invoice or bill is matched to at most one payment.
+    Payments are processed in batches, each batch is updated in bulk in its own transaction.
+    """
+    OPEN_STATUSES = (Invoice.Status.VALIDATED, Invoice.Status.UNPAID)
+    CLOSED_DETAIL_STATUSES = (DetailPaymentInvoice.DetailPaymentStatus.REFUNDED,
+                              DetailPaymentInvoice.DetailPaymentStatus.CANCELLED)
+    REFERENCE_SEPARATORS = re.compile(r'[\s,;:/]+')
+    # Words of free text references taken as document codes: at least 4 characters including a digit
+    DOCUMENT_CODE_TOKEN = re.compile(r'^(?=.*\d)[\w.\-]{4,}$')
+
+    MATCHED = 'matched'
+    UNMATCHED = 'unmatched'
+    AMBIGUOUS = 'ambiguous'
+
+    def __init__(self, user, batch_size: int = None, match_amount: bool = True):
+        self.user = user
+        self.batch_size = batch_size or InvoiceConfig.payment_matching_batch_size
+        self.match_amount = match_amount
+
+    def match(self):
+        """
+        @return: Number of processed payments by result, with the reconciliation id assigned to matched details
+        """
+        reconciliation_id = str(uuid.uuid4())
+        summary = {self.MATCHED: 0, self.UNMATCHED: 0, self.AMBIGUOUS: 0, 'reconciliation_id': reconciliation_id}
+        index = self._build_index()
+        matched_documents = set()
+        last_id = None
+        while True:
+            payments = PaymentInvoice.objects \
+                .filter(reconciliation_status=PaymentInvoice.ReconciliationStatus.NOT_RECONCILIATED,
+                        is_deleted=False)
+            if last_id:
+                payments = payments.filter(id__gt=last_id)
+            payments = list(payments
+                            .order_by('id')
+                            .values_list('id', 'code_tp', 'label', 'json_ext', 'amount_received')[:self.batch_size])
+            if not payments:
+                break
+            last_id = payments[-1][0]
+            self._match_batch(payments, index, matched_documents, reconciliation_id, summary)
+        logger.info(f"Payment matching {reconciliation_id} finished: {summary}")
+        return summary
+
+    def _match_batch(self, payments, index, matched_documents, reconciliation_id, summary):
+        details = self._get_unassigned_details([payment[0] for payment in payments])
+        matches = {}
+        for payment_id, code_tp, label, json_ext, amount_received in payments:
+            detail = details.get(payment_id)
+            if detail is None:
+                continue
+            candidates = {document for reference in self._payment_references(code_tp, label, json_ext)
+                          for document in index.get(reference, ())
+                          if document not in matched_documents}
+            if len(candidates) > 1:
+                summary[self.AMBIGUOUS] += 1
+                continue
+            document = next(iter(candidates), None)
+            if document is None or (self.match_amount and document[2] != amount_received):
+                summary[self.UNMATCHED] += 1
+                continue
+            matches[payment_id] = (detail, document)
+            matched_documents.add(document)
+
+        if matches:
+            with transaction.atomic():
+                self._reconcile(matches, reconciliation_id)
+        summary[self.MATCHED] += len(matches)
+
+    def _reconcile(self, matches, reconciliation_id):
+        from core import datetime
+        now = datetime.datetime.now()
+        details = []
+        for detail, (subject_type_id, subject_id, _) in matches.values():
+            detail.subject_type_id = subject_type_id
+            detail.subject_id = subject_id
+            detail.reconcilation_id = reconciliation_id
+            detail.reconcilation_date = now.date()
+            detail.date_updated = now
+            detail.user_updated = self.user
+            detail.version += 1
+            details.append(detail)
+        bulk_update_with_history(
+            details,
+            DetailPaymentInvoice,
+            ['subject_type', 'subject_id', 'reconcilation_id', 'reconcilation_date',
+             'date_updated', 'user_updated', 'version'],
+            batch_size=InvoiceConfig.bulk_create_batch_size,
+            default_user=self.user
+        )
+        DetailPaymentInvoice.bulk_update_cache(details)
+
+        payment_ids = list(matches.keys())
+        with InvoiceRollupService.track(PaymentInvoice, payment_ids):
+            PaymentInvoice.objects.filter(id__in=payment_ids).update(
+                reconciliation_status=PaymentInvoice.ReconciliationStatus.RECONCILIATED,
+                date_updated=now,
+                user_updated=self.user,
+                version=F('version') + 1
+            )
+        payments = list(PaymentInvoice.objects.filter(id__in=payment_ids))
+        PaymentInvoice.bulk_update_cache(payments)
+        PaymentInvoice.history.bulk_history_create(
+            payments,
+            batch_size=InvoiceConfig.bulk_create_batch_size,
+            update=True,
+            default_user=self.user
+        )
+
+    def _get_unassigned_details(self, payment_ids):
+        # Only payments with a single detail without subject are matched, other payments were assigned manually
+        details = defaultdict(list)
+        for detail in DetailPaymentInvoice.objects.filter(payment_id__in=payment_ids, is_deleted=False):
+            details[detail.payment_id].append(detail)
+        return {payment_id: payment_details[0] for payment_id, payment_details in details.items()
+                if len(payment_details) == 1 and not payment_details[0].subject_id}
+
+    def _build_index(self):
+        # reference -> set of (subject type id, subject id, amount total)
+        index = defaultdict(set)
+        for model in (Invoice, Bill):
+            content_type_id = ContentType.objects.get_for_model(model).id
+            documents = model.objects \
+                .filter(status__in=self.OPEN_STATUSES, is_deleted=False) \
+                .values_list('id', 'payment_reference', 'code', 'code_ext', 'amount_total')
+            for id_, *references, amount_total in documents.iterator():
+                document = (content_type_id, str(id_), self._as_decimal(amount_total))
+                for reference in references:
+                    if reference:
+                        index[self._normalize(reference)].add(document)
+            self._exclude_paid_documents(index, content_type_id)
+        return index
+
+    def _exclude_paid_documents(self, index, content_type_id):
+        open_ids = list({document[1] for documents in index.values() for document in documents
+                         if document[0] == content_type_id})
+        paid = set()
+        for start in range(0, len(open_ids), self.batch_size):
+            paid.update(DetailPaymentInvoice.objects
+                        .filter(subject_type_id=content_type_id,
+                                subject_id__in=open_ids[start:start + self.batch_size],
+                                is_deleted=False)
+                        .exclude(status__in=self.CLOSED_DETAIL_STATUSES)
+                        .values_list('subject_id', flat=True))
+        for reference in list(index.keys()):
+            index[reference] = {document for document in index[reference]
+                                if document[0] != content_type_id or document[1] not in paid}
+            if not index[reference]:
+                del index[reference]
+
+    def _payment_references(self, code_tp, label, json_ext):
+        statement_reference = ((json_ext or {}).get('statement') or {}).get('reference')
+        references = set()
+        for value in (statement_reference, code_tp, label):
+            if not value:
+                continue
+            references.add(self._normalize(value))
+            # Remittance information is free text, words looking like document codes are references too
+            references.update(self._normalize(token) for token in self.REFERENCE_SEPARATORS.split(value)
+                              if self.DOCUMENT_CODE_TOKEN.match(token))
+        return references
+
+    @classmethod
+    def _normalize(cls, reference):
+        return reference.strip().upper()
+
+    @classmethod
+    def _as_decimal(cls, value):
+        return decimal.Decimal(value).quantize(decimal.Decimal('0.01')) if value is not None else None
@@ -1,8 +1,7 @@
 from core.signals import bind_service_signal
 from core.service_signals import ServiceSignalBindType
-from django.contrib.contenttypes.models import ContentType
-from invoice.models import InvoiceLineItem
 from invoice.services import InvoiceService
+from invoice.utils import is_line_invoiced, mark_line_invoiced
 
 
 def bind_service_signals():
@@ -19,13 +18,15 @@ def bind_service_signals():
 
 
 def check_invoice_exist(**kwargs):
+    # Answered from memory for lines loaded with invoice.utils.prefetch_invoiced_lines
     function_arguments = kwargs.get('data')[1]
     instance = function_arguments.get('instance', None)
-    content_type_policy = ContentType.objects.get_for_model(instance.__class__)
-    invoices = InvoiceLineItem.objects.filter(line_type=content_type_policy, line_id=instance.id)
-    if invoices.count() == 0:
+    if not is_line_invoiced(instance):
         return True
 
 
 def save_invoice_in_db(**kwargs):
-    InvoiceService.invoice_create(**kwargs)
+    result = InvoiceService.invoice_create(**kwargs)
+    instance = kwargs.get('data')[1].get('instance', None)
+    if result and result.get('success', False) and instance:
+        mark_line_invoiced(instance)
@@ -4,3 +4,4 @@ from .invoice_payment_schema import *
 from .invoice_event_schema import *
 from .payment_invoice_schema import *
 from .detail_payment_invoice_schema import *
+from .bill_schema import *
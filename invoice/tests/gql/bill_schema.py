@@ -0,0 +1,98 @@
+import csv
+import io
+import json
+from datetime import datetime
+from unittest import skipUnless
+
+from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from invoice.exports import stream_export
+from invoice.gql.export_patches import patch_subjects
+from invoice.models import Bill, PaymentInvoice
+from invoice.tests.gql.base import InvoiceGQLTestCase
+from invoice.tests.helpers import create_test_bill, DEFAULT_TEST_PAYMENT_INVOICE_PAYLOAD
+from location.models import Location
+
+
+class BillGQLTest(InvoiceGQLTestCase):
+
+    batch_run_bills_query = '''
+query {
+    bill(code_Istartswith: "BATCH_RUN_", orderBy: ["code"]) {
+    edges {
+      node {
+        code
+        subject
+      }
+    }
+  }
+}
+'''
+
+    @skipUnless(apps.is_installed('claim_batch'), "Batch run subjects require claim_batch module")
+    def test_fetch_bill_batch_run_locations(self):
+        first_location = self._create_location('BRLOC1')
+        second_location = self._create_location('BRLOC2')
+        self._create_batch_run_bill('BATCH_RUN_1', first_location)
+
+        # Content types are cached after the first request
+        self._execute_batch_run_bills_query()
+        with CaptureQueriesContext(connection) as context:
+            self._execute_batch_run_bills_query()
+        single_bill_queries = len(context.captured_queries)
+
+        self._create_batch_run_bill('BATCH_RUN_2', first_location)
+        self._create_batch_run_bill('BATCH_RUN_3', second_location)
+        with self.assertNumQueries(single_bill_queries):
+            output = self._execute_batch_run_bills_query()
+
+        # Locations of all batch runs of the page are loaded at once, every subject gets its own location
+        locations = {edge['node']['code']: json.loads(edge['node']['subject'])['location']
+                     for edge in output['data']['bill']['edges']}
+        self.assertEqual(locations, {
+            'BATCH_RUN_1': {'code': 'BRLOC1', 'name': 'BRLOC1 name'},
+            'BATCH_RUN_2': {'code': 'BRLOC1', 'name': 'BRLOC1 name'},
+            'BATCH_RUN_3': {'code': 'BRLOC2', 'name': 'BRLOC2 name'},
+        })
+
+    def test_bill_export_subject_labels(self):
+        payment = PaymentInvoice(**DEFAULT_TEST_PAYMENT_INVOICE_PAYLOAD)
+        payment.save(username=self.user.username)
+        for code, subject in (('EXPORT_BILL_1', self.policy), ('EXPORT_BILL_2', self.contract),
+                              ('EXPORT_BILL_3', self.insuree), ('EXPORT_BILL_4', payment),
+                              ('EXPORT_BILL_5', self.policy)):
+            create_test_bill(subject, self.insuree, user=self.user, code=code, code_ext=F'{code}_EXT')
+        Bill.objects.filter(code='EXPORT_BILL_5').update(subject_type=None, subject_id=None)
+        qs = Bill.objects.filter(code__startswith='EXPORT_BILL_').order_by('code')
+
+        # Chunks of two rows mix subject types within a chunk and spread a type over chunks
+        export = stream_export(qs, ['code', 'subject_id', 'subject_type'], self.user,
+                               patches=[patch_subjects], chunk_size=2)
+
+        rows = {row['code']: (row['subject_id'], row['subject_type'])
+                for row in csv.DictReader(io.StringIO(export.content.read().decode('utf-8')))}
+        head_insuree_label = F'{self.insuree.other_names} {self.insuree.last_name} ({self.insuree.chf_id})'
+        self.assertEqual(rows, {
+            'EXPORT_BILL_1': (head_insuree_label, 'Policy'),
+            'EXPORT_BILL_2': (self.contract.code, 'Contract'),
+            'EXPORT_BILL_3': (head_insuree_label, 'Insuree'),
+            # Subject types without label and code field keep the subject id
+            'EXPORT_BILL_4': (str(payment.id), 'PaymentInvoice'),
+            'EXPORT_BILL_5': ('', 'undefined'),
+        })
+
+    def _execute_batch_run_bills_query(self):
+        output = self.graph_client.execute(self.batch_run_bills_query, context=self.BaseTestContext(self.user))
+        self.assertNotIn('errors', output)
+        return output
+
+    def _create_location(self, code):
+        return Location.objects.create(code=code, name=F'{code} name', type='D', audit_user_id=-1)
+
+    def _create_batch_run_bill(self, code, location):
+        from claim_batch.models import BatchRun
+        batch_run = BatchRun.objects.create(
+            location=location, run_date=datetime(2021, 9, 30), run_year=2021, run_month=9, audit_user_id=-1)
+        return create_test_bill(batch_run, self.insuree, user=self.user, code=code, code_ext=F'{code}_EXT')
@@ -1,7 +1,14 @@
+import json
 from decimal import Decimal
+from unittest.mock import patch
 
+from django.core.serializers.json import DjangoJSONEncoder
+
+from invoice.apps import InvoiceConfig
+from invoice.gql import loaders
 from invoice.tests.gql.base import InvoiceGQLTestCase
 from invoice.tests.helpers import DEFAULT_TEST_INVOICE_LINE_ITEM_PAYLOAD, DEFAULT_TEST_INVOICE_PAYLOAD
+from invoice.utils import underscore_to_camel
 
 
 class InvoiceLineItemGQLTest(InvoiceGQLTestCase):
@@ -23,6 +30,18 @@ query {{
     }}
   }}
 }}
+'''
+
+    line_query = F'''
+query {{
+	invoiceLineItem(invoice_Code:"{DEFAULT_TEST_INVOICE_PAYLOAD['code']}"){{
+    edges {{
+      node {{
+        line
+      }}
+    }}
+  }}
+}}
 '''
 
     def test_fetch_invoice_query(self):
@@ -41,3 +60,27 @@ query {{
                             'lineType': self.invoice_line_item.line_type.id
                         }}]}}}
         self.assertEqual(output, expected)
+
+    def test_fetch_line_projection_keys(self):
+        policy = type(self.policy).objects.get(id=self.policy.id)
+        # Keys and values of the line serialized from the model instance __dict__ before projections
+        expected = json.loads(json.dumps(
+            {underscore_to_camel(k): v for k, v in policy.__dict__.items() if k != '_state'}, cls=DjangoJSONEncoder))
+
+        with patch.dict(loaders._projections, clear=True):
+            output = self.graph_client.execute(self.line_query, context=self.BaseTestContext(self.user))
+
+        line = json.loads(output['data']['invoiceLineItem']['edges'][0]['node']['line'])
+        self.assertEqual(line, expected)
+        self.assertIn('familyId', line)
+
+    def test_fetch_line_projection_whitelist(self):
+        fields = {'policy.policy': ['uuid', 'family_id', 'start_date']}
+        with patch.object(InvoiceConfig, 'gql_generic_object_fields', fields), \
+                patch.dict(loaders._projections, clear=True):
+            output = self.graph_client.execute(self.line_query, context=self.BaseTestContext(self.user))
+
+        policy = type(self.policy).objects.get(id=self.policy.id)
+        line = json.loads(output['data']['invoiceLineItem']['edges'][0]['node']['line'])
+        self.assertEqual(line, json.loads(json.dumps(
+            {'uuid': policy.uuid, 'familyId': policy.family_id, 'startDate': policy.start_date}, cls=DjangoJSONEncoder)))
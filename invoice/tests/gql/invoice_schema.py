@@ -1,11 +1,43 @@
+import io
+import json
+import uuid
 from datetime import date
-from unittest.mock import MagicMock
+from decimal import Decimal
+from importlib.util import find_spec
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
 
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from contract.tests.helpers import create_test_contract
+from core.models import ExportableQueryModel, MutationLog
 from core.service_signals import ServiceSignalBindType
 from core.signals import REGISTERED_SERVICE_SIGNALS
-from invoice.services import InvoiceService
+from invoice.exports import stream_export
+from invoice.gql.invoice.mutation import GenerateTimeframeInvoices
+from invoice.models import Invoice, InvoiceGenerationRun, InvoiceMutation
+from invoice.services import InvoiceService, InvoiceRollupService
 from invoice.tests import DEFAULT_TEST_INVOICE_PAYLOAD
+from invoice.tests.helpers import create_test_invoice
 from invoice.tests.gql.base import InvoiceGQLTestCase
+from invoice.utils import underscore_to_camel
+from insuree.models import Insuree
+from insuree.test_helpers import create_test_insuree
+from policy.test_helpers import create_test_policy
+from policyholder.tests.helpers import create_test_policy_holder
+
+
+def _legacy_generic_object(obj):
+    # Serialization of generic objects by resolvers before objects were loaded in batches
+    obj_dict = {underscore_to_camel(k): v for k, v in type(obj).objects.get(pk=obj.pk).__dict__.items()
+                if k != '_state'}
+    if type(obj).__name__ == 'Family':
+        head_insuree = Insuree.objects.filter(id=obj_dict['headInsureeId'], validity_to__isnull=True) \
+            .values('id', 'chf_id', 'uuid', 'last_name', 'other_names').first()
+        obj_dict['headInsuree'] = {underscore_to_camel(k): v for k, v in head_insuree.items()}
+    return json.loads(json.dumps(obj_dict, cls=DjangoJSONEncoder))
 
 
 class InvoiceGQLTest(InvoiceGQLTestCase):
@@ -36,6 +68,20 @@ query {{
     }}
   }}
 }}
+'''
+
+    subjects_query = '''
+query {
+    invoice(code_Istartswith: "SUBJECT_", orderBy: ["code"]) {
+    edges {
+      node {
+        code
+        subject
+        thirdparty
+      }
+    }
+  }
+}
 '''
 
     def test_mutation_invoice_generate_for_time_frame(self):
@@ -53,8 +99,17 @@ query {{
         }
         mutation = self.create_invoice_mutation
         self.graph_client.execute(mutation, context=self.BaseTestContext(self.user))
+        # Timeframe isn't split into chunks by default, the signal is invoked once for the whole timeframe
         signal_receiver_mock.assert_called_once_with(**_expected_call_args)
-        pass
+
+    def test_mutation_invoice_generate_for_time_frame_in_progress(self):
+        date_from, date_to = date(2021, 1, 1), date(2021, 10, 1)
+        InvoiceGenerationRun.objects.create(date_from=date_from, date_to=date_to, user=self.user)
+
+        # Run in progress is reported as the mutation error instead of failing the request
+        output = GenerateTimeframeInvoices._generate_timeframe_invoices(self.user, date_from, date_to)
+
+        self.assertEqual(output, F"Invoice generation for {date_from} - {date_to} is already in progress")
 
     def test_fetch_invoice_query(self):
         output = self.graph_client.execute(self.search_for_invoice_query, context=self.BaseTestContext(self.user))
@@ -75,6 +130,300 @@ query {{
 
         self.assertEqual(output, expected)
 
+    def test_fetch_invoice_query_keyset_after(self):
+        query = F'''
+query {{
+    invoice(code_Iexact:"{DEFAULT_TEST_INVOICE_PAYLOAD['code']}", orderBy: ["-dateCreated"], keysetAfter: "{self.invoice.id}") {{
+    edges {{
+      node {{
+        code
+      }}
+    }}
+  }}
+}}
+'''
+        output = self.graph_client.execute(query, context=self.BaseTestContext(self.user))
+        self.assertEqual(output, {'data': {'invoice': {'edges': []}}})
+
+    def test_fetch_invoice_query_keyset_after_unsupported_ordering(self):
+        query = F'''
+query {{
+    invoice(orderBy: ["subjectType__model"], keysetAfter: "{self.invoice.id}") {{
+    edges {{
+      node {{
+        code
+      }}
+    }}
+  }}
+}}
+'''
+        output = self.graph_client.execute(query, context=self.BaseTestContext(self.user))
+        self.assertIsNone(output['data']['invoice'])
+        self.assertIn("can't be ordered by subject_type__model", output['errors'][0]['message'])
+
+    def test_fetch_invoice_query_keyset_pages_with_empty_ordering_values(self):
+        dated = create_test_invoice(code='KEYSET_DATED', code_ext='KEYSET_DATED_EXT')
+        undated = create_test_invoice(code='KEYSET_UNDATED', code_ext='KEYSET_UNDATED_EXT')
+        Invoice.objects.filter(id=undated.id).update(date_created=None)
+
+        def page(keyset_after=None):
+            keyset = F'keysetAfter: "{keyset_after}"' if keyset_after else 'keyset: true'
+            query = F'''
+query {{
+    invoice(code_Istartswith: "KEYSET_", orderBy: ["-dateCreated"], first: 1, {keyset}) {{
+    edges {{
+      node {{
+        code
+      }}
+    }}
+  }}
+}}
+'''
+            output = self.graph_client.execute(query, context=self.BaseTestContext(self.user))
+            return [edge['node']['code'] for edge in output['data']['invoice']['edges']]
+
+        # Empty dates are the greatest, descending ordering starts with them
+        self.assertEqual(page(), ['KEYSET_UNDATED'])
+        self.assertEqual(page(undated.id), ['KEYSET_DATED'])
+        self.assertEqual(page(dated.id), [])
+
+    def test_fetch_invoice_query_estimated_count(self):
+        query = F'''
+query {{
+    invoice(code_Iexact:"{DEFAULT_TEST_INVOICE_PAYLOAD['code']}", first: 10, exactCount: false) {{
+    totalCount
+    pageInfo {{
+      hasNextPage
+    }}
+    edges {{
+      node {{
+        code
+      }}
+    }}
+  }}
+}}
+'''
+        output = self.graph_client.execute(query, context=self.BaseTestContext(self.user))
+        expected = {'data': {'invoice': {
+            'totalCount': 1,
+            'pageInfo': {'hasNextPage': False},
+            'edges': [{'node': {'code': DEFAULT_TEST_INVOICE_PAYLOAD['code']}}]
+        }}}
+        self.assertEqual(output, expected)
+
+    def test_fetch_invoice_aggregate_query(self):
+        query = F'''
+query {{
+    invoiceAggregate(code_Iexact:"{DEFAULT_TEST_INVOICE_PAYLOAD['code']}", period: MONTH) {{
+    status
+    period
+    count
+    amountTotal
+  }}
+}}
+'''
+        output = self.graph_client.execute(query, context=self.BaseTestContext(self.user))
+        expected = {'data': {'invoiceAggregate': [{
+            'status': DEFAULT_TEST_INVOICE_PAYLOAD['status'],
+            'period': '2021-09-01',
+            'count': 1,
+            'amountTotal': '20.10'
+        }]}}
+        self.assertEqual(output, expected)
+
+    def test_invoice_aggregate_rollup_and_direct_query_match(self):
+        create_test_invoice(code='AGG_DELETED', is_deleted=True)
+        InvoiceRollupService.rebuild(['invoice.invoice'])
+        # Only period is answered from the rollup, amount filter is applied to the invoice table
+        rollup_query = '{ invoiceAggregate(period: MONTH) { status currencyCode period count amountTotal } }'
+        direct_query = '{ invoiceAggregate(period: MONTH, amountTotal_Gte: "0") ' \
+                       '{ status currencyCode period count amountTotal } }'
+        rollup_output = self.graph_client.execute(rollup_query, context=self.BaseTestContext(self.user))
+        direct_output = self.graph_client.execute(direct_query, context=self.BaseTestContext(self.user))
+        self.assertEqual(rollup_output, direct_output)
+        self.assertEqual(sum(row['count'] for row in direct_output['data']['invoiceAggregate']),
+                         Invoice.objects.filter(is_deleted=False).count())
+
+    def test_invoice_export(self):
+        query = F'''
+query {{
+    invoiceExport(code_Iexact:"{DEFAULT_TEST_INVOICE_PAYLOAD['code']}", fields: ["code"],
+                  fieldsColumns: "{{\\"code\\": \\"Code\\"}}")
+}}
+'''
+        output = self.graph_client.execute(query, context=self.BaseTestContext(self.user))
+        export = ExportableQueryModel.objects.get(name=output['data']['invoiceExport'])
+        content = export.content.read().decode('utf-8')
+        self.assertEqual(content.splitlines(), [',Code', F"0,{DEFAULT_TEST_INVOICE_PAYLOAD['code']}"])
+
+    def test_invoice_export_format_without_package(self):
+        qs = Invoice.objects.filter(code=DEFAULT_TEST_INVOICE_PAYLOAD['code'])
+        with patch('invoice.exports.find_spec', return_value=None):
+            with self.assertRaisesMessage(ImportError, "install openimis-be-invoice[xlsx]"):
+                stream_export(qs, ['code'], self.user, file_format='xlsx')
+
+    @skipUnless(find_spec('pyarrow'), "Columnar exports require pyarrow")
+    def test_invoice_export_parquet(self):
+        import pyarrow.parquet
+
+        query = F'''
+query {{
+    invoiceExport(code_Iexact:"{DEFAULT_TEST_INVOICE_PAYLOAD['code']}", fileFormat: "parquet",
+                  fields: ["id", "code", "amountTotal", "dateInvoice", "subjectType"], fieldsColumns: "{{}}")
+}}
+'''
+        output = self.graph_client.execute(query, context=self.BaseTestContext(self.user))
+        export = ExportableQueryModel.objects.get(name=output['data']['invoiceExport'])
+        table = pyarrow.parquet.read_table(io.BytesIO(export.content.read()))
+
+        # Column types follow model fields, subject type replaced with the class name by the patch is a string
+        self.assertEqual(table.schema.field('amount_total').type, pyarrow.decimal128(18, 2))
+        self.assertEqual(table.schema.field('date_invoice').type, pyarrow.date32())
+        self.assertEqual(table.schema.field('subject_type').type, pyarrow.string())
+        row = table.to_pylist()[0]
+        self.assertEqual(row['code'], DEFAULT_TEST_INVOICE_PAYLOAD['code'])
+        self.assertEqual(row['amount_total'], Decimal('20.10'))
+        self.assertEqual(row['date_invoice'], DEFAULT_TEST_INVOICE_PAYLOAD['date_invoice'])
+        self.assertEqual(row['subject_type'], type(self.invoice.subject).__name__)
+        exported_id = row['id']
+        self.assertEqual(uuid.UUID(bytes=exported_id) if isinstance(exported_id, bytes) else exported_id,
+                         self.invoice.id)
+
+    @skipUnless(find_spec('pyarrow'), "Columnar exports require pyarrow")
+    def test_invoice_export_columnar_chunks(self):
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        create_test_invoice(code='COLUMNAR_1', code_ext='COLUMNAR_EXT_1')
+        create_test_invoice(code='COLUMNAR_2', code_ext='COLUMNAR_EXT_2')
+        qs = Invoice.objects.filter(code__startswith='COLUMNAR_').order_by('code')
+
+        parquet = stream_export(qs, ['code', 'amount_total'], self.user, file_format='parquet', chunk_size=1)
+        parquet_file = pyarrow.parquet.ParquetFile(io.BytesIO(parquet.content.read()))
+        arrow = stream_export(qs, ['code', 'amount_total'], self.user, file_format='arrow', chunk_size=1)
+        arrow_reader = pyarrow.ipc.open_file(pyarrow.BufferReader(arrow.content.read()))
+
+        # Every chunk is a row group or record batch with the types of the first chunk
+        self.assertEqual(parquet_file.num_row_groups, 2)
+        self.assertEqual(arrow_reader.num_record_batches, 2)
+        expected = [{'code': 'COLUMNAR_1', 'amount_total': Decimal('20.10')},
+                    {'code': 'COLUMNAR_2', 'amount_total': Decimal('20.10')}]
+        self.assertEqual(parquet_file.read().to_pylist(), expected)
+        self.assertEqual(arrow_reader.read_all().to_pylist(), expected)
+
+    def test_fetch_invoice_query_search(self):
+        query = F'''
+query {{
+    invoice(search: "{DEFAULT_TEST_INVOICE_PAYLOAD['code_ext'].lower()}") {{
+    edges {{
+      node {{
+        codeExt
+      }}
+    }}
+  }}
+}}
+'''
+        output = self.graph_client.execute(query, context=self.BaseTestContext(self.user))
+        self.assertIn({'node': {'codeExt': DEFAULT_TEST_INVOICE_PAYLOAD['code_ext']}},
+                      output['data']['invoice']['edges'])
+
+    def test_fetch_invoice_query_search_prefix(self):
+        query = '''
+query {{
+    invoice({argument}: "code_ext") {{
+    edges {{
+      node {{
+        codeExt
+      }}
+    }}
+  }}
+}}
+'''
+        node = {'node': {'codeExt': DEFAULT_TEST_INVOICE_PAYLOAD['code_ext']}}
+        output = self.graph_client.execute(
+            query.format(argument='search'), context=self.BaseTestContext(self.user))
+        self.assertIn(node, output['data']['invoice']['edges'])
+        output = self.graph_client.execute(
+            query.format(argument='searchPrefix'), context=self.BaseTestContext(self.user))
+        self.assertNotIn(node, output['data']['invoice']['edges'])
+
+    def test_fetch_invoice_query_client_mutation_id(self):
+        client_mutation_id = str(uuid.uuid4())
+        mutation_log = MutationLog.objects.create(
+            json_content="{}", user=self.user, client_mutation_id=client_mutation_id)
+        InvoiceMutation.objects.create(invoice=self.invoice, mutation=mutation_log)
+        query = F'''
+query {{
+    invoice(clientMutationId: "{client_mutation_id}") {{
+    edges {{
+      node {{
+        codeExt
+      }}
+    }}
+  }}
+}}
+'''
+        output = self.graph_client.execute(query, context=self.BaseTestContext(self.user))
+        self.assertEqual(output['data']['invoice']['edges'],
+                         [{'node': {'codeExt': self.invoice.code_ext}}])
+
+    def test_fetch_invoice_subjects_constant_queries(self):
+        def page_queries():
+            with CaptureQueriesContext(connection) as context:
+                output = self.graph_client.execute(self.subjects_query, context=self.BaseTestContext(self.user))
+            self.assertNotIn('errors', output)
+            return len(output['data']['invoice']['edges']), len(context.captured_queries)
+
+        self._create_subject_invoices('1')
+        # Content types are cached after the first request
+        page_queries()
+        page_size, queries = page_queries()
+        self._create_subject_invoices('2')
+        self._create_subject_invoices('3')
+        bigger_page_size, bigger_page_queries = page_queries()
+
+        # Subjects, thirdparties and head insurees are loaded with a query per content type, not per invoice
+        self.assertEqual((page_size, bigger_page_size), (3, 9))
+        self.assertEqual(bigger_page_queries, queries)
+
+    def test_fetch_invoice_subjects_match_legacy_output(self):
+        subjects = self._create_subject_invoices('1')
+
+        output = self.graph_client.execute(self.subjects_query, context=self.BaseTestContext(self.user))
+
+        nodes = {edge['node']['code']: edge['node'] for edge in output['data']['invoice']['edges']}
+        for code, (subject, thirdparty) in subjects.items():
+            self.assertEqual(json.loads(nodes[code]['subject']), _legacy_generic_object(subject))
+            self.assertEqual(json.loads(nodes[code]['thirdparty']), _legacy_generic_object(thirdparty))
+
+    def test_fetch_invoice_family_head_insurees(self):
+        first_head, second_head = create_test_insuree(with_family=True), create_test_insuree(with_family=True)
+        for code, family in (('SUBJECT_FAMILY_1', first_head.family), ('SUBJECT_FAMILY_2', first_head.family),
+                             ('SUBJECT_FAMILY_3', second_head.family)):
+            create_test_invoice(family, first_head, code=code, code_ext=F'{code}_EXT')
+
+        output = self.graph_client.execute(self.subjects_query, context=self.BaseTestContext(self.user))
+
+        # Head insurees of all families of the page are loaded at once, invoices of a family share its head
+        head_insurees = {edge['node']['code']: json.loads(edge['node']['subject'])['headInsuree']['chfId']
+                         for edge in output['data']['invoice']['edges']}
+        self.assertEqual(head_insurees, {
+            'SUBJECT_FAMILY_1': first_head.chf_id,
+            'SUBJECT_FAMILY_2': first_head.chf_id,
+            'SUBJECT_FAMILY_3': second_head.chf_id,
+        })
+
+    def _create_subject_invoices(self, suffix):
+        insuree = create_test_insuree(with_family=True)
+        subjects = {
+            F'SUBJECT_POLICY_{suffix}': (create_test_policy(product=self.product, insuree=insuree), insuree),
+            F'SUBJECT_FAMILY_{suffix}': (insuree.family, insuree),
+            F'SUBJECT_CONTRACT_{suffix}': (create_test_contract(create_test_policy_holder()), insuree),
+        }
+        for code, (subject, thirdparty) in subjects.items():
+            create_test_invoice(subject, thirdparty, code=code, code_ext=F'{code}_EXT')
+        return subjects
+
     def setup_test_signal(self, receiver_mock):
         """
         Mutation doesn't provide logic for generating invoices, just invokes signal.
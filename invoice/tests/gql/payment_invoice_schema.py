@@ -1,6 +1,7 @@
 import uuid
 
 from core.models import MutationLog
+from invoice import schema as invoice_schema
 from invoice.models import (
     Invoice,
     InvoiceLineItem,
@@ -13,6 +14,7 @@ from invoice.tests.helpers import (
     create_test_invoice,
     create_test_invoice_line_item,
     create_test_payment_invoice_with_details,
+    create_test_payment_invoice_without_details,
 )
 
 
@@ -233,3 +235,17 @@ mutation {{
         mutation_log = MutationLog.objects.filter(client_mutation_id=mutation_client_id).first()
         obj: PaymentInvoice = PaymentInvoiceMutation.objects.get(mutation_id=mutation_log.id).payment_invoice
         self.assertEqual(obj.code_ext, expected_code_ext)
+
+    def test_payment_mutation_log_bulk_link(self):
+        payments = [create_test_payment_invoice_without_details(code_ext=f"BULK{i}")[0] for i in range(2)]
+        mutation_log = MutationLog.objects.create(
+            json_content="{}", user=self.user, client_mutation_id=str(uuid.uuid4()))
+        invoice_schema.on_payment_invoice_mutation(
+            None,
+            mutation_class='DeletePaymentInvoiceMutation',
+            data={'uuids': [payment.id for payment in payments] + [str(uuid.uuid4())]},
+            mutation_log_id=mutation_log.id
+        )
+        linked = PaymentInvoiceMutation.objects.filter(mutation_id=mutation_log.id) \
+            .values_list('payment_invoice_id', flat=True)
+        self.assertCountEqual(linked, [payment.id for payment in payments])
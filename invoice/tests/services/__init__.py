@@ -1,4 +1,10 @@
+from .bill import *
 from .invoice import *
+from .invoiceConversion import *
+from .invoiceGeneration import *
 from .invoiceLineItem import *
 from .invoicePayment import *
 from .paymentInvoice import *
+from .paymentImport import *
+from .paymentMatching import *
+from .invoiceRollup import *
@@ -0,0 +1,109 @@
+from datetime import date
+from unittest.mock import patch
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from contract.tests.helpers import create_test_contract
+from core.forms import User
+from insuree.test_helpers import create_test_insuree
+from invoice.models import Bill, BillItem
+from invoice.services import BillService
+from invoice.tests.helpers import create_test_bill, DEFAULT_TEST_BILL_LINE_ITEM_PAYLOAD
+from invoice.validation import BillModelValidation
+from policy.test_helpers import create_test_policy
+from policyholder.tests.helpers import create_test_policy_holder
+from product.test_helpers import create_test_product
+
+
+class ServiceTestBillBatch(TestCase):
+    BASE_TEST_BILL_PAYLOAD = {
+        'subject_type': 'contract',
+        'subject_id': None,
+        'thirdparty_type': 'insuree',
+        'thirdparty_id': None,
+        'code_tp': 'BILL_BATCH_TP',
+        'code_ext': 'BILL_BATCH_EXT',
+        'date_due': date(2021, 9, 13),
+        'date_bill': date(2021, 9, 11),
+        'status': Bill.Status.DRAFT,
+        'note': 'NOTE',
+        'terms': 'TERMS',
+        'payment_reference': 'payment reference'
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super(ServiceTestBillBatch, cls).setUpClass()
+        if not User.objects.filter(username='admin_invoice').exists():
+            User.objects.create_superuser(username='admin_invoice', password='S\/pe®Pąßw0rd™')
+        cls.user = User.objects.filter(username='admin_invoice').first()
+
+        cls.contract = create_test_contract(create_test_policy_holder())
+        cls.insuree = create_test_insuree(with_family=True)
+        product = create_test_product("BillBtch", custom_props={"insurance_period": 12})
+        cls.policy = create_test_policy(product=product, insuree=cls.insuree)
+
+    def test_bill_create_batch(self):
+        convert_results = [self._convert_result(f'BILL_BATCH_{index}', line_items=2) for index in range(3)]
+
+        results = BillService.bill_create_batch(convert_results=convert_results, user=self.user)
+
+        self.assertEqual([result['success'] for result in results], [True, True, True])
+        bills = Bill.objects.filter(code__startswith='BILL_BATCH_')
+        self.assertEqual(bills.count(), 3)
+        self.assertEqual(BillItem.objects.filter(bill__in=bills).count(), 6)
+        self.assertEqual(BillItem.history.filter(bill_id__in=bills.values('id')).count(), 6)
+        bill = bills.get(code='BILL_BATCH_1')
+        self.assertEqual(float(bill.amount_net), 2 * DEFAULT_TEST_BILL_LINE_ITEM_PAYLOAD['amount_net'])
+        self.assertEqual(float(bill.amount_total), 2 * DEFAULT_TEST_BILL_LINE_ITEM_PAYLOAD['amount_total'])
+        self.assertEqual(str(bill.subject_id), str(self.contract.id))
+
+    def test_bill_create_batch_duplicate_codes(self):
+        create_test_bill(subject=self.contract, thirdparty=self.insuree, user=self.user, code='BILL_BATCH_TAKEN')
+        convert_results = [
+            self._convert_result('BILL_BATCH_TAKEN'),
+            self._convert_result('BILL_BATCH_NEW'),
+            self._convert_result('BILL_BATCH_NEW'),
+        ]
+
+        results = BillService.bill_create_batch(convert_results=convert_results, user=self.user)
+
+        # Duplicates of existing bills and of bills earlier in the batch are rejected, the rest is created
+        self.assertEqual([result['success'] for result in results], [False, True, False])
+        self.assertEqual(Bill.objects.filter(code='BILL_BATCH_TAKEN').count(), 1)
+        self.assertEqual(Bill.objects.filter(code='BILL_BATCH_NEW').count(), 1)
+
+    def test_validate_create_batch_empty_codes(self):
+        errors = BillModelValidation.validate_create_batch(
+            self.user, [{'code': ''}, {'code': ''}, {'code': 'BILL_BATCH_X'}, {'code': 'BILL_BATCH_X'}])
+
+        self.assertEqual(errors[:3], [None, None, None])
+        self.assertIsInstance(errors[3], ValidationError)
+
+    def test_bill_create_batch_chunk_rolled_back(self):
+        convert_results = [self._convert_result(f'BILL_BATCH_{index}') for index in range(3)]
+
+        with patch('invoice.services.bulkCreate.InvoiceRollupService.add',
+                   side_effect=[Exception('Rollup failed'), None]):
+            results = BillService.bill_create_batch(convert_results=convert_results, user=self.user, chunk_size=2)
+
+        # First chunk is rolled back with its line items, the next chunk is written in its own transaction
+        self.assertEqual([result['success'] for result in results], [False, False, True])
+        self.assertFalse(Bill.objects.filter(code__in=['BILL_BATCH_0', 'BILL_BATCH_1']).exists())
+        self.assertFalse(BillItem.objects.filter(bill__code__in=['BILL_BATCH_0', 'BILL_BATCH_1']).exists())
+        self.assertEqual(BillItem.objects.filter(bill__code='BILL_BATCH_2').count(), 1)
+
+    def _convert_result(self, code, line_items=1):
+        bill_data = {
+            **self.BASE_TEST_BILL_PAYLOAD,
+            'code': code,
+            'subject_id': self.contract.id,
+            'thirdparty_id': self.insuree.id,
+        }
+        line_item_data = {**DEFAULT_TEST_BILL_LINE_ITEM_PAYLOAD, 'line': self.policy}
+        return {
+            'user': self.user,
+            'bill_data': bill_data,
+            'bill_data_line': [{**line_item_data, 'code': f'{code}_LINE_{index}'} for index in range(line_items)],
+        }
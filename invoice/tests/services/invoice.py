@@ -10,7 +10,7 @@ from core.test_helpers import compare_dicts
 from insuree.test_helpers import create_test_insuree
 from invoice.models import Invoice, InvoiceLineItem, InvoicePayment
 from invoice.services import InvoiceService
-from invoice.tests.helpers import create_test_invoice_line_item
+from invoice.tests.helpers import create_test_invoice_line_item, DEFAULT_TEST_INVOICE_LINE_ITEM_PAYLOAD
 from invoice.validation import TaxAnalysisFormatValidationMixin, InvoiceItemStatus
 from policy.test_helpers import create_test_policy
 from policyholder.tests.helpers import create_test_policy_holder
@@ -294,3 +294,38 @@ class ServiceTestInvoice(TestCase):
             self.assertDictEqual(output, expected_output)
             InvoiceLineItem.objects.filter(id=invoice_line_item.id).delete()
             Invoice.objects.filter(code=payload['code']).delete()
+
+    def test_invoice_create_with_line_items(self):
+        with transaction.atomic():
+            payload = self.BASE_TEST_INVOICE_PAYLOAD.copy()
+            line_item_payload = DEFAULT_TEST_INVOICE_LINE_ITEM_PAYLOAD.copy()
+            line_item_payload['line'] = self.policy
+            line_items = [line_item_payload.copy(), {**line_item_payload, 'code': 'LineItem2'}]
+
+            response = self.insuree_service.create_with_line_items(payload, line_items)
+
+            invoice = Invoice.objects.filter(code=payload['code']).get()
+            self.assertTrue(response['success'])
+            self.assertEqual(invoice.line_items.count(), 2)
+            self.assertEqual(InvoiceLineItem.history.filter(invoice_id=invoice.id).count(), 2)
+            self.assertEqual(float(invoice.amount_net), 2 * line_item_payload['amount_net'])
+            self.assertEqual(float(invoice.amount_total), 2 * line_item_payload['amount_total'])
+            self.assertEqual(float(invoice.amount_discount), 2 * line_item_payload['discount'])
+            InvoiceLineItem.objects.filter(invoice=invoice).delete()
+            Invoice.objects.filter(code=payload['code']).delete()
+
+    def test_invoice_create_with_line_items_skips_invalid_line(self):
+        with transaction.atomic():
+            payload = self.BASE_TEST_INVOICE_PAYLOAD.copy()
+            line_item_payload = DEFAULT_TEST_INVOICE_LINE_ITEM_PAYLOAD.copy()
+            line_item_payload['line'] = self.policy
+            line_items = [line_item_payload.copy(), {**line_item_payload, 'code': 'LineItem2', 'unknown_field': 1}]
+
+            response = self.insuree_service.create_with_line_items(payload, line_items)
+
+            invoice = Invoice.objects.filter(code=payload['code']).get()
+            self.assertTrue(response['success'])
+            self.assertEqual(invoice.line_items.count(), 1)
+            self.assertEqual(float(invoice.amount_total), line_item_payload['amount_total'])
+            InvoiceLineItem.objects.filter(invoice=invoice).delete()
+            Invoice.objects.filter(code=payload['code']).delete()
@@ -0,0 +1,114 @@
+from datetime import date
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from insuree.test_helpers import create_test_insuree
+from policy.models import Policy
+from policy.test_helpers import create_test_policy
+from product.test_helpers import create_test_product
+
+from core.forms import User
+from invoice.apps import InvoiceConfig
+from invoice.services.invoiceGeneration import generate_chunk
+from invoice.signals import check_invoice_exist
+from invoice.tests.helpers import create_test_invoice_line_item
+from invoice.utils import lock_invoiced_lines, mark_line_invoiced, prefetch_invoiced_lines
+
+
+class _ConversionStub:
+    """
+    Invoice service converting policies the way calculation rules do, one convert_to_invoice check per policy.
+    """
+    policies = []
+    results = []
+    queries = 0
+
+    def __init__(self, user):
+        self.user = user
+
+    def invoice_creation_from_calculation(self, user, from_date, to_date):
+        with CaptureQueriesContext(connection) as context:
+            self.__class__.results = [_check(policy) for policy in self.policies]
+        self.__class__.queries = len(context.captured_queries)
+
+
+def _check(instance):
+    return check_invoice_exist(data=[(), {'instance': instance}])
+
+
+class ServiceTestInvoiceConversion(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(ServiceTestInvoiceConversion, cls).setUpClass()
+        if not User.objects.filter(username='admin_invoice').exists():
+            User.objects.create_superuser(username='admin_invoice', password='S\/pe®Pąßw0rd™')
+        cls.user = User.objects.filter(username='admin_invoice').first()
+
+    def setUp(self):
+        product = create_test_product("InvConv", custom_props={"insurance_period": 12})
+        self.invoiced_policy, self.new_policy, self.other_policy = [
+            create_test_policy(product=product, insuree=create_test_insuree(with_family=True)) for _ in range(3)]
+        self.line_item = create_test_invoice_line_item(line_item=self.invoiced_policy, user=self.user)
+        # Content type is cached after the first lookup, counted queries are the invoiced lines lookups only
+        ContentType.objects.get_for_model(Policy)
+
+    def test_prefetched_lines_checked_from_memory(self):
+        with prefetch_invoiced_lines(Policy, [self.invoiced_policy.id, self.new_policy.id]):
+            with self.assertNumQueries(0):
+                self.assertIsNone(_check(self.invoiced_policy))
+                self.assertTrue(_check(self.new_policy))
+
+    def test_lines_outside_prefetch_checked_in_database(self):
+        create_test_invoice_line_item(
+            invoice=self.line_item.invoice, line_item=self.other_policy, user=self.user, code='LineItemOther')
+
+        with prefetch_invoiced_lines(Policy, [self.new_policy.id]):
+            with self.assertNumQueries(1):
+                self.assertIsNone(_check(self.other_policy))
+        with self.assertNumQueries(1):
+            self.assertTrue(_check(self.new_policy))
+
+    def test_lines_of_type_loaded_on_first_check(self):
+        with prefetch_invoiced_lines():
+            with self.assertNumQueries(1):
+                self.assertIsNone(_check(self.invoiced_policy))
+                self.assertTrue(_check(self.new_policy))
+                self.assertTrue(_check(self.other_policy))
+
+    def test_lines_of_type_above_limit_checked_in_database(self):
+        with patch.object(InvoiceConfig, 'invoiced_lines_prefetch_limit', 0), prefetch_invoiced_lines():
+            with self.assertNumQueries(4):
+                self.assertIsNone(_check(self.invoiced_policy))
+                self.assertTrue(_check(self.new_policy))
+                self.assertTrue(_check(self.other_policy))
+
+    def test_line_invoiced_in_block_not_converted_again(self):
+        with prefetch_invoiced_lines():
+            self.assertTrue(_check(self.new_policy))
+            mark_line_invoiced(self.new_policy)
+            with self.assertNumQueries(0):
+                self.assertIsNone(_check(self.new_policy))
+
+    @skipUnless(connection.vendor == 'postgresql', "Advisory locks require PostgreSQL")
+    def test_locked_lines_checked_in_database(self):
+        with prefetch_invoiced_lines(Policy, [self.new_policy.id]):
+            # Line invoiced by a concurrent transaction after the prefetch
+            create_test_invoice_line_item(
+                invoice=self.line_item.invoice, line_item=self.new_policy, user=self.user, code='LineItemNew')
+            self.assertTrue(_check(self.new_policy))
+            with lock_invoiced_lines(), CaptureQueriesContext(connection) as context:
+                self.assertIsNone(_check(self.new_policy))
+        self.assertIn('pg_advisory_xact_lock', context.captured_queries[0]['sql'])
+
+    def test_generation_checks_from_prefetched_lines(self):
+        _ConversionStub.policies = [self.invoiced_policy, self.new_policy, self.other_policy]
+
+        error = generate_chunk(_ConversionStub, self.user, date(2021, 1, 1), date(2021, 1, 31))
+
+        self.assertIsNone(error)
+        self.assertEqual(_ConversionStub.results, [None, True, True])
+        self.assertEqual(_ConversionStub.queries, 1)
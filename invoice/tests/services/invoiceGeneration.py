@@ -0,0 +1,174 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from unittest.mock import patch
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from core.forms import User
+from invoice.models import InvoiceGenerationRun
+from invoice.services import InvoiceGenerationService
+from invoice.utils import in_subject_partition
+
+
+class _CalculationStub:
+    """
+    Invoice service recording subject partitions generated, generation fails for partitions with failing indexes.
+    """
+    calls = []
+    failing = set()
+
+    def __init__(self, user):
+        self.user = user
+
+    def invoice_creation_from_calculation(self, user, from_date, to_date, subject_partition=None):
+        if subject_partition and subject_partition[0] in self.failing:
+            raise Exception(f"Calculation failed for partition {subject_partition[0]}")
+        self.calls.append((from_date, to_date, subject_partition))
+
+
+class _PeriodRuleStub:
+    """
+    Calculation rule invoicing every subject once, for the number of days of the period it's invoked for.
+    Invoiced subjects are skipped the way convert_to_invoice hook skips already invoiced lines.
+    """
+    subjects = [f'00000000-0000-0000-0000-{index:012d}' for index in range(20)]
+    invoiced = {}
+    partitioned = True
+
+    def __init__(self, user):
+        self.user = user
+
+    def invoice_creation_from_calculation(self, user, from_date, to_date, subject_partition=None):
+        for subject in self.subjects:
+            if self.partitioned and not in_subject_partition(subject, subject_partition):
+                continue
+            if subject not in self.invoiced:
+                self.invoiced[subject] = (to_date - from_date).days + 1
+
+
+class ServiceTestInvoiceGeneration(TestCase):
+    date_from = date(2021, 1, 1)
+    date_to = date(2021, 1, 31)
+
+    @classmethod
+    def setUpClass(cls):
+        super(ServiceTestInvoiceGeneration, cls).setUpClass()
+        if not User.objects.filter(username='admin_invoice').exists():
+            User.objects.create_superuser(username='admin_invoice', password='S\/pe®Pąßw0rd™')
+        cls.user = User.objects.filter(username='admin_invoice').first()
+
+    def setUp(self):
+        _CalculationStub.calls = []
+        _CalculationStub.failing = set()
+        _PeriodRuleStub.invoiced = {}
+        _PeriodRuleStub.partitioned = True
+
+    def test_split_subjects(self):
+        self.assertEqual(self._service().split_subjects(), [(0, 3), (1, 3), (2, 3)])
+        self.assertEqual(
+            InvoiceGenerationService(self.user, invoice_service_class=_CalculationStub).split_subjects(), [(0, 1)])
+
+    def test_unpartitioned_generation(self):
+        run = InvoiceGenerationService(self.user, invoice_service_class=_CalculationStub) \
+            .generate(self.date_from, self.date_to)
+
+        # Single partition is generated as before partitioning, without subject_partition argument
+        self.assertEqual(run.status, InvoiceGenerationRun.Status.COMPLETED)
+        self.assertEqual(_CalculationStub.calls, [(self.date_from, self.date_to, None)])
+
+    def test_partitions_invoice_same_amounts(self):
+        unpartitioned = self._invoiced_by_period_rule(partitions=1)
+        partitioned = self._invoiced_by_period_rule(partitions=3)
+        _PeriodRuleStub.partitioned = False
+        rule_without_partitions = self._invoiced_by_period_rule(partitions=3)
+
+        # Every partition is generated for the whole timeframe, all subjects are invoiced for the whole month
+        self.assertEqual(unpartitioned, {subject: 31 for subject in _PeriodRuleStub.subjects})
+        self.assertEqual(partitioned, unpartitioned)
+        self.assertEqual(rule_without_partitions, unpartitioned)
+
+    def test_in_subject_partition(self):
+        subject = _PeriodRuleStub.subjects[1]
+        partitions = [index for index in range(3) if in_subject_partition(subject, (index, 3))]
+
+        self.assertEqual(len(partitions), 1)
+        self.assertTrue(in_subject_partition(subject.upper(), (partitions[0], 3)))
+        self.assertTrue(in_subject_partition(subject, None))
+
+    def test_failed_chunk_recorded(self):
+        _CalculationStub.failing = {1}
+
+        run = self._service().generate(self.date_from, self.date_to)
+
+        self.assertEqual(run.status, InvoiceGenerationRun.Status.FAILED)
+        self.assertEqual(run.completed_chunks, [[0, 3]])
+        self.assertEqual(len(run.errors), 1)
+        self.assertEqual(run.errors[0]['chunk'], [1, 3])
+        self.assertIn('Calculation failed', run.errors[0]['error'])
+        # Chunks after the failed one are left for resume
+        self.assertEqual(_CalculationStub.calls, [(self.date_from, self.date_to, (0, 3))])
+
+    def test_resume_from_checkpoint(self):
+        _CalculationStub.failing = {1}
+        failed_run = self._service().generate(self.date_from, self.date_to)
+        _CalculationStub.failing = set()
+        _CalculationStub.calls = []
+
+        run = self._service().generate(self.date_from, self.date_to)
+
+        self.assertEqual(run.id, failed_run.id)
+        self.assertEqual(run.status, InvoiceGenerationRun.Status.COMPLETED)
+        self.assertEqual(run.errors, [])
+        self.assertEqual(len(run.completed_chunks), 3)
+        self.assertEqual(_CalculationStub.calls, [
+            (self.date_from, self.date_to, (1, 3)),
+            (self.date_from, self.date_to, (2, 3)),
+        ])
+
+    def test_running_run_not_resumed(self):
+        InvoiceGenerationRun.objects.create(date_from=self.date_from, date_to=self.date_to, user=self.user)
+
+        with self.assertRaises(ValidationError):
+            self._service().generate(self.date_from, self.date_to)
+        self.assertEqual(_CalculationStub.calls, [])
+
+    def test_parallel_results_merged(self):
+        def generate_chunk(invoice_service_class, user_id, from_date, to_date, subject_partition):
+            # Worker outcome without database access, threads don't see the test transaction
+            return "Calculation failed for partition 1" if subject_partition == (1, 3) else None
+
+        with patch.object(InvoiceGenerationService, '_executor', lambda self, workers: ThreadPoolExecutor(workers)), \
+                patch.object(InvoiceGenerationService, '_parallel_generation_supported', return_value=True), \
+                patch('invoice.worker.generate_chunk', generate_chunk):
+            run = self._service(workers=3).generate(self.date_from, self.date_to)
+
+        # Parallel run processes all chunks, failed chunks are recorded next to the completed ones
+        self.assertEqual(run.status, InvoiceGenerationRun.Status.FAILED)
+        self.assertCountEqual(run.completed_chunks, [[0, 3], [2, 3]])
+        self.assertEqual(run.errors, [{'chunk': [1, 3], 'error': 'Calculation failed for partition 1'}])
+
+    def test_parallel_generation_unsupported(self):
+        with patch.object(InvoiceGenerationService, '_parallel_generation_supported', return_value=False):
+            with self.assertRaises(ValidationError):
+                self._service(workers=3).generate(self.date_from, self.date_to)
+        self.assertEqual(_CalculationStub.calls, [])
+
+    def test_request_generates_sequentially(self):
+        with patch.object(InvoiceGenerationService, '_process_in_parallel') as process_in_parallel:
+            run = InvoiceGenerationService(self.user, invoice_service_class=_CalculationStub, partitions=3) \
+                .generate(self.date_from, self.date_to)
+
+        process_in_parallel.assert_not_called()
+        self.assertEqual(run.status, InvoiceGenerationRun.Status.COMPLETED)
+        self.assertEqual(len(_CalculationStub.calls), 3)
+
+    def _invoiced_by_period_rule(self, partitions):
+        _PeriodRuleStub.invoiced = {}
+        run = InvoiceGenerationService(self.user, invoice_service_class=_PeriodRuleStub, partitions=partitions) \
+            .generate(self.date_from, self.date_to)
+        self.assertEqual(run.status, InvoiceGenerationRun.Status.COMPLETED)
+        return dict(_PeriodRuleStub.invoiced)
+
+    def _service(self, **kwargs):
+        return InvoiceGenerationService(self.user, invoice_service_class=_CalculationStub, partitions=3, **kwargs)
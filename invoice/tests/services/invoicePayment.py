@@ -1,5 +1,9 @@
 import copy
 
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.core.exceptions import ValidationError
 from django.db import transaction
 from unittest import skip
 from policy.test_helpers import create_test_policy
@@ -227,6 +231,26 @@ class ServiceTestInvoicePayments(TestCase):
             self.assertEqual(payment.invoice.status, Invoice.Status.SUSPENDED)
             self.invoice.status = Invoice.Status.VALIDATED
 
+    def test_validate_payment_match_items(self):
+        payment = InvoicePayment(**{**self.BASE_TEST_INVOICE_PAYMENT_PAYLOAD, 'invoice': self.invoice})
+        partial_payment = InvoicePayment(**{**self.BASE_TEST_INVOICE_PAYMENT_PAYLOAD, 'invoice': self.invoice,
+                                            'amount_payed': Decimal('2.00')})
+
+        InvoicePaymentModelValidation._validate_payment_match_items(self.user, payment)
+        with self.assertRaisesMessage(ValidationError, str(InvoicePaymentModelValidation.AMOUNT_PAYED_NOT_MATCHING_ITEMS
+                                                           % {'invoice': self.invoice, 'expected': 91.5, 'payed': 2})):
+            InvoicePaymentModelValidation._validate_payment_match_items(self.user, partial_payment)
+
+    def test_validate_payment_missing_amount_total(self):
+        payment = InvoicePayment(**{**self.BASE_TEST_INVOICE_PAYMENT_PAYLOAD, 'invoice': self.invoice})
+
+        # Line item without amount total is reported by the aggregate, its NULL amount is simulated
+        with patch('invoice.validation.invoicePayment.aggregate_line_items_amount',
+                   return_value=(Decimal('91.50'), 1, 1)), \
+                self.assertRaisesMessage(ValidationError, str(InvoicePaymentModelValidation.INVALID_AMOUNT_TOTAL
+                                                              % {'invoice': self.invoice})):
+            InvoicePaymentModelValidation._validate_payment_match_items(self.user, payment)
+
     def _create_payment(self, args):
         payment = InvoicePayment(**args)
         payment.invoice = self.invoice
@@ -0,0 +1,42 @@
+from django.test import TestCase
+
+from invoice.gql.aggregate import aggregate_generic_invoices
+from invoice.models import Invoice, InvoiceRollup
+from invoice.services.invoiceRollup import InvoiceRollupService
+from invoice.tests.helpers import create_test_invoice
+
+
+class ServiceTestInvoiceRollup(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(ServiceTestInvoiceRollup, cls).setUpClass()
+        cls.invoice = create_test_invoice(code='ROLLUP_INV_1', amount_total=20.1)
+        InvoiceRollupService.rebuild(['invoice.invoice'])
+
+    def test_rebuild(self):
+        self.assertEqual(self._rollup_aggregate(), self._invoice_aggregate())
+
+    def test_track_status_change(self):
+        with InvoiceRollupService.track(Invoice, [self.invoice.id]):
+            Invoice.objects.filter(id=self.invoice.id).update(status=Invoice.Status.PAID)
+        self.assertEqual(self._rollup_aggregate(), self._invoice_aggregate())
+        paid = [row for row in self._rollup_aggregate() if row['status'] == Invoice.Status.PAID]
+        self.assertEqual(sum(row['count'] for row in paid),
+                         Invoice.objects.filter(status=Invoice.Status.PAID, is_deleted=False).count())
+
+    def test_added_documents_increment_row_of_key(self):
+        invoice = create_test_invoice(code='ROLLUP_INV_2', amount_total=10.0)
+        InvoiceRollupService.add(Invoice, [invoice.id])
+        self.assertEqual(self._rollup_aggregate(), self._invoice_aggregate())
+        key_rows = InvoiceRollup.objects.filter(
+            document_type=InvoiceRollup.DocumentType.INVOICE, day=invoice.date_invoice, status=invoice.status,
+            currency_code=invoice.currency_code or '', subject_type_id=invoice.subject_type_id)
+        self.assertEqual(key_rows.count(), 1)
+
+    def _rollup_aggregate(self):
+        rows = InvoiceRollupService.aggregate(InvoiceRollup.DocumentType.INVOICE, {'period': 'month'}, 'date_invoice')
+        return [{key: value for key, value in row.items() if key != 'fees'} for row in rows]
+
+    def _invoice_aggregate(self):
+        return aggregate_generic_invoices(Invoice.objects.all(), 'date_invoice', 'month')
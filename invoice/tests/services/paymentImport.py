@@ -0,0 +1,71 @@
+import io
+
+from django.test import TestCase
+
+from core.forms import User
+from invoice.models import PaymentInvoice, DetailPaymentInvoice
+from invoice.payment_statements import CSV, CAMT053, MT940, parse_statement
+from invoice.services.paymentImport import PaymentImportService
+
+
+class ServiceTestPaymentImport(TestCase):
+    CSV_STATEMENT = b"code_ext,amount_received,fees,date_payment,payer_ref,payer_name,reference\n" \
+                    b"IMP_1,91.50,1.00,2022-04-11,PAYER_1,Payer,INV-1\n" \
+                    b"IMP_2,abc,,2022-04-11,PAYER_2,Payer,INV-2\n" \
+                    b"IMP_1,91.50,,2022-04-11,PAYER_1,Payer,INV-1\n"
+
+    CAMT053_STATEMENT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Document xmlns="urn:iso:std:iso:20022:tech:xsd:camt.053.001.02"><BkToCstmrStmt><Stmt>
+<Ntry><Amt Ccy="EUR">100.50</Amt><CdtDbtInd>CRDT</CdtDbtInd><BookgDt><Dt>2022-04-11</Dt></BookgDt>
+<AcctSvcrRef>CAMT_1</AcctSvcrRef><NtryDtls><TxDtls><RltdPties><Dbtr><Nm>Payer</Nm></Dbtr>
+<DbtrAcct><Id><IBAN>IBAN_1</IBAN></Id></DbtrAcct></RltdPties><RmtInf><Ustrd>INV-1</Ustrd></RmtInf>
+</TxDtls></NtryDtls></Ntry>
+<Ntry><Amt Ccy="EUR">5.00</Amt><CdtDbtInd>DBIT</CdtDbtInd></Ntry>
+</Stmt></BkToCstmrStmt></Document>"""
+
+    MT940_STATEMENT = b""":20:STATEMENT
+:25:ACCOUNT
+:60F:C220410EUR1000,00
+:61:2204110411C150,25NTRFINV-2//MT_1
+:86:Payment for INV-2
+:61:2204110411D10,00NTRFNONREF
+:62F:C220411EUR1140,25
+"""
+
+    @classmethod
+    def setUpClass(cls):
+        super(ServiceTestPaymentImport, cls).setUpClass()
+        if not User.objects.filter(username='admin_invoice').exists():
+            User.objects.create_superuser(username='admin_invoice', password='S\/pe®Pąßw0rd™')
+        cls.user = User.objects.filter(username='admin_invoice').first()
+
+    def test_parse_camt053(self):
+        lines = list(parse_statement(io.BytesIO(self.CAMT053_STATEMENT), CAMT053))
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['code_ext'], 'CAMT_1')
+        self.assertEqual(lines[0]['amount_received'], '100.50')
+        self.assertEqual(lines[0]['payer_ref'], 'IBAN_1')
+        self.assertEqual(lines[0]['reference'], 'INV-1')
+        self.assertIn('skip', lines[1])
+
+    def test_parse_mt940(self):
+        lines = list(parse_statement(io.BytesIO(self.MT940_STATEMENT), MT940))
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['code_ext'], 'MT_1')
+        self.assertEqual(lines[0]['amount_received'], '150.25')
+        self.assertEqual(lines[0]['date_payment'], '2022-04-11')
+        self.assertEqual(lines[0]['reference'], 'Payment for INV-2')
+        self.assertIn('skip', lines[1])
+
+    def test_import_csv(self):
+        report = io.StringIO()
+        summary = PaymentImportService(self.user).import_statement(io.BytesIO(self.CSV_STATEMENT), CSV, report)
+        self.assertEqual(summary, {'created': 1, 'duplicate': 1, 'skipped': 0, 'failed': 1})
+        payment = PaymentInvoice.objects.get(code_ext='IMP_1')
+        self.assertEqual(payment.reconciliation_status, PaymentInvoice.ReconciliationStatus.NOT_RECONCILIATED)
+        self.assertEqual(payment.json_ext['statement']['reference'], 'INV-1')
+        self.assertEqual(DetailPaymentInvoice.objects.filter(payment=payment).count(), 1)
+        self.assertEqual(len(report.getvalue().splitlines()), 4)
+
+        summary = PaymentImportService(self.user).import_statement(io.BytesIO(self.CSV_STATEMENT), CSV)
+        self.assertEqual(summary, {'created': 0, 'duplicate': 2, 'skipped': 0, 'failed': 1})
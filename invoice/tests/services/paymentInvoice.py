@@ -1,19 +1,28 @@
 from datetime import date
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.test import TestCase
 
 from contract.tests.helpers import create_test_contract
 from core.forms import User
+from core.service_signals import ServiceSignalBindType
+from core.signals import REGISTERED_SERVICE_SIGNALS, bind_service_signal
 from insuree.test_helpers import create_test_insuree
 from invoice.models import Invoice, PaymentInvoice, DetailPaymentInvoice
 from invoice.services.paymentInvoice import PaymentInvoiceService
 from invoice.tests.helpers import (
+    create_test_bill,
+    create_test_bill_line_item,
     create_test_invoice,
     create_test_invoice_line_item,
     DEFAULT_TEST_PAYMENT_INVOICE_PAYLOAD,
     DEFAULT_TEST_DETAIL_PAYMENT_INVOICE_PAYLOAD
 )
+from invoice.utils import resolve_payments_details_ids
 from invoice.validation.paymentInvoice import PaymentInvoiceModelValidation
 from product.test_helpers import create_test_product
 from policy.test_helpers import create_test_policy
@@ -89,6 +98,59 @@ class ServiceTestPaymentInvoice(TestCase):
             DetailPaymentInvoice.objects.filter(payment__code_ext=payment.code_ext).delete()
             PaymentInvoice.objects.filter(code_ext=payment.code_ext).delete()
 
+    def test_payments_received(self):
+        payment_received_receiver = MagicMock(return_value=None)
+        bind_service_signal('signal_after_invoice_module_payment_received', payment_received_receiver,
+                            bind_type=ServiceSignalBindType.AFTER)
+        with transaction.atomic():
+            payment, payment_detail = self._create_payment(
+                DEFAULT_TEST_PAYMENT_INVOICE_PAYLOAD,
+                DEFAULT_TEST_DETAIL_PAYMENT_INVOICE_PAYLOAD
+            )
+            invalid_payload = DEFAULT_TEST_PAYMENT_INVOICE_PAYLOAD.copy()
+            invalid_payload['amount_received'] = 2.0
+            invalid_payment, invalid_payment_detail = self._create_payment(
+                invalid_payload,
+                DEFAULT_TEST_DETAIL_PAYMENT_INVOICE_PAYLOAD
+            )
+            out = self.payment_invoice_service.payments_received([
+                (payment, DetailPaymentInvoice.DetailPaymentStatus.ACCEPTED),
+                (invalid_payment, DetailPaymentInvoice.DetailPaymentStatus.ACCEPTED),
+            ])
+            self.assertTrue(out[0]['success'])
+            self.assertFalse(out[1]['success'])
+            # Receivers of the single payment signal are notified about every payment of the batch
+            self.assertEqual(payment_received_receiver.call_count, 2)
+            payment_received_receiver.assert_any_call(
+                signal=REGISTERED_SERVICE_SIGNALS['signal_after_invoice_module_payment_received']
+                .after_service_signal,
+                sender=self.payment_invoice_service,
+                cls_=self.payment_invoice_service,
+                data=[(payment, DetailPaymentInvoice.DetailPaymentStatus.ACCEPTED), {}],
+                context=None,
+                result=out[0]
+            )
+            self.invoice.refresh_from_db()
+            self.assertEqual(self.invoice.status, Invoice.Status.PAID)
+            DetailPaymentInvoice.objects.filter(payment__code_ext=payment.code_ext).delete()
+            PaymentInvoice.objects.filter(code_ext=payment.code_ext).delete()
+
+    def test_payment_refunded_history(self):
+        with transaction.atomic():
+            payment, payment_detail = self._create_payment(
+                DEFAULT_TEST_PAYMENT_INVOICE_PAYLOAD,
+                DEFAULT_TEST_DETAIL_PAYMENT_INVOICE_PAYLOAD
+            )
+            history_count = payment_detail.history.count()
+            self.payment_invoice_service.payment_refunded(payment)
+            detail_payment_invoice = DetailPaymentInvoice.objects.get(id=payment_detail.id)
+            self.assertEqual(detail_payment_invoice.version, payment_detail.version + 1)
+            self.assertEqual(detail_payment_invoice.history.count(), history_count + 1)
+            self.assertEqual(detail_payment_invoice.history.first().status,
+                             DetailPaymentInvoice.DetailPaymentStatus.REFUNDED)
+            DetailPaymentInvoice.objects.filter(payment__code_ext=payment.code_ext).delete()
+            PaymentInvoice.objects.filter(code_ext=payment.code_ext).delete()
+
     def test_payment_received_invalid_amount(self):
         with transaction.atomic():
             payload = DEFAULT_TEST_PAYMENT_INVOICE_PAYLOAD.copy()
@@ -134,6 +196,91 @@ class ServiceTestPaymentInvoice(TestCase):
             DetailPaymentInvoice.objects.filter(payment__code_ext=payment.code_ext).delete()
             PaymentInvoice.objects.filter(code_ext=payment.code_ext).delete()
 
+    def test_resolve_payments_details_ids_mixed_subjects(self):
+        other_invoice = create_test_invoice(
+            self.contract, self.insuree, code='INVOICE_CODE_RESOLVE', code_ext='INVOICE_CODE_RESOLVE_EXT')
+        other_invoice_item = create_test_invoice_line_item(
+            invoice=other_invoice, line_item=self.policy, user=self.user, code='LineItemResolve')
+        bill = create_test_bill(self.contract, self.insuree, user=self.user, code='BILL_CODE_RESOLVE')
+        other_bill = create_test_bill(self.contract, self.insuree, user=self.user, code='BILL_CODE_RESOLVE_2')
+        other_bill_item = create_test_bill_line_item(
+            bill=other_bill, line_item=self.policy, user=self.user, code='BillItemResolve')
+        payment = PaymentInvoice(**DEFAULT_TEST_PAYMENT_INVOICE_PAYLOAD)
+        payment.save(username=self.user.username)
+        # Subject ids stored in other formats than the canonical UUID string
+        for subject, subject_id in (
+                (self.invoice, str(self.invoice.id)),
+                (self.invoice_line_item, str(self.invoice_line_item.id).upper()),
+                (other_invoice_item, other_invoice_item.id.hex),
+                (bill, str(bill.id).upper()),
+                (other_bill_item, str(other_bill_item.id))):
+            detail = DetailPaymentInvoice(**{
+                **DEFAULT_TEST_DETAIL_PAYMENT_INVOICE_PAYLOAD,
+                'subject_type': ContentType.objects.get_for_model(subject),
+                'subject_id': subject_id,
+            })
+            detail.payment = payment
+            detail.save(username=self.user.username)
+
+        invoice_ids, bill_ids = resolve_payments_details_ids([payment.id])[payment.id]
+
+        self.assertEqual(invoice_ids, {self.invoice.id, other_invoice.id})
+        self.assertEqual(bill_ids, {bill.id, other_bill.id})
+
+    def test_validate_payment_invoices_and_bills(self):
+        bill = create_test_bill(self.contract, self.insuree, user=self.user, code='BILL_CODE_VALIDATE')
+        create_test_bill_line_item(bill=bill, line_item=self.policy, user=self.user, code='BillItemValidate')
+        payment = self._create_payment_with_subjects(Decimal('183.00'), [self.invoice, bill])
+        partial_payment = self._create_payment_with_subjects(Decimal('91.50'), [self.invoice, bill])
+
+        # Line items of invoices and bills are summed up together
+        PaymentInvoiceModelValidation.validate_receive_payment(self.user, payment)
+        not_matching = str(PaymentInvoiceModelValidation.AMOUNT_PAYED_NOT_MATCHING_ITEMS % {
+            'payment_invoice': partial_payment, 'expected': 183, 'payed': partial_payment.amount_received})
+        with self.assertRaisesMessage(ValidationError, not_matching):
+            PaymentInvoiceModelValidation.validate_receive_payment(self.user, partial_payment)
+
+        payments = [payment, partial_payment]
+        errors = PaymentInvoiceModelValidation.validate_receive_payments(
+            self.user, payments, resolve_payments_details_ids([payment.id for payment in payments]))
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], ValidationError)
+
+    def test_validate_payment_missing_amounts(self):
+        empty_invoice = create_test_invoice(
+            self.contract, self.insuree, code='INVOICE_CODE_EMPTY', code_ext='INVOICE_CODE_EMPTY_EXT')
+        empty_payment = self._create_payment_with_subjects(Decimal('91.50'), [empty_invoice])
+        payment = self._create_payment_with_subjects(Decimal('91.50'), [self.invoice])
+        invalid_amount_total = str(PaymentInvoiceModelValidation.INVALID_AMOUNT_TOTAL % {'payment_invoice': payment})
+
+        # Payment of an invoice without line items can't be validated
+        with self.assertRaisesMessage(ValidationError, str(
+                PaymentInvoiceModelValidation.INVALID_AMOUNT_TOTAL % {'payment_invoice': empty_payment})):
+            PaymentInvoiceModelValidation.validate_receive_payment(self.user, empty_payment)
+        # Line items without amount total are reported by the aggregates, their NULL amounts are simulated
+        with patch('invoice.validation.paymentInvoice.aggregate_line_items_amount',
+                   return_value=(Decimal('91.50'), 1, 1)), \
+                self.assertRaisesMessage(ValidationError, invalid_amount_total):
+            PaymentInvoiceModelValidation.validate_receive_payment(self.user, payment)
+        with patch('invoice.validation.paymentInvoice.aggregate_line_items_amount_by_parent',
+                   return_value={str(self.invoice.id): (Decimal('91.50'), 1, 1)}):
+            errors = PaymentInvoiceModelValidation.validate_receive_payments(
+                self.user, [payment], resolve_payments_details_ids([payment.id]))
+        self.assertEqual(errors[0].messages, [invalid_amount_total])
+
+    def _create_payment_with_subjects(self, amount_received, subjects):
+        payment = PaymentInvoice(**{**DEFAULT_TEST_PAYMENT_INVOICE_PAYLOAD, 'amount_received': amount_received})
+        payment.save(username=self.user.username)
+        for subject in subjects:
+            detail = DetailPaymentInvoice(**{
+                **DEFAULT_TEST_DETAIL_PAYMENT_INVOICE_PAYLOAD,
+                'subject_type': ContentType.objects.get_for_model(subject),
+                'subject_id': str(subject.id),
+            })
+            detail.payment = payment
+            detail.save(username=self.user.username)
+        return payment
+
     def _create_payment(self, payment, payment_detail):
         payment = PaymentInvoice(**payment)
         payment.invoice = self.invoice
@@ -0,0 +1,61 @@
+from django.test import TestCase
+
+from core.forms import User
+from invoice.models import PaymentInvoice, DetailPaymentInvoice
+from invoice.services.paymentMatching import PaymentMatchingService
+from invoice.tests.helpers import create_test_invoice, DEFAULT_TEST_PAYMENT_INVOICE_PAYLOAD
+
+
+class ServiceTestPaymentMatching(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(ServiceTestPaymentMatching, cls).setUpClass()
+        if not User.objects.filter(username='admin_invoice').exists():
+            User.objects.create_superuser(username='admin_invoice', password='S\/pe®Pąßw0rd™')
+        cls.user = User.objects.filter(username='admin_invoice').first()
+        cls.invoice = create_test_invoice(code='MATCH_INV_1', code_ext='MATCH_INV_EXT_1', amount_total=20.1)
+
+    def test_match(self):
+        matched = self._create_payment('MATCH_PAY_1', 'Invoice MATCH_INV_1', 20.1)
+        unmatched_amount = self._create_payment('MATCH_PAY_2', 'Invoice MATCH_INV_EXT_1', 30.0)
+
+        summary = PaymentMatchingService(self.user).match()
+
+        self.assertEqual(summary['matched'], 1)
+        matched.refresh_from_db()
+        self.assertEqual(matched.reconciliation_status, PaymentInvoice.ReconciliationStatus.RECONCILIATED)
+        detail = DetailPaymentInvoice.objects.get(payment=matched)
+        self.assertEqual(detail.subject_id, str(self.invoice.id))
+        self.assertEqual(detail.reconcilation_id, summary['reconciliation_id'])
+
+        unmatched_amount.refresh_from_db()
+        self.assertEqual(unmatched_amount.reconciliation_status,
+                         PaymentInvoice.ReconciliationStatus.NOT_RECONCILIATED)
+        self.assertIsNone(DetailPaymentInvoice.objects.get(payment=unmatched_amount).subject_id)
+
+    def test_free_text_words_are_not_references(self):
+        create_test_invoice(code='PAYMENT', code_ext='MATCH_INV_EXT_2', amount_total=15.0)
+        payment = self._create_payment('MATCH_PAY_3', 'Payment for January', 15.0)
+
+        summary = PaymentMatchingService(self.user).match()
+
+        # Only words looking like document codes are looked up, "Payment" doesn't match invoice PAYMENT
+        self.assertEqual(summary['matched'], 0)
+        payment.refresh_from_db()
+        self.assertEqual(payment.reconciliation_status, PaymentInvoice.ReconciliationStatus.NOT_RECONCILIATED)
+
+    def _create_payment(self, code_ext, reference, amount):
+        payload = DEFAULT_TEST_PAYMENT_INVOICE_PAYLOAD.copy()
+        payload['code_ext'] = code_ext
+        payload['amount_received'] = amount
+        payload['json_ext'] = {'statement': {'reference': reference}}
+        payment = PaymentInvoice(**payload)
+        payment.save(username=self.user.username)
+        detail = DetailPaymentInvoice(
+            payment=payment,
+            status=DetailPaymentInvoice.DetailPaymentStatus.ACCEPTED,
+            amount=amount
+        )
+        detail.save(username=self.user.username)
+        return payment
@@ -1,8 +1,15 @@
 import re
+import uuid
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
+from django.db import connection
+from django.db.models import Count, Q, Sum
 
+from invoice.apps import InvoiceConfig
 from invoice.models import (
     DetailPaymentInvoice,
     Invoice,
@@ -14,6 +21,12 @@ from invoice.models import (
 camel_pat = re.compile(r'([A-Z])')
 under_pat = re.compile(r'_([a-z])')
 
+# content type id -> (candidate line ids or None for all lines of the type, line ids already invoiced),
+# None outside of prefetch_invoiced_lines
+_prefetched_invoiced_lines = ContextVar('prefetched_invoiced_lines', default=None)
+# True inside lock_invoiced_lines
+_locked_invoiced_lines = ContextVar('locked_invoiced_lines', default=False)
+
 
 def camel_to_underscore(name):
     return camel_pat.sub(lambda x: '_' + x.group(1).lower(), name)
@@ -24,17 +37,182 @@ def underscore_to_camel(name):
 
 
 def resolve_payment_details(payment_invoice):
-    invoice_list = _retrieve_list_of_invoices_bills(payment_invoice, Invoice)
-    invoice_line_item_list = _retrieve_list_of_invoices_bills(payment_invoice, InvoiceLineItem)
-    invoices = Invoice.objects.filter(Q(id__in=invoice_list) | Q(line_items__id__in=invoice_line_item_list))
-    bill_list = _retrieve_list_of_invoices_bills(payment_invoice, Bill)
-    bill_line_item_list = _retrieve_list_of_invoices_bills(payment_invoice, BillItem)
-    bills = Bill.objects.filter(Q(id__in=bill_list) | Q(line_items_bill__id__in=bill_line_item_list))
-    return invoices, bills
-
-
-def _retrieve_list_of_invoices_bills(payment_invoice, model_type):
-    return list(DetailPaymentInvoice.objects.filter(
-        payment=payment_invoice,
-        subject_type=ContentType.objects.get_for_model(model_type).id
-    ).values_list('subject_id', flat=True))
+    invoice_ids, bill_ids = resolve_payments_details_ids([payment_invoice.id])[payment_invoice.id]
+    return Invoice.objects.filter(id__in=invoice_ids), Bill.objects.filter(id__in=bill_ids)
+
+
+def resolve_payments_details_ids(payment_ids):
+    """
+    Resolve ids of invoices and bills paid by the given payments. Subjects of all details are fetched at once
+    and grouped by content type, subjects being line items are resolved to their parent invoice/bill ids with
+    a single query for all payments.
+    @return: Dict payment id -> (set of invoice ids, set of bill ids)
+    """
+    subjects = defaultdict(lambda: defaultdict(set))
+    details = DetailPaymentInvoice.objects \
+        .filter(payment_id__in=payment_ids) \
+        .values_list('payment_id', 'subject_type_id', 'subject_id')
+    for payment_id, subject_type_id, subject_id in details:
+        # Subject ids are stored as strings, compared as UUIDs regardless of their formatting
+        subject_uuid = _as_uuid(subject_id)
+        if subject_uuid:
+            subjects[payment_id][subject_type_id].add(subject_uuid)
+    invoice_ids = _resolve_generic_invoices_ids(subjects, Invoice, InvoiceLineItem, 'invoice_id')
+    bill_ids = _resolve_generic_invoices_ids(subjects, Bill, BillItem, 'bill_id')
+    return {payment_id: (invoice_ids.get(payment_id, set()), bill_ids.get(payment_id, set()))
+            for payment_id in payment_ids}
+
+
+def _resolve_generic_invoices_ids(subjects, model_type, line_item_model_type, relation):
+    content_type_id = ContentType.objects.get_for_model(model_type).id
+    line_item_content_type_id = ContentType.objects.get_for_model(line_item_model_type).id
+    line_item_ids = set().union(*(payment_subjects.get(line_item_content_type_id, ())
+                                  for payment_subjects in subjects.values()))
+    parents = {}
+    if line_item_ids:
+        parents = dict(line_item_model_type.objects
+                       .filter(id__in=line_item_ids)
+                       .values_list('id', relation))
+    return {
+        payment_id: set(payment_subjects.get(content_type_id, ())) | {
+            parents[line_item_id] for line_item_id in payment_subjects.get(line_item_content_type_id, ())
+            if line_item_id in parents
+        }
+        for payment_id, payment_subjects in subjects.items()
+    }
+
+
+def in_subject_partition(subject_id, subject_partition):
+    """
+    Whether the subject belongs to subject_partition (partition index, number of partitions) passed to receivers of
+    invoice_creation_from_calculation. Subjects are assigned by their id, a subject always falls into the same
+    partition regardless of the formatting of its id.
+    """
+    if not subject_partition:
+        return True
+    index, partitions = subject_partition
+    key = str(_as_uuid(subject_id) or subject_id)
+    return zlib.crc32(key.encode()) % partitions == index
+
+
+def _as_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def aggregate_line_items_amount(line_items):
+    """
+    Sum of amount_total of line items computed in the database, together with the number of line items
+    and the number of line items without amount_total.
+    @return: Tuple (total, number of line items, number of line items without amount total)
+    """
+    result = line_items.aggregate(
+        total=Sum('amount_total'),
+        count=Count('id'),
+        missing=Count('id', filter=Q(amount_total__isnull=True))
+    )
+    return result['total'] or 0, result['count'] or 0, result['missing'] or 0
+
+
+def aggregate_line_items_amount_by_parent(line_items, relation):
+    """
+    Same as aggregate_line_items_amount, grouped by invoice (bill) the line items belong to.
+    @return: Dict parent id -> (total, number of line items, number of line items without amount total)
+    """
+    rows = line_items \
+        .order_by() \
+        .values(relation) \
+        .annotate(
+            total=Sum('amount_total'),
+            count=Count('id'),
+            missing=Count('id', filter=Q(amount_total__isnull=True))
+        )
+    return {str(row[relation]): (row['total'] or 0, row['count'], row['missing']) for row in rows}
+
+
+@contextmanager
+def prefetch_invoiced_lines(model_type=None, line_ids=None):
+    """
+    Load with a single query which lines of model_type are already invoiced, out of line_ids. Inside the block
+    is_line_invoiced answers for those lines from memory, other lines are checked in the database.
+    Without line_ids (e.g. for the convert_to_invoice hook during invoice generation, where converted lines aren't
+    known upfront) all invoiced lines of the type are loaded, but only up to invoiced_lines_prefetch_limit lines.
+    Types with more invoiced lines are checked in the database line by line. Without model_type the invoiced lines
+    of a type are loaded this way on the first check of a line of that type.
+    """
+    prefetched = dict(_prefetched_invoiced_lines.get() or {})
+    if model_type is not None:
+        content_type = ContentType.objects.get_for_model(model_type)
+        prefetched[content_type.id] = _load_invoiced_lines(content_type, line_ids)
+    token = _prefetched_invoiced_lines.set(prefetched)
+    try:
+        yield
+    finally:
+        _prefetched_invoiced_lines.reset(token)
+
+
+def _load_invoiced_lines(content_type, line_ids=None):
+    line_items = InvoiceLineItem.objects.filter(line_type=content_type)
+    if line_ids is not None:
+        candidates = {str(line_id) for line_id in line_ids}
+        return candidates, set(line_items.filter(line_id__in=candidates).values_list('line_id', flat=True))
+    # Invoiced lines of the whole type are held in memory only up to the limit, no line is a candidate above it
+    limit = InvoiceConfig.invoiced_lines_prefetch_limit
+    invoiced = set(line_items.values_list('line_id', flat=True)[:limit + 1])
+    if len(invoiced) > limit:
+        return (), set()
+    return None, invoiced
+
+
+def _get_prefetched_invoiced_lines(content_type):
+    prefetched = _prefetched_invoiced_lines.get()
+    if prefetched is None:
+        return (), set()
+    if content_type.id not in prefetched:
+        prefetched[content_type.id] = _load_invoiced_lines(content_type)
+    return prefetched[content_type.id]
+
+
+@contextmanager
+def lock_invoiced_lines():
+    """
+    Inside the block every line checked by is_line_invoiced is locked with a PostgreSQL advisory lock held until
+    the end of the transaction, and checked in the database rather than in prefetched lines. Concurrent transactions
+    (e.g. workers of parallel invoice generation) then can't both find a line not invoiced and invoice it twice,
+    the second one waits for the first to commit and finds the line invoiced.
+    """
+    token = _locked_invoiced_lines.set(True)
+    try:
+        yield
+    finally:
+        _locked_invoiced_lines.reset(token)
+
+
+def _lock_line(content_type, line_id):
+    # Single bigint key, content type id in the high and checksum of the line id in the low 32 bits
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [(content_type.id << 32) | zlib.crc32(line_id.encode())])
+
+
+def is_line_invoiced(instance):
+    content_type = ContentType.objects.get_for_model(instance.__class__)
+    line_id = str(instance.id)
+    if _locked_invoiced_lines.get():
+        _lock_line(content_type, line_id)
+        return InvoiceLineItem.objects.filter(line_type=content_type, line_id=line_id).exists()
+    candidates, invoiced = _get_prefetched_invoiced_lines(content_type)
+    if candidates is None or line_id in candidates:
+        return line_id in invoiced
+    return InvoiceLineItem.objects.filter(line_type=content_type, line_id=line_id).exists()
+
+
+def mark_line_invoiced(instance):
+    if _locked_invoiced_lines.get():
+        # Locked lines are always checked in the database
+        return
+    content_type = ContentType.objects.get_for_model(instance.__class__)
+    candidates, invoiced = _get_prefetched_invoiced_lines(content_type)
+    if candidates is None or str(instance.id) in candidates:
+        invoiced.add(str(instance.id))
@@ -44,6 +44,29 @@ class BaseInvoiceValidation(BaseModelValidation, UniqueCodeValidationMixin,
         cls.validate_unique_code_name(data.get('code', None))
         cls.validate_tax_analysis_format(data.get('tax_analysis', None))
 
+    @classmethod
+    def validate_create_batch(cls, user, objs_data):
+        """
+        Validate many create payloads at once. Code uniqueness is checked with a single query for all payloads.
+        @return: List with ValidationError or None for every payload, in the order of objs_data.
+        """
+        codes = [data.get('code', None) for data in objs_data]
+        taken_codes = set(cls.OBJECT_TYPE.objects
+                          .filter(code__in=[code for code in codes if code])
+                          .values_list('code', flat=True))
+        errors = []
+        for data, code in zip(objs_data, codes):
+            try:
+                if code and code in taken_codes:
+                    raise ValidationError(cls.CODE_DUPLICATE_MSG % {'code': code})
+                cls.validate_tax_analysis_format(data.get('tax_analysis', None))
+                if code:
+                    taken_codes.add(code)
+                errors.append(None)
+            except ValidationError as exc:
+                errors.append(exc)
+        return errors
+
     @classmethod
     def validate_update(cls, user, **data):
         cls.validate_object_exists(data.get('id', None))
@@ -1,6 +1,7 @@
 from django.core.exceptions import ValidationError
 
 from invoice.models import InvoicePayment
+from invoice.utils import aggregate_line_items_amount
 from core.validation import BaseModelValidation, UniqueCodeValidationMixin, ObjectExistsValidationMixin
 from django.utils.translation import gettext as _
 
@@ -52,12 +53,11 @@ class InvoicePaymentModelValidation(BaseModelValidation, UniqueCodeValidationMix
 
     @classmethod
     def _validate_payment_match_items(cls, user, invoice_payment: InvoicePayment):
-        line_items = [x.amount_total for x in invoice_payment.invoice.line_items.all()]
-        if None in line_items:
+        expected_amount, _count, missing = aggregate_line_items_amount(invoice_payment.invoice.line_items.all())
+        if missing:
             raise ValidationError(cls.INVALID_AMOUNT_TOTAL % {
                 'invoice': invoice_payment.invoice
             })
-        expected_amount = sum(line_items)
         if expected_amount != invoice_payment.amount_payed:
             raise ValidationError(cls.AMOUNT_PAYED_NOT_MATCHING_ITEMS % {
                 'invoice': invoice_payment.invoice,
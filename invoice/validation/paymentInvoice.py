@@ -2,8 +2,9 @@ from django.core.exceptions import ValidationError
 from django.utils.translation import gettext as _
 
 from core.validation import BaseModelValidation, UniqueCodeValidationMixin, ObjectExistsValidationMixin
-from invoice.models import PaymentInvoice
-from invoice.utils import resolve_payment_details
+from invoice.models import PaymentInvoice, InvoiceLineItem, BillItem
+from invoice.utils import resolve_payment_details, aggregate_line_items_amount, \
+    aggregate_line_items_amount_by_parent
 from invoice.validation.paymentStatusValidation import InvoicePaymentReceiveStatusValidator, \
     InvoicePaymentRefundStatusValidator, InvoicePaymentCancelStatusValidator
 
@@ -49,26 +50,58 @@ class PaymentInvoiceModelValidation(BaseModelValidation, UniqueCodeValidationMix
     def validate_cancel_payment(cls, user, invoice_payment):
         InvoicePaymentCancelStatusValidator(invoice_payment)()
 
+    @classmethod
+    def validate_receive_payments(cls, user, payments, payments_details):
+        """
+        Validate amounts of many payments, line items of all linked invoices and bills are aggregated
+        with one query per model.
+        @param payments_details: Dict payment id -> (invoice ids, bill ids), see resolve_payments_details_ids
+        @return: List of ValidationError or None, one for every payment
+        """
+        invoice_ids = set().union(*(invoice_ids for invoice_ids, _ in payments_details.values()))
+        bill_ids = set().union(*(bill_ids for _, bill_ids in payments_details.values()))
+        invoice_amounts = aggregate_line_items_amount_by_parent(
+            InvoiceLineItem.objects.filter(invoice_id__in=invoice_ids), 'invoice_id')
+        bill_amounts = aggregate_line_items_amount_by_parent(
+            BillItem.objects.filter(bill_id__in=bill_ids), 'bill_id')
+
+        errors = []
+        for payment in payments:
+            payment_invoice_ids, payment_bill_ids = payments_details[payment.id]
+            amounts = [invoice_amounts.get(str(id_), (0, 0, 0)) for id_ in payment_invoice_ids] \
+                + [bill_amounts.get(str(id_), (0, 0, 0)) for id_ in payment_bill_ids]
+            expected_amount, count, missing = (sum(values) for values in zip((0, 0, 0), *amounts))
+            try:
+                cls._validate_payment_amount(payment, expected_amount, count, missing)
+                errors.append(None)
+            except ValidationError as error:
+                errors.append(error)
+        return errors
+
     @classmethod
     def _validate_payment_match_items(cls, user, payment_invoice: PaymentInvoice):
         invoices, bills = resolve_payment_details(payment_invoice)
-        line_items = []
-        for invoice in invoices:
-            line_items += [x.amount_total for x in invoice.line_items.all()]
-        for bill in bills:
-            line_items += [x.amount_total for x in bill.line_items_bill.all()]
-        if len(line_items) == 0:
-            raise ValidationError(cls.INVALID_AMOUNT_TOTAL % {
-                'payment_invoice': payment_invoice
-            })
-        if None in line_items:
+        expected_amount, count, missing = cls._aggregate_payment_items(invoices, bills)
+        cls._validate_payment_amount(payment_invoice, expected_amount, count, missing)
+
+    @classmethod
+    def _validate_payment_amount(cls, payment_invoice, expected_amount, count, missing):
+        if count == 0 or missing:
             raise ValidationError(cls.INVALID_AMOUNT_TOTAL % {
                 'payment_invoice': payment_invoice
             })
-        expected_amount = sum(line_items)
         if expected_amount != payment_invoice.amount_received:
             raise ValidationError(cls.AMOUNT_PAYED_NOT_MATCHING_ITEMS % {
                 'payment_invoice': payment_invoice,
                 'expected': expected_amount,
                 'payed': payment_invoice.amount_received
             })
+
+    @classmethod
+    def _aggregate_payment_items(cls, invoices, bills):
+        # No query is executed for invoices (bills) when none is linked to the payment, the id__in filter is empty
+        invoice_total, invoice_count, invoice_missing = \
+            aggregate_line_items_amount(InvoiceLineItem.objects.filter(invoice__in=invoices))
+        bill_total, bill_count, bill_missing = \
+            aggregate_line_items_amount(BillItem.objects.filter(bill__in=bills))
+        return invoice_total + bill_total, invoice_count + bill_count, invoice_missing + bill_missing
@@ -0,0 +1,24 @@
+"""
+Entry points of worker processes spawned for parallel invoice generation. The module is imported by a fresh
+interpreter before Django is set up, models and services are imported only after setup.
+"""
+
+
+def setup():
+    import django
+    django.setup()
+
+    # Service signal receivers (e.g. calculation rules generating invoices) are bound by the main application when
+    # its GraphQL schema is imported. Worker imports the schema the same way as the web process, so that every
+    # receiver is bound exactly once, including receivers bound in AppConfig.ready
+    from django.conf import settings
+    from django.utils.module_loading import import_string
+    import_string(settings.GRAPHENE['SCHEMA'])
+
+
+def generate_chunk(invoice_service_class, user_id, from_date, to_date, subject_partition=None):
+    from core.models import User
+    from invoice.services.invoiceGeneration import generate_chunk
+    user = User.objects.get(id=user_id)
+    # Chunks are generated concurrently with chunks of other workers
+    return generate_chunk(invoice_service_class, user, from_date, to_date, subject_partition, lock_lines=True)
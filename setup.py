@@ -23,8 +23,13 @@ setup(
         'django',
         'django-db-signals',
         'djangorestframework',
-        'openimis-be-core'
+        'openimis-be-core',
     ],
+    extras_require={
+        # Export formats other than csv
+        'xlsx': ['openpyxl'],
+        'columnar': ['pyarrow'],
+    },
     classifiers=[
         'Environment :: Web Environment',
         'Framework :: Django',